@@ -3,6 +3,8 @@ from collections import OrderedDict
 from .paths import nativepath, get_homedir
 from .closure import Closure
 from .debugtime import debugtime
+from .parallel import get_nworkers, make_pool, run_parallel
+from .lrucache import LRUCache
 from .strutils import (fixName, isValidName, isNumber, bytes2str,
                       isLiteralStr, strip_comments, find_delims)
 
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+bounded least-recently-used cache, with counters of cache hits and misses
+"""
+from collections import OrderedDict
+
+class LRUCache(object):
+    """bounded cache with counters of cache hits and misses.
+    The least recently used entry is discarded when more than
+    maxsize entries are stored.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.put('a', 1)
+    >>> cache.get('a'), cache.get('b')
+    (1, None)
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<%s: %d entries, %d hits, %d misses>' % (
+            self.__class__.__name__, len(self.data), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def keys(self):
+        """return list of keys, from least to most recently used"""
+        return list(self.data.keys())
+
+    def get(self, key, default=None):
+        """return cached value for key, or default"""
+        val = self.data.pop(key, None)
+        if val is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data[key] = val
+        return val
+
+    def put(self, key, val):
+        """store value for key"""
+        self.data.pop(key, None)
+        self.data[key] = val
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """remove and return value for key, or default"""
+        return self.data.pop(key, default)
+
+    def clear(self):
+        """remove all entries and reset counters"""
+        self.data.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """return dictionary of hits, misses, size and maxsize"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.data), 'maxsize': self.maxsize}
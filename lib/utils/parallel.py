@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Simple process and thread pools for running many independent tasks
+"""
+import sys
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+def get_nworkers(nworkers=None):
+    """
+    return number of workers to use for a pool:
+    the number of CPUs if nworkers is None or < 1.
+    """
+    if nworkers is None or nworkers < 1:
+        try:
+            nworkers = multiprocessing.cpu_count()
+        except NotImplementedError:
+            nworkers = 1
+    return int(nworkers)
+
+def make_pool(nworkers=None, processes=True, initializer=None,
+              initargs=(), fork=False):
+    """
+    create a pool of worker processes or threads, which should be
+    closed and joined by the caller when no longer needed.
+
+    Arguments
+    ---------
+    nworkers     number of workers [None: number of CPUs]
+    processes    whether to use a process pool (True) or a thread
+                 pool (False) [True]
+    initializer  function to call once in each worker
+    initargs     arguments for initializer
+    fork         whether worker processes must be forked [False]
+
+    Notes
+    -----
+    Forked worker processes inherit the state of the calling process,
+    so that initargs need not be picklable.  If fork=True and forking
+    is not available on this platform, a thread pool is returned.
+    """
+    nworkers = get_nworkers(nworkers)
+    if not processes:
+        return ThreadPool(nworkers, initializer, initargs)
+    context = multiprocessing
+    if fork and hasattr(multiprocessing, 'get_context'):
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            return ThreadPool(nworkers, initializer, initargs)
+    elif fork and sys.platform.startswith('win'):
+        return ThreadPool(nworkers, initializer, initargs)
+    return context.Pool(nworkers, initializer, initargs)
+
+def run_parallel(func, tasks, nworkers=None, processes=True,
+                 chunksize=None, initializer=None, initargs=()):
+    """
+    run func(task) for each task in a list of tasks using a pool
+    of worker processes or threads, returning a list of results
+    in the same order as tasks.
+
+    Arguments
+    ---------
+    func         function of one argument.  For processes, this
+                 and all tasks must be picklable.
+    tasks        list of arguments for func
+    nworkers     number of workers [None: number of CPUs]
+    processes    whether to use a process pool (True) or a thread
+                 pool (False) [True]
+    chunksize    number of tasks sent to a worker at a time
+                 [None: chosen by the pool]
+    initializer  function to call once in each worker
+    initargs     arguments for initializer
+
+    Notes
+    -----
+    With only one worker, or fewer than 2 tasks, the tasks are run
+    in the calling process, without creating a pool.
+    """
+    tasks = list(tasks)
+    nworkers = min(get_nworkers(nworkers), max(1, len(tasks)))
+    if nworkers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(task) for task in tasks]
+
+    pool = make_pool(nworkers, processes=processes,
+                     initializer=initializer, initargs=initargs)
+    try:
+        out = pool.map(func, tasks, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
+    return out
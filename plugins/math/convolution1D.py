@@ -7,8 +7,8 @@ Generic discrete convolution
 Description
 -----------
 
- This is a manual (not optimized!) implementation of discrete 1D
- convolution intended for spectroscopy analysis. The difference with
+ This is an implementation of discrete 1D convolution intended for
+ spectroscopy analysis. The difference with
  commonly used methods is the possibility to adapt the convolution
  kernel for each convolution point, e.g. change the FWHM of the
  Gaussian kernel as a function of the energy scale.
@@ -49,6 +49,8 @@ from optparse import OptionParser
 from datetime import date
 from string import Template
 import numpy as np
+from scipy import sparse
+from scipy.signal import fftconvolve
 
 from larch.utils import gaussian, lorentzian
 
@@ -62,7 +64,7 @@ def get_ene_index(ene, cen, hwhm):
         else:
             ene_imin = max(np.where(ene < (cen-hwhm))[0])
         if ((cen+hwhm) >= max(ene)):
-            ene_imax = (len(e)-1)
+            ene_imax = (len(ene)-1)
         else:
             ene_imax = min(np.where(ene > (cen+hwhm))[0])
         return ene_imin, ene_imax
@@ -92,15 +94,7 @@ def lin_gamma(ene, fwhm=1.0, linbroad=None):
             e2 = linbroad[2]
         except:
             raise ValueError('wrong format for linbroad')
-        for en, ee in enumerate(ene):
-            if ee < e1:
-                w[en] *= fwhm
-            elif ee <= e2:
-                wlin = (fwhm + (ee - e1) * (fwhm2 - fwhm) / (e2 - e1))
-                w[en] *= wlin
-            elif ee >= e2:
-                w[en] *= fwhm2
-        return w
+        return w*np.interp(ene, [e1, e2], [fwhm, fwhm2])
 
 def atan_gamma(ene, gamma_hole, gamma_max=15., e0=0, eslope=1.):
     r"""returns arctangent-like broadening, $\Gamma(E)$
@@ -114,13 +108,87 @@ def atan_gamma(ene, gamma_hole, gamma_max=15., e0=0, eslope=1.):
         eslope = 1.
     return gamma_hole + gamma_max * ( ( np.arctan( (ene - e0) / eslope ) / np.pi ) + 0.5 )
 
-def conv(e, mu, kernel='gaussian', fwhm_e=None, efermi=None):
+def _kernel_function(kernel):
+    """ returns lineshape function for a kernel name """
+    if ('gauss' in kernel.lower()):
+        return gaussian
+    elif ('lor' in kernel.lower()):
+        return lorentzian
+    raise ValueError("convolution kernel '{0}' not implemented".format(kernel))
+
+def _extend_energy(e, fwhm_e):
+    """ extend upper energy border to 3*fwhm_e[-1] """
+    estep = (e[-1] - e[-2])
+    return np.append(e, np.arange(e[-1]+estep, e[-1]+3*fwhm_e[-1], estep))
+
+def _extend_spectra(e, eup, f):
+    """ extend spectra (npts) or (nspectra, npts) to energies eup with a
+    linear fit to the upper half of each spectrum, to avoid border effects
+    """
+    lpf = len(e)//2
+    cpf = np.polyfit(e[-lpf:], f.T[-lpf:], 1)
+    fext = np.multiply.outer(cpf[0], eup[len(e):]) + cpf[1][..., np.newaxis]
+    return np.concatenate((f, fext), axis=-1)
+
+def _fwhm_array(e, fwhm_e):
+    """ returns fwhm_e as an array of the shape of e """
+    if fwhm_e is None:
+        raise ValueError("convolution needs 'fwhm_e'")
+    fwhm_e = np.asarray(fwhm_e, dtype='float64')
+    if fwhm_e.ndim == 0:
+        fwhm_e = fwhm_e*np.ones_like(e)
+    if e.shape != fwhm_e.shape:
+        raise ValueError("'fwhm_e' does not have the same shape of 'e'")
+    return fwhm_e
+
+def conv_matrix(e, fwhm_e, kernel='gaussian'):
+    """ sparse matrix for energy-dependent broadening
+
+    Parameters
+    ----------
+    e : x-axis (energy)
+    fwhm_e: the full width half maximum in eV for the kernel
+            broadening, an array of size 'e' or a constant
+    kernel : convolution kernel, 'gaussian' or 'lorentzian'
+
+    Returns
+    -------
+    scipy.sparse CSR matrix of shape (len(e), len(e)+nup), for nup
+    energy points that extend 'e' by 3*fwhm_e[-1].  Row n holds the
+    kernel centered at e[n], cut at the first energy point beyond
+    +/- 1.5*fwhm_e[n] on each side, and normalized.
+
+    Notes
+    -----
+    The matrix can be built once and passed to conv() with
+    'matrix' to broaden many spectra on the same energy grid.
+    """
+    e = np.asarray(e, dtype='float64')
+    fwhm_e = _fwhm_array(e, fwhm_e)
+    lineshape = _kernel_function(kernel)
+    eup = _extend_energy(e, fwhm_e)
+    npts = len(e)
+    # include the first point outside of +/- 1.5*fwhm on each side
+    imin = np.searchsorted(eup, e - 1.5*fwhm_e, side='left') - 1
+    imin = np.maximum(imin, 0)
+    imax = np.searchsorted(eup, e + 1.5*fwhm_e, side='right') + 1
+    imax = np.minimum(imax, len(eup))
+    nrow = imax - imin
+    rows = np.repeat(np.arange(npts), nrow)
+    cols = (np.arange(nrow.sum()) - np.repeat(np.cumsum(nrow) - nrow, nrow)
+            + imin[rows])
+    vals = lineshape(eup[cols], center=e[rows], sigma=fwhm_e[rows]/2.0)
+    vals = vals/np.bincount(rows, weights=vals, minlength=npts)[rows]
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(npts, len(eup)))
+
+def conv(e, mu, kernel='gaussian', fwhm_e=None, efermi=None, matrix=None):
     """ linear broadening
 
     Parameters
     ----------
     e : x-axis (energy)
-    mu : f(x) to convolve with g(x) kernel, mu(energy)
+    mu : f(x) to convolve with g(x) kernel, mu(energy), or 2-d
+         array (nspectra, len(e)) of spectra to convolve
     kernel : convolution kernel, g(x)
              'gaussian'
              'lorentzian'
@@ -128,52 +196,47 @@ def conv(e, mu, kernel='gaussian', fwhm_e=None, efermi=None):
             broadening. It is an array of size 'e' with constants or
             an energy-dependent values determined by a function as
             'lin_gamma()' or 'atan_gamma()'
+    efermi : energy below which mu is set to zero [None]
+    matrix : broadening matrix from conv_matrix() for e, fwhm_e and
+             kernel, which is then not rebuilt [None]
+
+    Notes
+    -----
+    For a constant 'fwhm_e' on an evenly spaced energy grid, the
+    convolution is done with FFTs, otherwise with the sparse matrix
+    of conv_matrix().
     """
-    f = np.copy(mu)
-    z = np.zeros_like(f)
+    e = np.asarray(e, dtype='float64')
+    f = np.array(mu, dtype='float64')
     if efermi is not None:
         #ief = index_nearest(e, efermi)
         ief = np.argmin(np.abs(e-efermi))
-        f[0:ief] *= 0
-    if e.shape != fwhm_e.shape:
-        print("Error: 'fwhm_e' does not have the same shape of 'e'")
-        return 0
-    # linar fit upper part of the spectrum to avoid border effects
-    # polyfit => pf
-    lpf = len(e)/2.
-    cpf = np.polyfit(e[-lpf:], f[-lpf:], 1)
-    fpf = np.poly1d(cpf)
-    # extend upper energy border to 3*fhwm_e[-1]
+        f[..., 0:ief] *= 0
+    if matrix is None:
+        fwhm_e = _fwhm_array(e, fwhm_e)
+        estep = (e[-1] - e[-2])
+        if (np.allclose(fwhm_e, fwhm_e[0], rtol=1.e-8, atol=0) and
+            np.allclose(np.diff(e), estep, rtol=1.e-6, atol=0)):
+            return _conv_fft(e, f, kernel, fwhm_e[0])
+        matrix = conv_matrix(e, fwhm_e, kernel=kernel)
+    nup = matrix.shape[1]
+    eup = np.append(e, e[-1] + (e[-1] - e[-2])*np.arange(1, nup-len(e)+1))
+    fup = _extend_spectra(e, eup, f)
+    return (matrix.dot(fup.T)).T
+
+def _conv_fft(e, f, kernel, fwhm):
+    """ constant-width broadening on an evenly spaced grid with FFTs,
+    equivalent to conv() with conv_matrix() """
+    lineshape = _kernel_function(kernel)
     estep = (e[-1] - e[-2])
-    eup = np.append(e, np.arange(e[-1]+estep, e[-1]+3*fwhm_e[-1], estep))
-    for n in range(len(f)):
-        #from now on I change e with eup
-        eimin, eimax = get_ene_index(eup, eup[n], 1.5*fwhm_e[n])
-        if ((eimin is None) or (eimax is None)):
-            if DEBUG:
-                raise IndexError('e[{0}]'.format(n))
-        if len(range(eimin, eimax)) % 2 == 0:
-            kx = eup[eimin:eimax+1] # odd range centered at the convolution point
-        else:
-            kx = eup[eimin:eimax]
-        ### kernel ###
-        hwhm = fwhm_e[n]/2.0
-        if ('gauss' in kernel.lower()):
-            ky = gaussian(kx, center=eup[n], sigma=hwhm)
-        elif ('lor' in kernel.lower()):
-            ky = lorentzian(kx, center=eup[n], sigma=hwhm)
-        else:
-            raise ValueError("convolution kernel '{0}' not implemented".format(kernel))
-        ky = ky/ky.sum() # normalize
-        zn = 0
-        lk = len(kx)
-        for mf, mg in zip( range(-(lk/2), (lk/2)+1), range(lk) ):
-            if ( ((n+mf) >= 0) and ((n+mf) < len(f)) ):
-                zn += f[n+mf] * ky[mg]
-            elif ((n+mf) >= 0):
-                zn += fpf(eup[n+mf]) * ky[mg]
-        z[n] = zn
-    return z
+    eup = _extend_energy(e, fwhm*np.ones(1))
+    fup = _extend_spectra(e, eup, f)
+    nk = int(np.floor(1.5*fwhm/estep + 1.e-8)) + 1
+    ky = lineshape(estep*np.arange(-nk, nk+1), center=0, sigma=fwhm/2.0)
+    ky.shape = (1,)*(fup.ndim-1) + ky.shape
+    norm = fftconvolve(np.ones(len(eup)), ky.ravel(), mode='same')
+    out = fftconvolve(fup, ky, mode='same')/norm
+    return out[..., :len(e)]
 
 def glinbroad(e, mu, fwhm_e=None, efermi=None, _larch=None):
     """ gaussian linear convolution in Larch """
@@ -335,4 +398,5 @@ ${gauss_sel}${gaussian} !Gaussian conv for experimental res\n\
             print("check 'fdmnes' executable exists!")
 
 def registerLarchPlugin():
-    return (MODNAME, {'glinbroad': glinbroad})
+    return (MODNAME, {'glinbroad': glinbroad,
+                      'conv_matrix': conv_matrix})
@@ -1,16 +1,20 @@
 from .xafsutils import KTOE, ETOK, set_xafsGroup
 
-from .xafsft import xftf, xftr, xftf_fast, xftr_fast, ftwindow
+from .xafsft import (xftf, xftr, xftf_fast, xftr_fast, ftwindow,
+                     xftf_batch, xftr_batch)
 
 from .pre_edge import pre_edge, preedge, find_e0
 
-from .feffdat import FeffPathGroup, FeffDatFile, _ff2chi
+from .feffdat import (FeffPathGroup, FeffDatFile, _ff2chi, clear_feffdat_cache,
+                      set_feffdat_cache)
 
 from .feffit import FeffitDataSet, TransformGroup, feffit
 
 from .autobk import autobk
-from .mback import mback
+from .mback import mback, mback_batch
 from .diffkk import diffkk
 from .fluo import fluo_corr
 
-from .feffrunner import FeffRunner
+from .feffrunner import FeffRunner, feff_batch
+
+from .xafsbatch import pre_edge_batch, autobk_batch
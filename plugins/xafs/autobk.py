@@ -1,18 +1,22 @@
 #!/usr/bin/env python
 import numpy as np
-from scipy.interpolate import splrep, splev, UnivariateSpline
+from scipy.interpolate import (splrep, splev, UnivariateSpline, BSpline,
+                               make_interp_spline)
+from scipy.optimize import leastsq
+from scipy.fftpack import fft
 from scipy.stats import t
 from scipy.special import erf
 
-from lmfit import Parameter, Parameters, minimize
+from lmfit import Parameters
+from lmfit.asteval import Interpreter as AstevalInterpreter
 
 from larch import (Group, Make_CallArgs, ValidateLarchPlugin,
                    parse_group_args, isgroup)
 
 # import other plugins from std, math, and xafs modules...
-from larch.utils import (index_of, index_nearest, realimag, remove_dups)
+from larch.utils import (index_of, index_nearest, remove_dups)
 
-from larch_plugins.xafs import (ETOK, set_xafsGroup, ftwindow, xftf_fast,
+from larch_plugins.xafs import (ETOK, set_xafsGroup, ftwindow,
                                 find_e0, pre_edge)
 
 
@@ -26,31 +30,82 @@ except ImportError:
 
 FMT_COEF = 'coef_%2.2i'
 
+# asteval interpreter shared by output Parameters, which have no
+# constraint expressions, to avoid creating one for each call
+_params_asteval = None
+
+def _make_params():
+    "return empty Parameters using the shared asteval interpreter"
+    global _params_asteval
+    if _params_asteval is None:
+        _params_asteval = AstevalInterpreter()
+    return Parameters(asteval=_params_asteval)
+
 def spline_eval(kraw, mu, knots, coefs, order, kout):
     """eval bkg(kraw) and chi(k) for knots, coefs, order"""
     bkg = splev(kraw, [knots, coefs, order])
     chi = UnivariateSpline(kraw, (mu-bkg), s=0)(kout)
     return bkg, chi
 
-def __resid(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
-            kraw=None, mu=None, kout=None, ftwin=1, kweight=1, chi_std=None,
-            nclamp=0, clamp_lo=1, clamp_hi=1, **kws):
+def spline_basis(kraw, mu, knots, ncoefs, order, kout):
+    """precompute linear operators for the background spline
 
-    # coefs = [getattr(pars, FMT_COEF % i) for i in range(ncoefs)]
-    coefs = [pars[FMT_COEF % i].value for i in range(ncoefs)]
-    bkg, chi = spline_eval(kraw, mu, knots, coefs, order, kout)
-    if chi_std is not None:
-        chi = chi - chi_std
-    out =  realimag(xftf_fast(chi*ftwin, nfft=nfft)[:irbkg])
+    Both the background spline and the interpolating spline used to
+    put chi onto the output k grid are linear in their coefficients
+    and data, so that for spline coefficients `coefs`:
+
+        bkg = basis.dot(coefs)
+        chi = chi0 - chi_basis.dot(coefs)
+
+    give the same results as spline_eval().
+
+    Returns:
+    --------
+      basis, chi0, chi_basis
+    """
+    basis = BSpline(knots, np.eye(ncoefs), order)(kraw)
+    interp = make_interp_spline(kraw, np.column_stack((mu, basis)), k=3)(kout)
+    return basis, interp[:, 0], interp[:, 1:]
+
+def _realimag(arr):
+    "like realimag(), interleaving real/imag along the first axis"
+    out = np.zeros((2*arr.shape[0],) + arr.shape[1:])
+    out[0::2] = arr.real
+    out[1::2] = arr.imag
+    return out
+
+def __resid(coefs, chi0=None, chi_basis=None, ft0=None, ft_basis=None,
+            kwt=None, nclamp=0, clamp_lo=1, clamp_hi=1):
+    # chi(k) and its FT are linear in the varied spline coefficients,
+    # with the operators precomputed in autobk(), and with real and
+    # imaginary parts of the FT interleaved
+    out = ft0 - ft_basis.dot(coefs)
     if nclamp == 0:
         return out
     # spline clamps:
+    chi = chi0 - chi_basis.dot(coefs)
     scale = (1.0 + 100*(out*out).sum())/(len(out)*nclamp)
-    scaled_chik = scale * chi * kout**kweight
+    scaled_chik = scale * chi * kwt
     return np.concatenate((out,
                            abs(clamp_lo)*scaled_chik[:nclamp],
                            abs(clamp_hi)*scaled_chik[-nclamp:]))
 
+def __jacobian(coefs, chi0=None, chi_basis=None, ft0=None, ft_basis=None,
+               kwt=None, nclamp=0, clamp_lo=1, clamp_hi=1):
+    # analytic Jacobian of __resid
+    if nclamp == 0:
+        return -ft_basis
+    out = ft0 - ft_basis.dot(coefs)
+    chi = chi0 - chi_basis.dot(coefs)
+    norm = len(out)*nclamp
+    scale = (1.0 + 100*(out*out).sum())/norm
+    dscale = -200*out.dot(ft_basis)/norm
+    jac_chik = (np.outer(chi*kwt, dscale) -
+                scale*chi_basis*kwt[:, np.newaxis])
+    return np.concatenate((-ft_basis,
+                           abs(clamp_lo)*jac_chik[:nclamp],
+                           abs(clamp_hi)*jac_chik[-nclamp:]))
+
 @ValidateLarchPlugin
 @Make_CallArgs(["energy" ,"mu"])
 def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
@@ -169,29 +224,41 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     # coefs will be varied in fit.
     knots, coefs, order = splrep(spl_k, spl_y)
 
-    # set fit parameters from initial coefficients
-    params = Parameters()
-    for i in range(len(coefs)):
-        params.add(name = FMT_COEF % i, value=coefs[i], vary=i<len(spl_y))
-
-    initbkg, initchi = spline_eval(kraw[:iemax-ie0+1], mu[ie0:iemax+1],
-                                   knots, coefs, order, kout)
-
-    # do fit
-    result = minimize(__resid, params, method='leastsq',
-                      gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
-                      kws = dict(ncoefs=len(coefs), chi_std=chi_std,
-                                 knots=knots, order=order,
-                                 kraw=kraw[:iemax-ie0+1],
-                                 mu=mu[ie0:iemax+1], irbkg=irbkg, kout=kout,
-                                 ftwin=ftwin, kweight=kweight,
-                                 nfft=nfft, nclamp=nclamp,
-                                 clamp_lo=clamp_lo, clamp_hi=clamp_hi))
+    # precompute the spline basis on kraw, the resampling onto kout,
+    # and the FT of each, so that the fit is linear algebra.
+    nraw = iemax - ie0 + 1
+    basis, chi0, chi_basis = spline_basis(kraw[:nraw], mu[ie0:iemax+1],
+                                          knots, len(coefs), order, kout)
+    fitchi0 = chi0
+    if chi_std is not None:
+        fitchi0 = chi0 - chi_std
+    # FT of chi0 and of all basis columns at once, scaled as xftf_fast()
+    ftarr = np.column_stack((fitchi0, chi_basis)) * ftwin[:, np.newaxis]
+    ftarr = (0.05/np.sqrt(np.pi)) * fft(ftarr, n=nfft, axis=0)[:irbkg]
+    ftarr = _realimag(ftarr)
+    ft0, ft_basis = ftarr[:, 0], ftarr[:, 1:]
+
+    initbkg = basis.dot(coefs)
+    initchi = chi0 - chi_basis.dot(coefs)
+
+    # do fit, varying the first nspl coefficients: the others are
+    # fixed, and folded into the constant parts of chi and its FT
+    fixed = coefs[nspl:]
+    fitargs = (fitchi0 - chi_basis[:, nspl:].dot(fixed), chi_basis[:, :nspl],
+               ft0 - ft_basis[:, nspl:].dot(fixed), ft_basis[:, :nspl],
+               kout**kweight, nclamp, clamp_lo, clamp_hi)
+    best, covar, info, errmsg, ier = leastsq(__resid, coefs[:nspl],
+                                             args=fitargs, Dfun=__jacobian,
+                                             full_output=True, gtol=1.e-5,
+                                             ftol=1.e-5, xtol=1.e-5,
+                                             epsfcn=1.e-5)
+    resid = info['fvec']
+    redchi = (resid*resid).sum() / max(1, len(resid) - nspl)
+    coefs = np.concatenate((best, fixed))
 
     # write final results
-    coefs = [result.params[FMT_COEF % i].value for i in range(len(coefs))]
-    bkg, chi = spline_eval(kraw[:iemax-ie0+1], mu[ie0:iemax+1],
-                           knots, coefs, order, kout)
+    bkg = basis.dot(coefs)
+    chi = chi0 - chi_basis.dot(coefs)
     obkg = np.copy(mu)
     obkg[ie0:ie0+len(bkg)] = bkg
 
@@ -204,7 +271,12 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     group.e0   = e0
 
     # now fill in 'autobk_details' group
-    details = Group(params=result.params)
+    params = _make_params()
+    for i in range(len(coefs)):
+        params.add(name=FMT_COEF % i, value=coefs[i], vary=i<nspl)
+        if i < nspl and covar is not None:
+            params[FMT_COEF % i].stderr = np.sqrt(covar[i, i]*redchi)
+    details = Group(params=params)
 
     details.init_bkg = np.copy(mu)
     details.init_bkg[ie0:ie0+len(bkg)] = initbkg
@@ -212,56 +284,27 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     details.knots_e  = spl_e
     details.knots_y  = np.array([coefs[i] for i in range(nspl)])
     details.init_knots_y = spl_y
-    details.nfev = result.nfev
+    details.nfev = info['nfev']
     details.kmin = kmin
     details.kmax = kmax
     group.autobk_details = details
 
-    # uncertainties in mu0 and chi: can be fairly slow.
-    if calc_uncertainties:
+    # uncertainties in mu0 and chi
+    if calc_uncertainties and covar is not None:
         nchi = len(chi)
         nmue = iemax-ie0 + 1
-        redchi = result.redchi
-        covar  = result.covar / redchi
-        jac_chi = np.zeros(nchi*nspl).reshape((nspl, nchi))
-        jac_bkg = np.zeros(nmue*nspl).reshape((nspl, nmue))
-
-        cvals, cerrs = [], []
-        for i in range(len(coefs)):
-             par = result.params[FMT_COEF % i]
-             cvals.append(getattr(par, 'value', 0.0))
-             cdel = getattr(par, 'stderr', 0.0)
-             if cdel is None:
-                 cdel = 0.0
-             cerrs.append(cdel/2.0)
-        cvals = np.array(cvals)
-        cerrs = np.array(cerrs)
-
-        # find derivatives by hand!
-        _k = kraw[:nmue]
-        _m = mu[ie0:iemax+1]
-        for i in range(nspl):
-            cval0 = cvals[i]
-            cvals[i] = cval0 + cerrs[i]
-            bkg1, chi1 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0 - cerrs[i]
-            bkg2, chi2 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0
-            jac_chi[i] = (chi1 - chi2) / (2*cerrs[i])
-            jac_bkg[i] = (bkg1 - bkg2) / (2*cerrs[i])
-
-        dfchi = np.zeros(nchi)
-        dfbkg = np.zeros(nmue)
-        for i in range(nspl):
-            for j in range(nspl):
-                dfchi += jac_chi[i]*jac_chi[j]*covar[i,j]
-                dfbkg += jac_bkg[i]*jac_bkg[j]*covar[i,j]
+
+        # chi and bkg are linear in the spline coefficients,
+        # so the Jacobians are simply the basis arrays
+        jac_chi = -chi_basis[:, :nspl].T
+        jac_bkg = basis[:, :nspl].T
+        dfchi = (covar.dot(jac_chi) * jac_chi).sum(axis=0)
+        dfbkg = (covar.dot(jac_bkg) * jac_bkg).sum(axis=0)
 
         prob = 0.5*(1.0 + erf(err_sigma/np.sqrt(2.0)))
-        dchi = t.ppf(prob, nchi-nspl) * np.sqrt(dfchi*redchi)
-        dbkg = t.ppf(prob, nmue-nspl) * np.sqrt(dfbkg*redchi)
+        tchi, tbkg = t.ppf(prob, [nchi-nspl, nmue-nspl])
+        dchi = tchi * np.sqrt(dfchi*redchi)
+        dbkg = tbkg * np.sqrt(dfbkg*redchi)
 
         group.delta_chi = dchi
         group.delta_bkg = 0.0*mu
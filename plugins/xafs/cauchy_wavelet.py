@@ -24,12 +24,63 @@
 
 import numpy as np
 from larch import ValidateLarchPlugin, parse_group_args
-from larch.utils import complex_phase
+from larch.utils import complex_phase, LRUCache
 from larch_plugins.xafs import set_xafsGroup
 
+FILTER_CACHE_SIZE = 8
+_filter_cache = LRUCache(FILTER_CACHE_SIZE)
+
+def cauchy_filters(kstep, nfft, r):
+    """return the bank of Cauchy wavelet filters, a 2-d array (len(r), nfft)
+    for the frequencies of an FFT of 2*nfft points with spacing kstep and
+    the uniform array r of R values, starting at 0.
+
+    The filter banks for the most recently used (kstep, nfft, r) are cached.
+    """
+    nrpts = len(r)
+    key = (float(kstep), int(nfft), nrpts, float(r[-1]))
+    filters = _filter_cache.get(key)
+    if filters is None:
+        omega = np.pi*np.arange(nfft)/(kstep*nfft)
+        r = 1.0*np.asarray(r)
+        r[0] = 1.e-19
+        aom = np.outer(nrpts/(2*r), omega)
+        aom[np.where(aom==0)] = 1.e-19
+        cauchy_sum = np.log(2*np.pi) - np.log(1.0+np.arange(nrpts)).sum()
+        filters = np.exp(cauchy_sum + nrpts*np.log(aom) - aom)
+        _filter_cache.put(key, filters)
+    return filters
+
+def cauchy_transform(chi, filters, nkout, chunksize=None):
+    """Cauchy wavelet transform of chi with a bank of filters from
+    cauchy_filters(), returning a complex 2-d array (nfilters, nkout)
+
+    Parameters:
+    -----------
+      chi:       1-d array of chi, on a uniform k grid from 0
+      filters:   2-d array (nfilters, nfft) of filters
+      nkout:     number of k points to output
+      chunksize: maximum number of filters to apply in one inverse FFT,
+                 to limit memory use [None: all at once]
+    """
+    nrpts, nfft = filters.shape
+    nft = int(nfft/2)
+    chix = np.zeros(nft)
+    npts = min(nft, len(chi))
+    chix[:npts] = chi[:npts]
+    tff = np.fft.fft(chix, n=2*nfft)[:nfft]
+
+    if chunksize is None or chunksize < 1:
+        chunksize = nrpts
+    out = np.zeros((nrpts, nkout), dtype='complex128')
+    for i in range(0, nrpts, chunksize):
+        rows = slice(i, min(nrpts, i+chunksize))
+        out[rows] = np.fft.ifft(filters[rows]*tff, 2*nfft, axis=1)[:, :nkout]
+    return out
+
 @ValidateLarchPlugin
 def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
-                   nfft=2048, _larch=None):
+                   nfft=2048, chunksize=None, _larch=None):
     """
     Cauchy Wavelet Transform for XAFS, following work of Munoz, Argoul, and Farges
 
@@ -41,6 +92,8 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
       rmax_out: highest R for output data (10 Ang)
       kweight:  exponent for weighting spectra by k**kweight
       nfft:     value to use for N_fft (2048).
+      chunksize: maximum number of R values to transform at once,
+                 to limit memory use [None: all at once]
 
       Returns:
     ---------
@@ -72,40 +125,12 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
     if kweight != 0:
         chi = chi * k**kweight
 
-    # extend EXAFS to 1024 data points...
-    NFT = int(nfft/2)
-    if len(k) < NFT:
-        knew = np.arange(NFT) * kstep
-        xnew = np.zeros(NFT) * kstep
-        xnew[:len(k)] = chi
-    else:
-        knew = k[:NFT]
-        xnew = chi[:NFT]
-
-    # FT parameters
-    freq = (1.0/kstep)*np.arange(nfft)/(2*nfft)
-    omega = 2*np.pi*freq
-
-    # simple FT calculation
-    tff = np.fft.fft(xnew, n= 2*nfft)
-
-    # scale parameter
+    # the transform for all R values at once, using
+    # the (cached) bank of filters for the R grid
     r  = np.linspace(0, rmax, nrpts)
+    filters = cauchy_filters(kstep, nfft, r)
+    out = cauchy_transform(chi, filters, nkout, chunksize=chunksize)
     r[0] = 1.e-19
-    a  = nrpts/(2*r)
-
-    # Characteristic values for Cauchy wavelet:
-    cauchy_sum = np.log(2*np.pi) - np.log(1.0+np.arange(nrpts)).sum()
-
-    # Main calculation:
-    out = np.zeros(nkout*nrpts,
-                   dtype='complex128').reshape(nrpts, nkout)
-    for i in range(nrpts):
-        aom = a[i]*omega
-        aom[np.where(aom==0)] = 1.e-19
-        filt = cauchy_sum + nrpts*np.log(aom) - aom
-        tmp  = np.conj(np.exp(filt))*tff[:nfft]
-        out[i, :] = np.fft.ifft(tmp, 2*nfft)[:nkout]
 
     group = set_xafsGroup(group, _larch=_larch)
     group.r  =  r
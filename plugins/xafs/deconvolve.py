@@ -3,7 +3,7 @@
 #
 
 import numpy as np
-from scipy.signal import deconvolve
+from scipy.signal import deconvolve, fftconvolve
 from larch import ValidateLarchPlugin, parse_group_args
 
 from larch.utils import (gaussian, lorentzian, interp,
@@ -148,7 +148,7 @@ def xas_convolve(energy, norm=None, group=None, form='lorentzian',
         kernel = gaussian
 
     k = kernel(x, center=0, sigma=esigma)
-    ret = np.convolve(y, k, mode='full')
+    ret = fftconvolve(y, k, mode='full')
 
     out = interp(x-eshift, ret[:len(x)], en, kind='cubic', _larch=_larch)
 
@@ -78,7 +78,7 @@ def kkmclf_sca(e, finp):
     fout = [0.0]*npts
     if npts >= 2:
         factor = FOPI * (e[npts-1] - e[0]) / (npts - 1)
-        nptsk = npts / 2
+        nptsk = int(npts / 2)
         for i in range(npts):
             fout[i] = 0.0
             ei2 = e[i]*e[i]
@@ -113,7 +113,7 @@ def kkmclr_sca(e, finp):
     fout = [0.0]*npts
 
     factor = -FOPI * (e[npts-1] - e[0]) / (npts - 1)
-    nptsk  = npts / 2
+    nptsk  = int(npts / 2)
     for i in range(npts):
         fout[i] = 0.0
         ei2 = e[i]*e[i]
@@ -154,7 +154,7 @@ def kkmclf(e, finp):
     ei2    = e**2
     ioff   = np.mod(np.arange(npts), 2) - 1
 
-    nptsk  = npts/2
+    nptsk  = int(npts/2)
     k      = np.arange(nptsk)
 
     for i in range(npts):
@@ -162,7 +162,7 @@ def kkmclf(e, finp):
         de2  = e[j]**2 - ei2[i]
         fout[i] = sum(finp[j]/de2)
 
-    fout = fout * factor
+    fout = fout * factor * e
     return fout
 
 
@@ -188,7 +188,7 @@ def kkmclr(e, finp):
     ei2    = e**2
     ioff   = np.mod(np.arange(npts), 2) - 1
 
-    nptsk  = npts/2
+    nptsk  = int(npts/2)
     k      = np.arange(nptsk)
 
     for i in range(npts):
@@ -200,6 +200,77 @@ def kkmclr(e, finp):
     return fout
 
 
+###
+###  These are FFT forms of the MacLaurin series algorithm.  The sums above
+###  are split into sums over 1/(e_j - e_i) and 1/(e_j + e_i), which on an
+###  even energy grid depend only on j-i and j+i, and so can be done as
+###  convolutions with FFTs, in O(N log N) instead of O(N^2).  They give the
+###  same results as the vector forms to rounding error, and also accept
+###  2-d arrays (nspectra, npts) of spectra on the same energy grid.
+###
+
+def _kk_sums(e, finp):
+    """
+    return the sums over j, with j-i odd, of finp[j]/(e[j]-e[i]) and of
+    finp[j]/(e[j]+e[i]), for each i, calculated with FFT convolutions.
+
+    arguments:
+      e      energy array *must be on an even grid with an even number of points* [npts]
+      finp   array [npts] or 2-d array [nspectra, npts]
+    """
+    npts = len(e)
+    finp = np.asarray(finp, dtype='float64')
+    if finp.shape[-1] != npts:
+        raise ValueError("Input arrays not of same length for diff KK transform")
+    if npts < 2 or npts % 2:
+        raise ValueError("diff KK transform needs an even number of points")
+
+    de = (e[-1] - e[0]) / (npts-1)
+    # kernels for j-i = -(npts-1) ... (npts-1), and j+i = 0 ... 2*(npts-1)
+    ndiff = np.arange(1-npts, npts)
+    nsum  = np.arange(2*npts-1)
+    kdiff = np.zeros(2*npts-1)
+    ksum  = np.zeros(2*npts-1)
+    odd   = np.where(ndiff % 2 != 0)
+    kdiff[odd] = -1.0/(ndiff[odd]*de)
+    odd   = np.where(nsum % 2 != 0)
+    ksum[odd] = 1.0/(2*e[0] + nsum[odd]*de)
+
+    nfft = 2**int(np.ceil(np.log2(3*npts)))
+    out = slice(npts-1, 2*npts-1)
+    sdiff = np.fft.irfft(np.fft.rfft(finp, nfft, axis=-1) *
+                         np.fft.rfft(kdiff, nfft), nfft, axis=-1)[..., out]
+    ssum  = np.fft.irfft(np.fft.rfft(finp[..., ::-1], nfft, axis=-1) *
+                         np.fft.rfft(ksum, nfft), nfft, axis=-1)[..., out]
+    return sdiff, ssum
+
+def kkmclf_fft(e, finp):
+    """
+    forward (f'->f'') kk transform, using maclaurin series algorithm with FFTs
+
+    arguments:
+      e      energy array *must be on an even grid with an even number of points* [npts] (in)
+      finp   f' array [npts] or 2-d array [nspectra, npts] (in)
+      fout   f'' array, same shape as finp (out)
+    """
+    sdiff, ssum = _kk_sums(e, finp)
+    factor = FOPI * (e[-1] - e[0]) / (len(e)-1)
+    return factor * (sdiff - ssum) / 2.0
+
+def kkmclr_fft(e, finp):
+    """
+    reverse (f''->f') kk transform, using maclaurin series algorithm with FFTs
+
+    arguments:
+      e      energy array *must be on an even grid with an even number of points* [npts] (in)
+      finp   f'' array [npts] or 2-d array [nspectra, npts] (in)
+      fout   f' array, same shape as finp (out)
+    """
+    sdiff, ssum = _kk_sums(e, finp)
+    factor = -FOPI * (e[-1] - e[0]) / (len(e)-1)
+    return factor * (sdiff + ssum) / 2.0
+
+
 class diffKKGroup(Group):
     """
     A Larch Group for generating f'(E) and f"(E) from a XAS measurement of mu(E).
@@ -225,7 +296,7 @@ class diffKKGroup(Group):
 
 
 # e0=None, z=None, edge=None, order=3, form='mback', whiteline=False, how=None
-    def kk(self, energy=None, mu=None, z=None, edge='K', how='scalar', mback_kws=None):
+    def kk(self, energy=None, mu=None, z=None, edge='K', how='fft', mback_kws=None):
         """
         Convert mu(E) data into f'(E) and f"(E).  f"(E) is made by
         matching mu(E) to the tabulated values of the imaginary part
@@ -235,14 +306,20 @@ class diffKKGroup(Group):
 
           Attributes
             energy:     energy array
-            mu:         array with mu(E) data
+            mu:         array with mu(E) data, or 2-d array (nspectra, npts)
+                        of several spectra on the same energy grid
             z:          Z number of absorber
             edge:       absorption edge, usually 'K' or 'L3'
+            how:        KK transform to use: 'fft', 'vector', or 'scalar' ['fft']
             mback_kws:  arguments for the mback algorithm
 
           Returns
             self.f1, self.f2:  CL values over on the input energy grid
-            self.fp, self.fpp: matched and KK transformed data on the input energy grid
+            self.fp, self.fpp: matched and KK transformed data on the input energy grid,
+                               2-d arrays (nspectra, npts) if mu is 2-d
+
+          The 'fft' transform is O(N log N) and transforms all spectra at once.
+          The 'vector' and 'scalar' transforms are the direct O(N^2) sums.
 
         References:
           * Cromer-Liberman: http://dx.doi.org/10.1063/1.1674266
@@ -272,21 +349,34 @@ class diffKKGroup(Group):
 
         start = time.clock()
 
-        mback(self.energy, self.mu, group=self, _larch=self._larch, **mb_kws)
+        mus = np.asarray(self.mu)
+        if mus.ndim == 1:
+            mback(self.energy, self.mu, group=self, _larch=self._larch, **mb_kws)
+            fpps = [self.fpp]
+        else:
+            fpps = []
+            for mu in mus:
+                mback(self.energy, mu, group=self, _larch=self._larch, **mb_kws)
+                fpps.append(self.fpp)
+            self.fpp = np.array(fpps)
 
         ## interpolate matched data onto an even grid with an even number of elements (about 1 eV)
         npts = int(self.energy[-1] - self.energy[0]) + (int(self.energy[-1] - self.energy[0])%2)
         self.grid = np.linspace(self.energy[0], self.energy[-1], npts)
-        fpp = interp(self.energy, self.f2-self.fpp, self.grid, fill_value=0.0)
+        fpp = np.array([interp(self.energy, self.f2-f, self.grid, fill_value=0.0)
+                        for f in fpps])
 
         ## do difference KK
-        if repr(how).startswith('sca'):
-            fp = kkmclr_sca(self.grid, fpp)
+        if how.startswith('sca'):
+            fp = np.array([kkmclr_sca(self.grid, f) for f in fpp])
+        elif how.startswith('vec'):
+            fp = np.array([kkmclr(self.grid, f) for f in fpp])
         else:
-            fp = kkmclr(self.grid, fpp)
+            fp = kkmclr_fft(self.grid, fpp)
 
         ## interpolate back to original grid and add diffKK result to f1 to make fp array
-        self.fp = self.f1 + interp(self.grid, fp, self.energy, fill_value=0.0)
+        fp = [self.f1 + interp(self.grid, f, self.energy, fill_value=0.0) for f in fp]
+        self.fp = fp[0] if mus.ndim == 1 else np.array(fp)
 
         ## clean up group
         #for att in ('normalization_function', 'weight', 'grid'):
@@ -12,21 +12,235 @@ the path represented by the feffNNNN.dat
 
 creates a group that contains the chi(k) for the sum of paths.
 """
+import os
+import copy
+import json
+import hashlib
+import logging
+import tempfile
 import six
 import numpy as np
-from scipy.interpolate import UnivariateSpline
+from scipy.interpolate import UnivariateSpline, splrep, PPoly
 from lmfit import Parameters
 from larch import (Group, Parameter, isParameter,
                    ValidateLarchPlugin,
                    param_value, isNamedClass)
 
+from larch.utils import LRUCache
 from larch.utils.strutils import fix_varname, b32hash
+from larch.site_config import usr_larchdir
 from larch_plugins.xafs import ETOK, set_xafsGroup
 from larch_plugins.xray import atomic_mass, atomic_symbol
 from larch.fitting import group2params
 
 SMALL = 1.e-6
+FEFF_TABLES = ('pha', 'amp', 'rep', 'lam')
+TABLE_CACHE_SIZE = 8
+
+logger = logging.getLogger(__name__)
+
+# parsed Feff.dat files are cached in memory and in this directory,
+# holding at most FEFFDAT_DISK_CACHE_SIZE files
+FEFFDAT_CACHE_DIR = os.path.join(usr_larchdir, 'feffdat_cache')
+FEFFDAT_CACHE_SIZE = 2048
+FEFFDAT_DISK_CACHE_SIZE = 4096
+FEFFDAT_CACHE_VERSION = '1'
+FEFFDAT_HEADER = ('title', 'version', 'potentials', 'gam_ch', 'exch',
+                  'mu', 'kf', 'vint', 'rs_int', 'degen', 'rnorman',
+                  'edge', 'geom')
+
+def table_cache_key(k, e0, interp='cubic'):
+    """key for FeffTableCache: interpolated Feff tables depend
+    only on the k grid, e0, and interpolation mode"""
+    k = np.asarray(k, dtype='float64')
+    return (len(k), hash(k.tobytes()), float(e0), interp.startswith('lin'))
+
+class FeffTableCache(LRUCache):
+    """bounded cache of Feff.dat tables (pha, amp, rep, lam)
+    interpolated onto an e0-shifted k grid, with counters of
+    cache hits and misses."""
+    def __init__(self, maxsize=TABLE_CACHE_SIZE):
+        LRUCache.__init__(self, maxsize=maxsize)
+
+
+class FeffDatCache(LRUCache):
+    """cache of parsed Feff.dat files.
+
+    Parsed data is held in memory, keyed by file path, size, and
+    modification time, and written to a binary .npz file in a cache
+    directory, named by a hash of the file contents.  A Feff.dat file
+    is parsed only if neither has an entry for it, so that re-reading
+    the paths from a Feff calculation avoids parsing text and looking
+    up atomic symbols and masses.
+
+    The cache directory holds at most diskmaxsize files, with the least
+    recently used files removed first.  Writing to the cache directory
+    is skipped if disk is False, and failures to write are logged.
+
+    hits and misses count lookups of the in-memory cache, and
+    disk_hits counts misses that were read from the cache directory.
+    """
+    def __init__(self, cachedir=FEFFDAT_CACHE_DIR,
+                 maxsize=FEFFDAT_CACHE_SIZE,
+                 diskmaxsize=FEFFDAT_DISK_CACHE_SIZE):
+        LRUCache.__init__(self, maxsize=maxsize)
+        self.cachedir = cachedir
+        self.diskmaxsize = diskmaxsize
+        self.enabled = True
+        self.disk = True
+        self.disk_hits = 0
+
+    def __repr__(self):
+        return '<FeffDatCache: %s, %d entries, %d hits, %d misses>' % (
+            self.cachedir, len(self.data), self.hits, self.misses)
+
+    def _filekey(self, filename):
+        stat = os.stat(filename)
+        return (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+
+    def _cachefile(self, filename):
+        with open(filename, 'rb') as fh:
+            _hash = hashlib.sha1(fh.read())
+        _hash.update(six.b(FEFFDAT_CACHE_VERSION))
+        return os.path.join(self.cachedir, '%s.npz' % _hash.hexdigest())
+
+    def get(self, filename):
+        """return (header, data) for a Feff.dat file, or None"""
+        if not self.enabled:
+            return None
+        try:
+            key = self._filekey(filename)
+        except OSError:
+            return None
+        val = LRUCache.get(self, key)
+        if val is None:
+            if not self.disk:
+                return None
+            try:
+                cfile = self._cachefile(filename)
+                with np.load(cfile) as npz:
+                    header = json.loads(str(npz['header']))
+                    val = (header, npz['data'])
+                os.utime(cfile, None)
+            except Exception:
+                return None
+            header['geom'] = [tuple(g) for g in header['geom']]
+            header['potentials'] = [tuple(p) for p in header['potentials']]
+            self.disk_hits += 1
+            LRUCache.put(self, key, val)
+        # copies, so that changes to one path do not change others
+        return (copy.deepcopy(val[0]), val[1].copy())
+
+    def put(self, filename, val, write=True):
+        """store (header, data) for a Feff.dat file, and
+        write it to the cache directory if write is True"""
+        if not self.enabled:
+            return
+        try:
+            key = self._filekey(filename)
+        except OSError:
+            return
+        val = (copy.deepcopy(val[0]), val[1].copy())
+        LRUCache.put(self, key, val)
+        if not (write and self.disk):
+            return
+        try:
+            if not os.path.exists(self.cachedir):
+                os.makedirs(self.cachedir)
+            cfile = self._cachefile(filename)
+            fd, tmpfile = tempfile.mkstemp(suffix='.npz', dir=self.cachedir)
+            with os.fdopen(fd, 'wb') as fh:
+                np.savez(fh, header=np.array(json.dumps(val[0])),
+                         data=val[1])
+            if os.path.exists(cfile):
+                os.remove(cfile)
+            os.rename(tmpfile, cfile)
+        except Exception as exc:
+            logger.warning('could not write Feff.dat cache file for %s: %s',
+                           filename, exc)
+            return
+        self.prune()
+
+    def prune(self):
+        """remove the least recently used files from the cache
+        directory, keeping at most diskmaxsize files"""
+        try:
+            files = [os.path.join(self.cachedir, f)
+                     for f in os.listdir(self.cachedir) if f.endswith('.npz')]
+            if len(files) <= self.diskmaxsize:
+                return
+            files.sort(key=os.path.getmtime)
+            for fname in files[:len(files)-self.diskmaxsize]:
+                os.remove(fname)
+        except OSError as exc:
+            logger.warning('could not prune Feff.dat cache directory %s: %s',
+                           self.cachedir, exc)
+
+    def invalidate(self, filename):
+        """remove cached data for one Feff.dat file"""
+        filename = os.path.abspath(filename)
+        for key in self.keys():
+            if key[0] == filename:
+                self.pop(key)
+        try:
+            os.remove(self._cachefile(filename))
+        except (IOError, OSError):
+            pass
+
+    def clear(self, disk=True):
+        """remove all cached data, including the cache directory
+        files if disk is True, and reset counters"""
+        LRUCache.clear(self)
+        self.disk_hits = 0
+        if disk and os.path.isdir(self.cachedir):
+            for fname in os.listdir(self.cachedir):
+                if fname.endswith('.npz'):
+                    try:
+                        os.remove(os.path.join(self.cachedir, fname))
+                    except OSError:
+                        pass
+
+feffdat_cache = FeffDatCache()
+
+def clear_feffdat_cache(filename=None, disk=True, _larch=None):
+    """clear cache of parsed Feff.dat files
+
+    Parameters:
+    -----------
+      filename:  name of Feff.dat file to remove from cache [None: all files]
+      disk:      whether to also remove files from the cache directory [True]
+    """
+    if filename is not None:
+        feffdat_cache.invalidate(filename)
+    else:
+        feffdat_cache.clear(disk=disk)
+
+def set_feffdat_cache(cachedir=None, disk=None, diskmaxsize=None,
+                      enabled=None, _larch=None):
+    """set options for the cache of parsed Feff.dat files
 
+    Parameters:
+    -----------
+      cachedir:     directory for cache files [None: unchanged]
+      disk:         whether to use the cache directory [None: unchanged]
+      diskmaxsize:  maximum number of files in the cache directory
+                    [None: unchanged]
+      enabled:      whether to use the cache at all [None: unchanged]
+
+    Returns:
+    --------
+      the cache directory in use before this call
+    """
+    out = feffdat_cache.cachedir
+    if cachedir is not None:
+        feffdat_cache.cachedir = cachedir
+    if disk is not None:
+        feffdat_cache.disk = bool(disk)
+    if diskmaxsize is not None:
+        feffdat_cache.diskmaxsize = int(diskmaxsize)
+    if enabled is not None:
+        feffdat_cache.enabled = bool(enabled)
+    return out
 
 class FeffDatFile(Group):
     def __init__(self, filename=None, _larch=None, **kws):
@@ -74,12 +288,41 @@ class FeffDatFile(Group):
     def rmass(self, val):     pass
 
     def __read(self, filename):
-        try:
-            lines = open(filename, 'r').readlines()
-        except:
-            print( 'Error reading file %s ' % filename)
-            return
+        cached = feffdat_cache.get(filename)
+        if cached is None:
+            try:
+                lines = open(filename, 'r').readlines()
+            except:
+                print( 'Error reading file %s ' % filename)
+                return
+            self.__parse(lines)
+            header = {}
+            for attr in FEFFDAT_HEADER:
+                if hasattr(self, attr):
+                    header[attr] = getattr(self, attr)
+            header['nleg'], header['reff'] = self.__nleg__, self.__reff__
+            feffdat_cache.put(filename, (header, self.__data))
+        else:
+            header, self.__data = cached
+            for attr in FEFFDAT_HEADER:
+                if attr in header:
+                    setattr(self, attr, header[attr])
+            self.__nleg__, self.__reff__ = header['nleg'], header['reff']
+
         self.filename = filename
+        data = self.__data
+        self.k        = data[0]
+        self.real_phc = data[1]
+        self.mag_feff = data[2]
+        self.pha_feff = data[3]
+        self.red_fact = data[4]
+        self.lam = data[5]
+        self.rep = data[6]
+        self.pha = data[1] + data[3]
+        self.amp = data[2] * data[4]
+        self.__rmass = None  # reduced mass of path
+
+    def __parse(self, lines):
         mode = 'header'
         self.potentials, self.geom = [], []
         data = []
@@ -144,17 +387,7 @@ class FeffDatFile(Group):
                 d = np.array([float(x) for x in line.split()])
                 if len(d) == 7:
                     data.append(d)
-        data = np.array(data).transpose()
-        self.k        = data[0]
-        self.real_phc = data[1]
-        self.mag_feff = data[2]
-        self.pha_feff = data[3]
-        self.red_fact = data[4]
-        self.lam = data[5]
-        self.rep = data[6]
-        self.pha = data[1] + data[3]
-        self.amp = data[2] * data[4]
-        self.__rmass = None  # reduced mass of path
+        self.__data = np.array(data).transpose()
 
 
 PATH_PARS = ('degen', 's02', 'e0', 'ei', 'deltar', 'sigma2', 'third', 'fourth')
@@ -174,6 +407,7 @@ class FeffPathGroup(Group):
         self.params = None
         self.label = label
         self.spline_coefs = None
+        self.table_cache = FeffTableCache()
         def_degen = 1
 
         self._feffdat = None
@@ -275,6 +509,7 @@ class FeffPathGroup(Group):
         self.spline_coefs['amp'] = UnivariateSpline(fdat.k, fdat.amp, s=0)
         self.spline_coefs['rep'] = UnivariateSpline(fdat.k, fdat.rep, s=0)
         self.spline_coefs['lam'] = UnivariateSpline(fdat.k, fdat.lam, s=0)
+        self.table_cache.clear()
 
     def store_feffdat(self):
         """stores data about this Feff path in the fiteval
@@ -393,17 +628,19 @@ class FeffPathGroup(Group):
         # q is the e0-shifted wavenumber
         q = np.sign(en)*np.sqrt(abs(en))
 
-        # lookup Feff.dat values (pha, amp, rep, lam)
-        if interp.startswith('lin'):
-            pha = np.interp(q, fdat.k, fdat.pha)
-            amp = np.interp(q, fdat.k, fdat.amp)
-            rep = np.interp(q, fdat.k, fdat.rep)
-            lam = np.interp(q, fdat.k, fdat.lam)
-        else:
-            pha = self.spline_coefs['pha'](q)
-            amp = self.spline_coefs['amp'](q)
-            rep = self.spline_coefs['rep'](q)
-            lam = self.spline_coefs['lam'](q)
+        # lookup Feff.dat values (pha, amp, rep, lam), which
+        # depend only on k, e0 and interp, so may be cached
+        cache_key = table_cache_key(k, e0, interp)
+        tables = self.table_cache.get(cache_key)
+        if tables is None:
+            if interp.startswith('lin'):
+                tables = [np.interp(q, fdat.k, getattr(fdat, name))
+                          for name in FEFF_TABLES]
+            else:
+                tables = [self.spline_coefs[name](q) for name in FEFF_TABLES]
+            tables = np.array(tables)
+            self.table_cache.put(cache_key, tables)
+        pha, amp, rep, lam = tables
 
         if debug:
             self.debug_k   = q
@@ -429,6 +666,182 @@ class FeffPathGroup(Group):
         self.chi = cchi.imag
         self.chi_imag = -cchi.real
 
+def spline_ppoly(x, y):
+    """breakpoints and cubic polynomial coefficients (highest power
+    first) for the interpolating spline through x, y.  This is the
+    same spline as UnivariateSpline(x, y, s=0)"""
+    ppoly = PPoly.from_spline(splrep(x, y, s=0))
+    return ppoly.x[3:-3], ppoly.c[:, 3:-3]
+
+class FeffPathStack(object):
+    """Feff.dat tables for a list of FeffPathGroups, packed onto a
+    common k grid as 2-d arrays, so that chi(k) for all paths can be
+    calculated with one set of array operations.
+
+    Values of pha, amp, rep, and lam on kgrid are held in `tables`, with
+    shape (4 tables, npaths, len(kgrid)), and their cubic spline
+    coefficients in `coefs`, with shape (4 tables, 4 powers, npaths,
+    nintervals) for the intervals starting at `kbreak`.
+    """
+    def __init__(self, pathlist):
+        self.pathlist = list(pathlist)
+        self.npaths = len(self.pathlist)
+        fdats = [path._feffdat for path in self.pathlist]
+        kgrid = fdats[0].k
+        for fdat in fdats[1:]:
+            if len(fdat.k) != len(kgrid) or not np.allclose(fdat.k, kgrid):
+                kgrid = np.unique(np.concatenate([f.k for f in fdats]))
+                break
+        self.kgrid = kgrid
+        self.reff = np.array([fdat.reff for fdat in fdats])
+
+        self.tables = np.zeros((4, self.npaths, len(kgrid)))
+        for ipath, fdat in enumerate(fdats):
+            for itab, name in enumerate(FEFF_TABLES):
+                x, y = fdat.k, getattr(fdat, name)
+                if len(x) != len(kgrid) or not np.allclose(x, kgrid):
+                    y = UnivariateSpline(x, y, s=0)(kgrid)
+                self.tables[itab, ipath, :] = y
+
+        # the spline breakpoints depend only on kgrid
+        self.kbreak = spline_ppoly(kgrid, self.tables[0, 0])[0]
+        self.coefs = np.zeros((4, 4, self.npaths, len(self.kbreak)-1))
+        for ipath in range(self.npaths):
+            for itab in range(4):
+                coefs = spline_ppoly(kgrid, self.tables[itab, ipath])[1]
+                self.coefs[itab, :, ipath, :] = coefs
+        self._ipath = np.arange(self.npaths)[:, np.newaxis]
+
+    def interp_tables(self, q, interp='cubic', rows=None, derivs=False):
+        """return pha, amp, rep, lam for all paths at the 2-d
+        array q (npaths, nk) of e0-shifted wavenumbers, or for the
+        paths with indices in rows, if given.  With derivs=True, the
+        derivatives of the tables with respect to q are also returned."""
+        ipath = self._ipath
+        if rows is not None:
+            ipath = ipath[rows]
+        if interp.startswith('lin'):
+            kgrid = self.kgrid
+            qclip = np.clip(q, kgrid[0], kgrid[-1])
+            idx = np.searchsorted(kgrid, qclip, side='right') - 1
+            idx = np.clip(idx, 0, len(kgrid)-2)
+            y0 = self.tables[:, ipath, idx]
+            y1 = self.tables[:, ipath, idx+1]
+            slope = (y1-y0)/(kgrid[idx+1]-kgrid[idx])
+            out = y0 + slope*(qclip-kgrid[idx])
+            if derivs:
+                return out, slope*(qclip == q)
+            return out
+        kbreak = self.kbreak
+        idx = np.searchsorted(kbreak, q, side='right') - 1
+        idx = np.clip(idx, 0, len(kbreak)-2)
+        dq = q - kbreak[idx]
+        c = self.coefs[:, :, ipath, idx]
+        out = ((c[:, 0]*dq + c[:, 1])*dq + c[:, 2])*dq + c[:, 3]
+        if derivs:
+            return out, (3*c[:, 0]*dq + 2*c[:, 1])*dq + c[:, 2]
+        return out
+
+    def path_params(self):
+        """return 2-d array (8, npaths) of current path parameter
+        values, in the order of PATH_PARS"""
+        out = np.zeros((len(PATH_PARS), self.npaths))
+        for ipath, path in enumerate(self.pathlist):
+            vals = path.path_paramvals()
+            out[:, ipath] = [vals[pname] for pname in PATH_PARS]
+        return out
+
+    def calc_chi(self, k, interp='cubic', derivs=False, pathpars=None):
+        """calculate complex chi(k) for all paths, with the current
+        path parameter values, or with the 2-d array (8, npaths) of
+        pathpars, as from path_params(), if given.
+
+        Returns:
+        ---------
+          cchi, p: 2-d complex arrays (npaths, len(k)) with
+                   chi = cchi.imag, and the complex wavenumber p.
+
+          With derivs=True, a third 3-d complex array (8, npaths, len(k))
+          of the derivatives of cchi with respect to the path parameters,
+          in the order of PATH_PARS, is also returned.
+        """
+        pars = pathpars
+        if pars is None:
+            pars = self.path_params()
+        (degen, s02, e0, ei, deltar,
+         sigma2, third, fourth) = pars[:, :, np.newaxis]
+        reff = self.reff[:, np.newaxis]
+
+        # create e0-shifted energy and k, careful to look for |e0| ~= 0.
+        en = k*k - e0*ETOK
+        small = ((abs(en) < 2*SMALL) &
+                 (abs(en).min(axis=1) < SMALL)[:, np.newaxis])
+        en[np.where(small)] = SMALL
+        # q is the e0-shifted wavenumber
+        q = np.sign(en)*np.sqrt(abs(en))
+
+        # interpolated tables are cached for each path, and
+        # only need to be calculated for paths with a new e0
+        tables = np.zeros((4, self.npaths, len(k)))
+        missing = []
+        for ipath, path in enumerate(self.pathlist):
+            key = table_cache_key(k, e0[ipath, 0], interp)
+            val = path.table_cache.get(key)
+            if val is None:
+                missing.append((ipath, key))
+            else:
+                tables[:, ipath, :] = val
+        if len(missing) > 0:
+            rows = [ipath for ipath, key in missing]
+            tables[:, rows, :] = self.interp_tables(q[rows], interp=interp,
+                                                    rows=rows)
+            for ipath, key in missing:
+                self.pathlist[ipath].table_cache.put(key,
+                                                     tables[:, ipath, :].copy())
+        pha, amp, rep, lam = tables
+
+        # p = complex wavenumber, and its square:
+        pp   = (rep + 1j/lam)**2 + 1j * ei * ETOK
+        p    = np.sqrt(pp)
+
+        # the xafs equation:
+        rpath = reff + deltar
+        pfact = deltar - 2*sigma2/reff - 2*pp*third/3
+        expo = np.exp(-2*reff*p.imag - 2*pp*(sigma2 - pp*fourth/3) +
+                      1j*(2*q*reff + pha + 2*p*pfact))
+
+        cchi = degen * s02 * amp * expo / (q*rpath**2)
+        cchi[:, 0] = 2*cchi[:, 1] - cchi[:, 2]
+        if not derivs:
+            return cchi, p
+
+        def dexpo(dpp, dq=0, dpha=0):
+            "derivative of exponent for changes in pp, q, and pha"
+            dp = dpp/(2*p)
+            return (-2*reff*dp.imag - 2*dpp*(sigma2 - 2*pp*fourth/3) +
+                    1j*(2*dq*reff + dpha + 2*dp*pfact - 4*p*dpp*third/3))
+
+        # e0 changes q, and so the interpolated tables
+        dpha, damp, drep, dlam = self.interp_tables(q, interp=interp,
+                                                    derivs=True)[1]
+        dpp_dq = 2*(rep + 1j/lam)*(drep - 1j*dlam/lam**2)
+        dq_de0 = -ETOK/(2*abs(q))
+        dq_de0[np.where(small)] = 0.0
+
+        base = expo / (q*rpath**2)
+        dcchi = np.zeros((len(PATH_PARS),) + cchi.shape, dtype='complex128')
+        dcchi[0] = s02 * amp * base
+        dcchi[1] = degen * amp * base
+        dcchi[2] = degen * s02 * base * dq_de0 * (
+            damp + amp*(dexpo(dpp_dq, dq=1, dpha=dpha) - 1/q))
+        dcchi[3] = cchi * dexpo(1j*ETOK)
+        dcchi[4] = cchi * (2j*p - 2/rpath)
+        dcchi[5] = cchi * (-2*pp - 4j*p/reff)
+        dcchi[6] = cchi * (-4j*p*pp/3)
+        dcchi[7] = cchi * (2*pp*pp/3)
+        dcchi[:, :, 0] = 2*dcchi[:, :, 1] - dcchi[:, :, 2]
+        return cchi, p, dcchi
+
 @ValidateLarchPlugin
 def _path2chi(path, paramgroup=None, _larch=None, **kws):
     """calculate chi(k) for a Feff Path,
@@ -457,7 +870,7 @@ def _path2chi(path, paramgroup=None, _larch=None, **kws):
 
 @ValidateLarchPlugin
 def _ff2chi(pathlist, group=None, paramgroup=None, _larch=None,
-            k=None, kmax=None, kstep=0.05, **kws):
+            k=None, kmax=None, kstep=0.05, pathstack=None, **kws):
     """sum chi(k) for a list of FeffPath Groups.
 
     Parameters:
@@ -467,12 +880,14 @@ def _ff2chi(pathlist, group=None, paramgroup=None, _larch=None,
       kmax:        maximum k value for chi calculation [20].
       kstep:       step in k value for chi calculation [0.05].
       k:           explicit array of k values to calculate chi.
+      pathstack:   FeffPathStack for pathlist, to avoid rebuilding it [None]
     Returns:
     ---------
        group contain arrays for k and chi
 
-    This essentially calls path2chi() for each of the paths in the
-    pathlist and writes the resulting arrays to group.k and group.chi.
+    This calculates chi(k) for all of the paths in the pathlist at once,
+    writes the chi(k) for each path to its group, and writes the summed
+    arrays to group.k and group.chi.
 
     """
     params = group2params(paramgroup, _larch=_larch)
@@ -483,11 +898,27 @@ def _ff2chi(pathlist, group=None, paramgroup=None, _larch=None,
             msg('%s is not a valid Feff Path' % path)
             return
         path.create_path_params()
-        path._calc_chi(k=k, kstep=kstep, kmax=kmax)
-    k = pathlist[0].k[:]
-    out = np.zeros_like(k)
-    for path in pathlist:
-        out += path.chi
+    if pathstack is None:
+        pathstack = FeffPathStack(pathlist)
+
+    # make sure we have a k array
+    if k is None:
+        if kmax is None:
+            kmax = 30.0
+        kmax = min(max(pathlist[0]._feffdat.k), kmax)
+        if kstep is None: kstep = 0.05
+        k = kstep * np.arange(int(1.01 + kmax/kstep), dtype='float64')
+
+    cchi, p = pathstack.calc_chi(k)
+    for ipath, path in enumerate(pathlist):
+        if path._feffdat.reff < 0.05:
+            msg('reff is too small to calculate chi(k)')
+            cchi[ipath] = 0.0
+        path.k = k
+        path.p = p[ipath]
+        path.chi = cchi[ipath].imag
+        path.chi_imag = -cchi[ipath].real
+    out = cchi.imag.sum(axis=0)
 
     if group is None:
         group = Group()
@@ -533,5 +964,7 @@ def registerLarchGroups():
 
 def registerLarchPlugin():
     return ('_xafs', {'feffpath': feffpath,
+                      'clear_feffdat_cache': clear_feffdat_cache,
+                      'set_feffdat_cache': set_feffdat_cache,
                       'path2chi': _path2chi,
                       'ff2chi': _ff2chi})
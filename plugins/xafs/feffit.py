@@ -2,39 +2,52 @@
 """
    feffit sums Feff paths to match xafs data
 """
-from collections import Iterable
+from collections import Iterable, OrderedDict
 from copy import copy, deepcopy
 from functools import partial
+from multiprocessing.pool import ThreadPool
+import logging
+import threading
+import traceback
 import numpy as np
 from numpy import array, arange, interp, pi, zeros, sqrt, concatenate
 
 from scipy import constants
+from scipy.fftpack import fft, ifft
 from scipy.optimize import leastsq as scipy_leastsq
 
 from lmfit import Parameters, Parameter, Minimizer, asteval, fit_report
 
 from larch import (Group, isParameter, ValidateLarchPlugin, isNamedClass)
 
-from larch.utils import index_of, realimag, complex_phase
-from larch_plugins.xafs import (xftf_fast, xftr_fast, ftwindow,
-                                set_xafsGroup, FeffPathGroup, _ff2chi)
+from larch.utils import (index_of, realimag, complex_phase,
+                         get_nworkers, make_pool)
+from larch_plugins.xafs import (ftwindow, set_xafsGroup, FeffPathGroup,
+                                _ff2chi)
 
-from larch_plugins.xafs.sigma2_models import sigma2_correldebye, sigma2_debye
-from larch_plugins.xafs.feffdat import PATHPAR_FMT
+from larch_plugins.xafs.sigma2_models import (sigma2_correldebye, sigma2_debye,
+                                              sigma2_debye_cached)
+from larch_plugins.xafs.cauchy_wavelet import cauchy_filters, cauchy_transform
+from larch_plugins.xafs.feffdat import PATH_PARS, PATHPAR_FMT, FeffPathStack
 # use larch's uncertainties package
 from larch.fitting import (correlated_values, eval_stderr,
                            group2params, params2group)
 
+logger = logging.getLogger(__name__)
+
+TRANSFORM_ATTRS = ('kmin', 'kmax', 'kweight', 'dk', 'dk2', 'window',
+                   'nfft', 'kstep', 'rmin', 'rmax', 'dr', 'dr2', 'rwindow')
+
 class TransformGroup(Group):
     """A Group of transform parameters.
     The apply() method will return the result of applying the transform,
-    ready to use in a Fit.   This caches the FT windows (k and r windows)
-    and assumes that once created (not None), these do not need to be
-    recalculated....
+    ready to use in a Fit.   This caches the FT windows (k and r windows),
+    the products of k window and k**kweight for each kweight, the index
+    ranges for the fit, and work arrays for the FFTs.
 
-    That is: don't simply change the parameters and expect different results.
-    If you do change parameters, reset kwin / rwin to None to cause them to be
-    recalculated.
+    These are all recalculated by make_karrays() when any of the transform
+    parameters change.  Setting kwin or rwin to None also forces them to
+    be recalculated.
     """
     def __init__(self, kmin=0, kmax=20, kweight=2, dk=4, dk2=None,
                  window='kaiser', nfft=2048, kstep=0.05,
@@ -56,8 +69,9 @@ class TransformGroup(Group):
         self.dr2 = dr2
         if dr2 is None: self.dr2 = self.dr
         self.rwindow = rwindow
-        self.__nfft = 0
-        self.__kstep = None
+        self.__signature = None
+        self.__kwin = None
+        self.__work = threading.local()
         self.nfft  = nfft
         self.kstep = kstep
         self.rstep = pi/(self.kstep*self.nfft)
@@ -97,16 +111,67 @@ class TransformGroup(Group):
                               wavelet_mask=self.wavelet_mask,
                               _larch=self._larch)
 
+    def _signature(self):
+        "tuple of transform parameters, to detect changes"
+        sig = [getattr(self, attr, None) for attr in TRANSFORM_ATTRS]
+        if isinstance(self.kweight, Iterable):
+            sig[2] = tuple(self.kweight)
+        return tuple(sig)
+
     def make_karrays(self, k=None, chi=None):
-        "this should be run in kstep or nfft changes"
-        if self.kstep == self.__kstep and self.nfft == self.__nfft:
-            return
-        self.__kstep = self.kstep
-        self.__nfft = self.nfft
+        """make arrays for transforms: this is run whenever the
+        transform parameters change, and otherwise does nothing"""
+        sig = self._signature()
+        changed = sig != self.__signature
+        if changed:
+            self.__signature = sig
+            self.rstep = pi/(self.kstep*self.nfft)
+            self.k_ = self.kstep * arange(self.nfft, dtype='float64')
+            self.r_ = self.rstep * arange(self.nfft, dtype='float64')
+
+            nfft2 = int(self.nfft/2)
+            self._qslice = slice(max(0, int(0.01 + self.kmin/self.kstep)),
+                                 min(nfft2, int(0.01 + self.kmax/self.kstep)))
+            self._rslice = slice(max(0, int(0.01 + self.rmin/self.rstep)),
+                                 min(nfft2, int(0.01 + self.rmax/self.rstep)))
+            self._kpow = {}
+            self._cauchymask = None
+        if changed or self.kwin is None:
+            self.kwin = ftwindow(self.k_, xmin=self.kmin, xmax=self.kmax,
+                                 dx=self.dk, dx2=self.dk2, window=self.window)
+        if changed or self.rwin is None:
+            self.rwin = ftwindow(self.r_, xmin=self.rmin, xmax=self.rmax,
+                                 dx=self.dr, dx2=self.dr2, window=self.rwindow)
+        if self.kwin is not self.__kwin:
+            self.__kwin = self.kwin
+            self._kwin_kpow = {}
 
-        self.rstep = pi/(self.kstep*self.nfft)
-        self.k_ = self.kstep * arange(self.nfft, dtype='float64')
-        self.r_ = self.rstep * arange(self.nfft, dtype='float64')
+    def get_kpow(self, kweight, with_window=False):
+        """return k**kweight on the k_ grid, multiplied by
+        the k window if with_window is True.  These are cached"""
+        self.make_karrays()
+        key = (kweight, with_window)
+        cache = self._kwin_kpow if with_window else self._kpow
+        if key not in cache:
+            cache[key] = self.k_**kweight
+            if with_window:
+                cache[key] = cache[key] * self.kwin
+        return cache[key]
+
+    def _workarray(self, name, npts):
+        """return complex work array of length nfft, with all values
+        zero beyond npts.  Work arrays are kept for each thread"""
+        work = self.__work
+        arr = getattr(work, name, None)
+        if arr is None or len(arr) != self.nfft:
+            arr = zeros(self.nfft, dtype='complex128')
+            setattr(work, name, arr)
+            setattr(work, name + '_npts', 0)
+        nold = getattr(work, name + '_npts')
+        if nold > npts:
+            arr[npts:nold] = 0.0
+        setattr(work, name + '_npts', npts)
+        return arr
 
     def _xafsft(self, chi, group=None, rmax_out=10, **kws):
         "returns "
@@ -140,89 +205,60 @@ class TransformGroup(Group):
     def fftf(self, chi, kweight=None):
         """ forward FT -- meant to be used internally.
         chi must be on self.k_ grid"""
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        if self.kwin is None:
-            self.kwin = ftwindow(self.k_, xmin=self.kmin, xmax=self.kmax,
-                                 dx=self.dk, dx2=self.dk2, window=self.window)
         if kweight is None:
             kweight = self.get_kweight()
-        cx = chi * self.kwin[:len(chi)] * self.k_[:len(chi)]**kweight
-        return xftf_fast(cx, kstep=self.kstep, nfft=self.nfft)
+        npts = len(chi)
+        cx = self._workarray('kbuff', npts)
+        cx[:npts] = chi * self.get_kpow(kweight, with_window=True)[:npts]
+        return (self.kstep/sqrt(pi)) * fft(cx)[:int(self.nfft/2)]
 
     def fftr(self, chir):
         " reverse FT -- meant to be used internally"
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        if self.rwin is None:
-            self.rwin = ftwindow(self.r_, xmin=self.rmin, xmax=self.rmax,
-                                 dx=self.dr, dx2=self.dr2, window=self.rwindow)
-
-        cx = chir * self.rwin[:len(chir)]
-        return xftr_fast(cx, kstep=self.kstep, nfft=self.nfft)
+        self.make_karrays()
+        npts = len(chir)
+        cx = self._workarray('rbuff', npts)
+        cx[:npts] = chir * self.rwin[:npts]
+        return (4*sqrt(pi)/self.kstep) * ifft(cx)[:int(self.nfft/2)]
 
 
     def make_cwt_arrays(self, nkpts, nrpts):
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        if self.kwin is None:
-            self.kwin = ftwindow(self.k_, xmin=self.kmin, xmax=self.kmax,
-                                 dx=self.dk, dx2=self.dk2, window=self.window)
-
-        if self._cauchymask is None:
-            if self.wavelet_mask is not None:
+        self.make_karrays()
+        if self.wavelet_mask is not None:
+            if self._cauchymask is not self.wavelet_mask:
                 self._cauchymask = self.wavelet_mask
-            else:
-                ikmin = max(0, int(0.01 + self.kmin/self.kstep))
-                ikmax = min(self.nfft/2,  int(0.01 + self.kmax/self.kstep))
-                irmin = max(0, int(0.01 + self.rmin/self.rstep))
-                irmax = min(self.nfft/2,  int(0.01 + self.rmax/self.rstep))
-                cm = np.zeros(nrpts*nkpts, dtype='int').reshape(nrpts, nkpts)
-                cm[irmin:irmax, ikmin:ikmax] = 1
-                self._cauchymask = cm
-                self._cauchyslice =(slice(irmin, irmax), slice(ikmin, ikmax))
-
-    def cwt(self, chi, rmax=None, kweight=None):
+                self._cauchyslice = (slice(None), slice(None))
+        elif (self._cauchymask is None or
+              self._cauchymask.shape != (nrpts, nkpts)):
+            ikmin = max(0, int(0.01 + self.kmin/self.kstep))
+            ikmax = min(int(self.nfft/2),  int(0.01 + self.kmax/self.kstep))
+            irmin = max(0, int(0.01 + self.rmin/self.rstep))
+            irmax = min(int(self.nfft/2),  int(0.01 + self.rmax/self.rstep))
+            cm = np.zeros(nrpts*nkpts, dtype='int').reshape(nrpts, nkpts)
+            cm[irmin:irmax, ikmin:ikmax] = 1
+            self._cauchymask = cm
+            self._cauchyslice =(slice(irmin, irmax), slice(ikmin, ikmax))
+
+    def cwt(self, chi, rmax=None, kweight=None, chunksize=None):
         """cauchy wavelet transform -- meant to be used internally"""
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        nkpts = len(chi)
-        nrpts = int(np.round(self.rmax/self.rstep))
-        if self.kwin is None:
-            self.make_cwt_arrays(nkpts, nrpts)
-
-        omega = pi*np.arange(self.nfft)/(self.kstep*self.nfft)
+        if rmax is not None:
+            self.rmax = rmax
+        self.make_karrays()
 
         if kweight is None:
             kweight = self.get_kweight()
         if kweight != 0:
-            chi = chi * self.kwin[:len(chi)] * self.k_[:len(chi)]**kweight
-
-        if rmax is not None:
-            self.rmax = rmax
-
-        chix   = np.zeros(self.nfft/2) * self.kstep
-        chix[:nkpts] = chi
-        chix   = chix[:self.nfft/2]
-        _ffchi = np.fft.fft(chix, n=2*self.nfft)[:self.nfft]
+            chi = chi * self.get_kpow(kweight, with_window=True)[:len(chi)]
 
+        nkpts = len(chi)
         nrpts = int(np.round(self.rmax/self.rstep))
-        r   = self.rstep * arange(nrpts)
-        r[0] = 1.e-19
-        alpha = nrpts/(2*r)
-
         self.make_cwt_arrays(nkpts, nrpts)
 
-        cauchy_sum = np.log(2*pi) - np.log(1.0+np.arange(nrpts)).sum()
-
-        out = np.zeros(nrpts*nkpts, dtype='complex128').reshape(nrpts, nkpts)
-
-        for i in range(nrpts):
-            aom = alpha[i]*omega
-            filt = cauchy_sum + nrpts*np.log(aom) - aom
-            out[i, :] = np.fft.ifft(np.exp(filt)*_ffchi, 2*self.nfft)[:nkpts]
-
-        return (out*self._cauchymask)[self._cauchyslice]
+        # only the R values within the mask need to be transformed
+        rows = self._cauchyslice[0]
+        filters = cauchy_filters(self.kstep, self.nfft,
+                                 self.rstep * arange(nrpts))[rows]
+        out = cauchy_transform(chi, filters, nkpts, chunksize=chunksize)
+        return (out*self._cauchymask[rows])[:, self._cauchyslice[1]]
 
 class FeffitDataSet(Group):
     def __init__(self, data=None, pathlist=None, transform=None,
@@ -242,6 +278,7 @@ class FeffitDataSet(Group):
         self.model = Group()
         self.model.k = None
         self.__chi = None
+        self.__pathstack = None
         self.__prepared = False
 
     def __repr__(self):
@@ -295,6 +332,7 @@ class FeffitDataSet(Group):
             path.create_path_params()
             if path.spline_coefs is None:
                 path.create_spline_coefs()
+        self.__pathstack = FeffPathStack(self.pathlist)
 
         self.__prepared = True
 
@@ -377,29 +415,111 @@ class FeffitDataSet(Group):
             self.prepare_fit()
 
         _ff2chi(self.pathlist, paramgroup=paramgroup, k=self.model.k,
-                _larch=self._larch, group=self.model)
+                _larch=self._larch, group=self.model,
+                pathstack=self.__pathstack)
+
+        diff  = (self.__chi - self.model.chi)
+        if data_only:  # for extracting transformed data separately from residual
+            diff  = self.__chi
+        return self._transform(diff)
+
+    def _jacobian(self, paramgroup, var_names):
+        """return the Jacobian of the residual for this data set:
+        a 2-d array of d(residual)/d(variable) with one column for
+        each of the variables named in var_names.
+
+        Derivatives of chi(k) with respect to the path parameters are
+        calculated analytically, and those of the path parameters with
+        respect to the variables by finite differences of the constraint
+        expressions.  Since the transform applied to data_chi - model_chi
+        is linear, the columns are the transformed derivatives of -model_chi.
+        """
+        if not isNamedClass(self.transform, TransformGroup):
+            return
+        pathpars, dpars = self._path_param_derivs(paramgroup, var_names)
+        return self._model_jacobian(pathpars, dpars)
+
+    def _path_params(self, paramgroup):
+        """evaluate the path parameters for all paths, returning a
+        2-d array (8, npaths).  This uses the shared fiteval symbol
+        table, so must not be run concurrently for different datasets."""
+        if not self.__prepared:
+            self.prepare_fit()
+        group2params(paramgroup, _larch=self._larch)
+        for path in self.pathlist:
+            path.create_path_params()
+        return self.__pathstack.path_params()
 
+    def _path_param_derivs(self, paramgroup, var_names):
+        """evaluate the path parameters for all paths, and their
+        derivatives with respect to the variables named in var_names,
+        returning arrays of shape (8, npaths) and (nvars, 8, npaths).
+        As with _path_params(), this must not be run concurrently."""
+        if not self.__prepared:
+            self.prepare_fit()
+        params = group2params(paramgroup, _larch=self._larch)
+        for path in self.pathlist:
+            path.create_path_params()
+
+        stack = self.__pathstack
+        pathpars = stack.path_params()
+        dpars = np.zeros((len(var_names),) + pathpars.shape)
+        for ivar, name in enumerate(var_names):
+            par = params[name]
+            value = par.value
+            step = 1.e-7*max(abs(value), 1.e-3)
+            par.value = value + step
+            params.update_constraints()
+            dpars[ivar] = (stack.path_params() - pathpars)/step
+            par.value = value
+        params.update_constraints()
+        return pathpars, dpars
+
+    def _model_residual(self, pathpars):
+        """return the residual for this data set with path parameter
+        values pathpars from _path_params().  This uses only arrays
+        held by the data set, and so can be run concurrently with
+        other data sets, or in another process."""
+        stack = self.__pathstack
+        cchi, p = stack.calc_chi(self.model.k, pathpars=pathpars)
+        cchi[np.where(stack.reff < 0.05)] = 0.0
+        self.model.chi = cchi.imag.sum(axis=0)
+        return self._transform(self.__chi - self.model.chi)
+
+    def _model_jacobian(self, pathpars, dpars):
+        """return the Jacobian of the residual for this data set with
+        path parameter values and derivatives from _path_param_derivs().
+        As with _model_residual(), this can be run concurrently."""
+        stack = self.__pathstack
+        cchi, p, dcchi = stack.calc_chi(self.model.k, pathpars=pathpars,
+                                        derivs=True)
+        dcchi[:, np.where(stack.reff < 0.05)[0], :] = 0.0
+        dchi = np.einsum('vij,ijk->vk', dpars, dcchi.imag)
+        return np.array([self._transform(-d) for d in dchi]).T
+
+    def _transform(self, diff):
+        """apply the fit transform (k-weight, window, FT, and
+        scaling by uncertainty) to diff, an array of chi(k)"""
         eps_k = self.epsilon_k
         if isinstance(eps_k, np.ndarray):
             eps_k[np.where(eps_k<1.e-12)[0]] = 1.e-12
 
-        diff  = (self.__chi - self.model.chi)
-        if data_only:  # for extracting transformed data separately from residual
-            diff  = self.__chi
         trans = self.transform
-        k     = trans.k_[:len(diff)]
+        trans.make_karrays()
+        npts  = len(diff)
 
         all_kweights = isinstance(trans.kweight, Iterable)
         if trans.fitspace == 'k':
-            iqmin = max(0, int(0.01 + trans.kmin/trans.kstep))
-            iqmax = min(trans.nfft/2,  int(0.01 + trans.kmax/trans.kstep))
+            qslice = trans._qslice
             if all_kweights:
                 out = []
                 for i, kw in enumerate(trans.kweight):
-                    out.append(((diff/eps_k[i])*k**kw)[iqmin:iqmax])
+                    kpow = trans.get_kpow(kw)[:npts]
+                    out.append(((diff/eps_k[i])*kpow)[qslice])
                 return np.concatenate(out)
             else:
-                return ((diff/eps_k) * k**trans.kweight)[iqmin:iqmax]
+                kpow = trans.get_kpow(trans.kweight)[:npts]
+                return ((diff/eps_k) * kpow)[qslice]
         elif trans.fitspace == 'w':
             if all_kweights:
                 out = []
@@ -419,17 +539,15 @@ class FeffitDataSet(Group):
                 chir = [trans.fftf(diff)]
                 eps_r = [self.epsilon_r]
             if trans.fitspace == 'r':
-                irmin = max(0, int(0.01 + trans.rmin/trans.rstep))
-                irmax = min(trans.nfft/2,  int(0.01 + trans.rmax/trans.rstep))
+                rslice = trans._rslice
                 for i, chir_ in enumerate(chir):
                     chir_ = chir_ / (eps_r[i])
-                    out.append(realimag(chir_[irmin:irmax]))
+                    out.append(realimag(chir_[rslice]))
             else:
                 chiq = [trans.fftr(c)/eps for c, eps in zip(chir, eps_r)]
-                iqmin = max(0, int(0.01 + trans.kmin/trans.kstep))
-                iqmax = min(trans.nfft/2,  int(0.01 + trans.kmax/trans.kstep))
+                qslice = trans._qslice
                 for chiq_ in chiq:
-                    out.append( realimag(chiq_[iqmin:iqmax])[::2])
+                    out.append( realimag(chiq_[qslice])[::2])
             return np.concatenate(out)
 
     def save_ffts(self, rmax_out=10, path_outputs=True):
@@ -441,6 +559,101 @@ class FeffitDataSet(Group):
             for p in self.pathlist:
                 xft(p.chi, group=p, rmax_out=rmax_out)
 
+def _derived_params(params, datasets):
+    """list of constrained parameters and path parameters for the
+    paths of all datasets, as (path or None, Parameter)"""
+    out = [(None, par) for par in params.values()
+           if getattr(par, '_expr_ast', None) is not None]
+    for ds in datasets:
+        for path in ds.pathlist:
+            for pname in PATH_PARS:
+                out.append((path, path.params[PATHPAR_FMT % (pname, path.label)]))
+    return out
+
+def _derived_values(params, derived):
+    """values of the derived parameters from _derived_params()
+    for the current values of the variables"""
+    params.update_constraints()
+    values = dict([(name, par.value) for name, par in params.items()])
+    out, current = [], None
+    for path, par in derived:
+        if path is not None and path is not current:
+            # path parameters are evaluated in the fit namespace,
+            # which may differ from that of params
+            path.params._asteval.symtable.update(values)
+            path.store_feffdat()
+            current = path
+        out.append(par._getval())
+    return np.array(out, dtype='float64')
+
+def propagate_stderr(params, var_names, covar, datasets):
+    """set stderr for constrained parameters and the path parameters
+    of all datasets from the covariance matrix of the variables.
+
+    The derivatives of all derived parameters with respect to each
+    variable are found in one pass, by central differences of the
+    constraint expressions, giving a Jacobian J (nderived, nvars), and
+    the uncertainties are sqrt(diag(J covar J^T)).  This gives the
+    same values as eval_stderr() for each parameter.
+    """
+    derived = _derived_params(params, datasets)
+    hasexpr = np.array([getattr(par, '_expr_ast', None) is not None
+                        for path, par in derived])
+    jac = np.zeros((len(derived), len(var_names)))
+    try:
+        for ivar, name in enumerate(var_names):
+            par = params[name]
+            value = par.value
+            step = 1.e-7*max(abs(value), 1.e-3)
+            par.value = value + step
+            vplus = _derived_values(params, derived)
+            par.value = value - step
+            vminus = _derived_values(params, derived)
+            par.value = value
+            jac[:, ivar] = (vplus - vminus)/(2*step)
+    finally:
+        _derived_values(params, derived)
+    stderr = np.sqrt(abs(np.einsum('ij,jk,ik->i', jac, covar, jac)))
+    for (path, par), err, expr in zip(derived, stderr, hasexpr):
+        if expr:
+            par.stderr = err
+
+def _eval_stderrs(params, var_names, covar, datasets):
+    """set stderr for constrained parameters and the path parameters
+    of all datasets with eval_stderr(), one parameter at a time"""
+    vsave, vbest = {}, []
+    for vname in var_names:
+        par = params[vname]
+        vsave[vname] = par
+        vbest.append(par.value)
+    uvars = correlated_values(vbest, covar)
+    for path, obj in _derived_params(params, datasets):
+        pars = params
+        if path is not None:
+            path.store_feffdat()
+            pars = path.params
+        eval_stderr(obj, uvars, var_names, pars)
+    for vname in var_names:
+        params[vname] = vsave[vname]
+    _derived_values(params, _derived_params(params, datasets))
+
+_worker_datasets = None
+
+def _init_worker(datasets):
+    """save datasets in a worker process for _dataset_call()"""
+    global _worker_datasets
+    _worker_datasets = datasets
+
+def _dataset_call(args):
+    """call a method of one FeffitDataSet, for evaluating datasets in
+    parallel. args is (datasets, index, method name, method arguments),
+    with datasets None in worker processes, which use the datasets they
+    were started with"""
+    datasets, index, method, margs = args
+    if datasets is None:
+        datasets = _worker_datasets
+    return getattr(datasets[index], method)(*margs)
+
 @ValidateLarchPlugin
 def feffit_dataset(data=None, pathlist=None, transform=None,
                    epsilon_k=None, _larch=None):
@@ -491,7 +704,9 @@ def feffit_transform(_larch=None, **kws):
     return TransformGroup(_larch=_larch, **kws)
 
 @ValidateLarchPlugin
-def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **kws):
+def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True,
+           analytic_jacobian=True, nworkers=1, processes=False,
+           _larch=None, **kws):
     """execute a Feffit fit: a fit of feff paths to a list of datasets
 
     Parameters:
@@ -500,6 +715,13 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
       datasets:     Feffit Dataset group or list of Feffit Dataset group.
       rmax_out:     maximum R value to calculate output arrays.
       path_output:  Flag to set whether all Path outputs should be written.
+      analytic_jacobian: Flag to set whether to use analytic derivatives
+                    of the XAFS equation for the Jacobian, instead of
+                    finite differences of the residual [True].
+      nworkers:     number of workers for evaluating the datasets in
+                    parallel [1: evaluate datasets in turn]
+      processes:    Flag to set whether the workers are processes,
+                    instead of threads [False]
 
     Returns:
     ---------
@@ -527,7 +749,27 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
                _larch=None, **kwargs):
         """ this is the residual function"""
         params2group(params, paramgroup)
-        return concatenate([d._residual(paramgroup) for d in datasets])
+        if pool is None:
+            return concatenate([d._residual(paramgroup) for d in datasets])
+        # path parameters are evaluated in turn, the rest in parallel
+        tasks = [(pool_datasets, i, '_model_residual',
+                  (d._path_params(paramgroup),))
+                 for i, d in enumerate(datasets)]
+        return concatenate(pool.map(_dataset_call, tasks))
+
+    def _jacobian(params, datasets=None, paramgroup=None,
+                  _larch=None, **kwargs):
+        """ this is the Jacobian of the residual function"""
+        params2group(params, paramgroup)
+        var_names = [name for name, par in params.items()
+                     if par.vary and par.expr is None]
+        if pool is None:
+            return concatenate([d._jacobian(paramgroup, var_names)
+                                for d in datasets])
+        tasks = [(pool_datasets, i, '_model_jacobian',
+                  d._path_param_derivs(paramgroup, var_names))
+                 for i, d in enumerate(datasets)]
+        return concatenate(pool.map(_dataset_call, tasks))
 
     if isNamedClass(datasets, FeffitDataSet):
         datasets = [datasets]
@@ -545,7 +787,22 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
                                  paramgroup=paramgroup),
                     scale_covar=True, **kws)
 
-    result = fit.leastsq()
+    pool, pool_datasets = None, datasets
+    nworkers = min(get_nworkers(nworkers), len(datasets))
+    if nworkers > 1:
+        pool = make_pool(nworkers, processes=processes, fork=True,
+                         initializer=_init_worker, initargs=(datasets,))
+        if processes:
+            pool_datasets = None
+    try:
+        if analytic_jacobian:
+            result = fit.leastsq(Dfun=_jacobian)
+        else:
+            result = fit.leastsq()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     params2group(result.params, paramgroup)
     dat = concatenate([d._residual(paramgroup, data_only=True) for d in datasets])
@@ -582,34 +839,15 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
 
         # next, propagate uncertainties to constraints and path parameters.
         result.covar *= err_scale
-        vsave, vbest = {}, []
-
-        # 1. save current params
-        for vname in result.var_names:
-            par = result.params[vname]
-            vsave[vname] = par
-            vbest.append(par.value)
-
-        # 2. get correlated uncertainties, set params accordingly
-        uvars = correlated_values(vbest, result.covar)
-        # 3. evaluate constrained params, save stderr
-        for nam, obj in result.params.items():
-            eval_stderr(obj, uvars,  result.var_names, result.params) # vsave) # , _larch)
-
-        # 3. evaluate path params, save stderr
-        for ds in datasets:
-            for p in ds.pathlist:
-                p.store_feffdat()
-                for pname in ('degen', 's02', 'e0', 'ei',
-                              'deltar', 'sigma2', 'third', 'fourth'):
-                    obj = p.params[PATHPAR_FMT % (pname, p.label)]
-                    eval_stderr(obj, uvars,  result.var_names, result.params)
-
-
-        # restore saved parameters again
-        for vname in result.var_names:
-            # setattr(params, vname, vsave[vname])
-            params[vname] = vsave[vname]
+        try:
+            propagate_stderr(result.params, result.var_names,
+                             result.covar, datasets)
+        except (ValueError, TypeError, KeyError,
+                np.linalg.LinAlgError) as exc:
+            logger.warning("feffit: propagate_stderr failed (%s), "
+                           "using eval_stderr for each parameter", exc)
+            _eval_stderrs(result.params, result.var_names,
+                          result.covar, datasets)
 
         # clear any errors evaluting uncertainties
         if len(_larch.error) > 0:
@@ -633,6 +871,295 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
     return out
 
 
+FEFFIT_RESULT_ATTRS = ('chi_square', 'chi_reduced', 'rfactor', 'aic', 'bic',
+                       'n_independent', 'covar', 'nvarys', 'nfree', 'ndata',
+                       'var_names', 'nfev', 'success', 'errorbars', 'message',
+                       'lmdif_message')
+
+_batch_template = None
+SMALL_K = 0.05
+
+def _init_batch_worker(template):
+    """save feffit_batch() template in a worker process"""
+    global _batch_template
+    _batch_template = template
+
+def _make_batch_pool(nworkers, template):
+    """return pool of forked worker processes for running many fits,
+    or None if only one worker is needed or forking is not available:
+    fits share the fit namespace, so cannot be run in threads"""
+    if nworkers < 2:
+        return None
+    pool = make_pool(nworkers, processes=True, fork=True,
+                     initializer=_init_batch_worker, initargs=(template,))
+    if isinstance(pool, ThreadPool):
+        pool.close()
+        pool = None
+    return pool
+
+def _feffit_batch_task(args):
+    """run a block of fits for feffit_batch(), returning a list of
+    (index, params, results, model, error) for each fit, with
+    picklable copies of the best-fit Parameters and model arrays.
+    args is (indices, warm_start, template), with template None in
+    worker processes, which use the template they were started with"""
+    indices, warm_start, template = args
+    if template is None:
+        template = _batch_template
+    paramgroup, pathlist, transform, datagroups, initvals, kws, _larch = template
+
+    out, start = [], initvals
+    for index in indices:
+        for name, val in start.items():
+            getattr(paramgroup, name).value = val
+        try:
+            dset = FeffitDataSet(data=datagroups[index], pathlist=pathlist,
+                                 transform=transform, _larch=_larch)
+            result = feffit(paramgroup, dset, path_outputs=False,
+                            _larch=_larch, **kws)
+            if result is None:
+                raise ValueError('feffit() gave no result')
+        except Exception:
+            out.append((index, None, None, None, traceback.format_exc()))
+            start = initvals
+            continue
+        params = OrderedDict()
+        for name, par in result.params.items():
+            params[name] = Parameter(name=name)
+            params[name].__setstate__(par.__getstate__())
+        stats = dict([(attr, getattr(result, attr, None))
+                      for attr in FEFFIT_RESULT_ATTRS])
+        for attr in ('epsilon_k', 'epsilon_r', 'n_idp'):
+            stats[attr] = getattr(dset, attr, None)
+        out.append((index, params, stats, dset.model, None))
+        if warm_start:
+            start = dict([(name, params[name].value) for name in initvals])
+    return out
+
+@ValidateLarchPlugin
+def feffit_batch(paramgroup, pathlist, transform, datagroups,
+                 warm_start=False, nworkers=None, rmax_out=10,
+                 _larch=None, **kws):
+    """run the same Feffit model for a list of data groups, with the
+    fits run in a pool of worker processes.
+
+    Parameters:
+    ------------
+      paramgroup:  group containing parameters for fit
+      pathlist:    list of FeffPath groups, as created from feffpath()
+      transform:   Feffit Transform group.
+      datagroups:  list of groups containing experimental EXAFS
+                   (needs arrays 'k' and 'chi').
+      warm_start:  Flag to set whether each fit starts from the best-fit
+                   values of the previous data group [False].
+      nworkers:    number of worker processes [None: number of CPUs]
+      rmax_out:    maximum R value to calculate output arrays.
+      kws:         other keyword arguments are passed to feffit()
+
+    Returns:
+    ---------
+      a list of fit results groups, one for each data group and in the
+      same order, as from feffit() for a single dataset.  Each group has
+      'success', and an 'error' attribute that is None for completed fits
+      or holds the error message for fits that failed.
+
+    Notes:
+    ------
+     1 The variables in paramgroup are reset to their initial values
+       before each fit (unless warm_start=True), and after all fits.
+       The best-fit values are in the 'params' of each result.
+     2 With warm_start=True, the data groups are split into nworkers
+       consecutive blocks, each fit in turn by one worker, with each fit
+       starting from the previous fit in the block.  A failed fit does
+       not stop the others, and the next fit starts from initial values.
+     3 Worker processes are forked, so that they share the paths and
+       parameters.  Where that is not possible, the fits are run in turn.
+     4 Path outputs are not written, as the paths are shared by all fits.
+    """
+    datagroups = list(datagroups)
+    ndata = len(datagroups)
+    saved = {}
+    for name in dir(paramgroup):
+        par = getattr(paramgroup, name)
+        if isParameter(par) and par.vary and par.expr is None:
+            saved[name] = (par.value, par.stderr, par.correl)
+    initvals = dict([(name, val[0]) for name, val in saved.items()])
+    kws['rmax_out'] = rmax_out
+    template = (paramgroup, pathlist, transform, datagroups,
+                initvals, kws, _larch)
+
+    nworkers = min(get_nworkers(nworkers), max(1, ndata))
+    if warm_start:
+        blocks = [list(b) for b in np.array_split(np.arange(ndata), nworkers)]
+    else:
+        blocks = [[i] for i in range(ndata)]
+
+    pool = _make_batch_pool(nworkers, template)
+    try:
+        if pool is None:
+            blockout = [_feffit_batch_task((b, warm_start, template))
+                        for b in blocks if len(b) > 0]
+        else:
+            blockout = pool.map(_feffit_batch_task,
+                                [(b, warm_start, None) for b in blocks if len(b) > 0],
+                                chunksize=1)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for name, (value, stderr, correl) in saved.items():
+            par = getattr(paramgroup, name)
+            par.value, par.stderr, par.correl = value, stderr, correl
+
+    results = [None]*ndata
+    for index, params, stats, model, error in [r for b in blockout for r in b]:
+        out = Group(name='feffit results %d' % index, params=params,
+                    datasets=[], error=error, success=False)
+        if error is None:
+            dset = FeffitDataSet(data=datagroups[index], pathlist=pathlist,
+                                 transform=transform, _larch=_larch)
+            dset.model = model
+            for attr in ('epsilon_k', 'epsilon_r', 'n_idp'):
+                setattr(dset, attr, stats.pop(attr))
+            out.datasets = [dset]
+            for attr, val in stats.items():
+                setattr(out, attr, val)
+        results[index] = out
+    return results
+
+def _feffit_bootstrap_task(args):
+    """run one fit to perturbed or resampled data for feffit_bootstrap(),
+    returning (values, error), with the values of the parameters and
+    None, or None and the traceback if the fit fails.
+    args is (seed, template), with template None in worker processes,
+    which use the template they were started with"""
+    seed, template = args
+    if template is None:
+        template = _batch_template
+    paramgroup, datasets, arrays, names, bestvals, method, kws, _larch = template
+
+    rng = np.random.RandomState(seed)
+    for name, val in bestvals.items():
+        getattr(paramgroup, name).value = val
+    dsets = []
+    for ds, (k, chi, model, eps_k, kfit) in zip(datasets, arrays):
+        if method.startswith('res'):
+            kwt = np.maximum(k, SMALL_K)**ds.transform.get_kweight()
+            resid = ((chi - model)*kwt)[kfit]
+            chi = model + resid[rng.randint(0, len(resid), len(k))]/kwt
+        else:
+            chi = chi + eps_k*rng.normal(size=len(k))
+        dsets.append(FeffitDataSet(data=Group(k=k, chi=chi),
+                                   pathlist=ds.pathlist, epsilon_k=eps_k,
+                                   transform=ds.transform, _larch=_larch))
+    try:
+        result = feffit(paramgroup, dsets, path_outputs=False,
+                        _larch=_larch, **kws)
+        if result is None:
+            raise ValueError('feffit() gave no result')
+    except (ValueError, ArithmeticError, np.linalg.LinAlgError):
+        return None, traceback.format_exc()
+    return [result.params[name].value for name in names], None
+
+@ValidateLarchPlugin
+def feffit_bootstrap(paramgroup, datasets, nsamples=100, method='perturb',
+                     seed=None, nworkers=None, _larch=None, **kws):
+    """estimate uncertainties in Feffit parameters by refitting many
+    random realizations of the data, in a pool of worker processes.
+
+    Parameters:
+    ------------
+      paramgroup:   group containing parameters for fit
+      datasets:     Feffit Dataset group or list of Feffit Dataset group.
+      nsamples:     number of realizations of the data to fit [100]
+      method:       how to make realizations of the data, one of
+                    'perturb': add Gaussian noise of size epsilon_k to chi(k)
+                    'resample': add k-weighted residuals of the best fit,
+                       resampled with replacement from the fit k-range,
+                       to the best-fit model [default 'perturb']
+      seed:         seed for random numbers [None]
+      nworkers:     number of worker processes [None: number of CPUs]
+      kws:          other keyword arguments are passed to feffit()
+
+    Returns:
+    ---------
+      a group with attributes
+        fit          fit results group from feffit() for the data
+        names        names of variables and constrained parameters
+        samples      2-d array (nfits, nparams) of best-fit values
+        nfailed      number of fits that failed
+        errors       list of tracebacks for the fits that failed
+        mean         mean of best-fit values for each parameter
+        stderr       standard deviation of best-fit values
+        levels       percentile levels (2.5, 16, 50, 84, 97.5)
+        percentiles  2-d array (nparams, nlevels) of percentiles
+        correl       2-d array (nparams, nparams) of correlations
+
+    Notes:
+    ------
+     1 The data is first fit with feffit(), leaving paramgroup with the
+       best-fit values and uncertainties.  Each realization is fit
+       starting from the best-fit values, with epsilon_k from this fit.
+     2 Worker processes are forked, so that they share the paths and
+       parameters.  Where that is not possible, the fits are run in turn.
+     3 Fits that fail with ValueError, ArithmeticError or LinAlgError are
+       counted in nfailed, with their tracebacks in errors.  Any other
+       exception stops the bootstrap.
+    """
+    if isNamedClass(datasets, FeffitDataSet):
+        datasets = [datasets]
+
+    fit = feffit(paramgroup, datasets, _larch=_larch, **kws)
+    names = [name for name, par in fit.params.items()
+             if par.vary or par.expr is not None]
+    bestvals = dict([(name, fit.params[name].value) for name in fit.var_names])
+
+    arrays = []
+    for ds in datasets:
+        k, chi = ds.data.k, ds.data.chi
+        model = interp(k, ds.model.k, ds.model.chi)
+        eps_k = ds.epsilon_k
+        if isinstance(eps_k, (list, tuple)):
+            eps_k = eps_k[0]
+        if isinstance(eps_k, np.ndarray):
+            eps_k = interp(k, ds.model.k, eps_k)
+        else:
+            eps_k = eps_k*np.ones(len(k))
+        kfit = (k >= ds.transform.kmin) & (k <= ds.transform.kmax)
+        arrays.append((k, chi, model, eps_k, kfit))
+
+    template = (paramgroup, datasets, arrays, names, bestvals,
+                method, kws, _larch)
+    seeds = np.random.RandomState(seed).randint(0, 2**31-1, nsamples)
+    nworkers = min(get_nworkers(nworkers), max(1, nsamples))
+    pool = _make_batch_pool(nworkers, template)
+    try:
+        if pool is None:
+            samples = [_feffit_bootstrap_task((s, template)) for s in seeds]
+        else:
+            samples = pool.map(_feffit_bootstrap_task,
+                               [(s, None) for s in seeds])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        params2group(fit.params, paramgroup)
+
+    errors = [err for vals, err in samples if err is not None]
+    samples = np.array([vals for vals, err in samples
+                        if vals is not None]).reshape(-1, len(names))
+    levels = (2.5, 16, 50, 84, 97.5)
+    out = Group(name='feffit bootstrap', fit=fit, names=names,
+                samples=samples, nfailed=len(errors), errors=errors,
+                levels=levels, mean=None, stderr=None,
+                percentiles=None, correl=None)
+    if len(samples) > 1:
+        out.mean = samples.mean(axis=0)
+        out.stderr = samples.std(axis=0, ddof=1)
+        out.percentiles = np.percentile(samples, levels, axis=0).T
+        out.correl = np.atleast_2d(np.corrcoef(samples, rowvar=False))
+    return out
+
 @ValidateLarchPlugin
 def feffit_report(result, min_correl=0.1, with_paths=True,
                   _larch=None):
@@ -811,20 +1338,7 @@ def sigma2_debye(t, theta):
     if theta < 1.e-5: theta = 1.e-5
     if t < 1.e-5:     t = 1.e-5
 
-    tempk  = float(t)
-    thetad = float(theta)
-
-    natoms = len(feffpath.geom)
-    rnorm  = feffpath.rnorman
-    atomx, atomy, atomz, atomm = [], [], [], []
-    for sym, iz, ipot, am, x, y, z in feffpath.geom:
-        atomx.append(x)
-        atomy.append(y)
-        atomz.append(z)
-        atomm.append(am)
-
-    return sigma2_correldebye(natoms, tempk, thetad, rnorm,
-                              atomx, atomy, atomz, atomm)
+    return sigma2_debye_cached(feffpath, t, theta)
 """
 
 def initializeLarchPlugin(_larch=None):
@@ -839,6 +1353,7 @@ def initializeLarchPlugin(_larch=None):
     add(('const_kboltz', constants.k))
     add(('const_amu', constants.atomic_mass))
     add(('sigma2_correldebye', sigma2_correldebye))
+    add(('sigma2_debye_cached', sigma2_debye_cached))
     add(sigma2xafs_)
 
 def registereLarchGroups():
@@ -846,6 +1361,8 @@ def registereLarchGroups():
 
 def registerLarchPlugin():
     return ('_xafs', {'feffit': feffit,
+                      'feffit_batch': feffit_batch,
+                      'feffit_bootstrap': feffit_bootstrap,
                       'feffit_dataset': feffit_dataset,
                       'feffit_transform': feffit_transform,
                       'feffit_report': feffit_report})
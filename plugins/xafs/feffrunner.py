@@ -5,11 +5,14 @@ from   distutils.spawn import find_executable
 
 from shutil import copy, move
 import subprocess
+import threading
+import hashlib
 import time
 import re
 
 from larch import (Group, Parameter, isParameter, param_value,
                    isNamedClass, Interpreter)
+from larch.utils import get_nworkers, make_pool
 
 def find_exe(exename):
     bindir = 'bin'
@@ -224,6 +227,168 @@ class FeffRunner(Group):
 
 ######################################################################
 
+FEFFRUN_HASHFILE = '.feffrun_hash'
+
+def _feff_program(exe, _larch=None):
+    """full path to Feff executable for exe (a Feff8l module name,
+    an executable name or path, or None for _xafs._feff_executable),
+    or None if it cannot be found"""
+    program = None
+    if exe is not None:
+        if exe in FeffRunner.Feff8l_modules:
+            exe = "feff8l_%s" % exe
+        if isfile(exe):
+            program = os.path.abspath(exe)
+        else:
+            program = find_exe(exe)
+    if program is None and _larch is not None:
+        try:
+            program = _larch.symtable.get_symbol('_xafs._feff_executable')
+        except (NameError, AttributeError):
+            program = None
+    if program is not None and not os.access(program, os.X_OK):
+        program = None
+    return program
+
+def _feffinp_hash(feffinp, program):
+    """hash of feff.inp contents and the name of the executable"""
+    _hash = hashlib.sha1()
+    with open(feffinp, 'rb') as fh:
+        _hash.update(fh.read())
+    _hash.update(basename(program).encode('utf-8'))
+    return _hash.hexdigest()
+
+def _feff_batch_job(args):
+    """run one Feff job of feff_batch() in its own working folder"""
+    result, program, force, writer, lock = args
+    workdir = result.folder
+    hashfile = join(workdir, FEFFRUN_HASHFILE)
+    inphash = _feffinp_hash(result.feffinp, program)
+    if not force and isfile(hashfile) and isfile(join(workdir, 'files.dat')):
+        with open(hashfile, 'r') as fh:
+            if fh.read().strip() == inphash:
+                result.status = 'cached'
+                return result
+
+    if not isdir(workdir):
+        os.makedirs(workdir)
+    feffinp = join(workdir, 'feff.inp')
+    if realpath(result.feffinp) != realpath(feffinp):
+        copy(result.feffinp, feffinp)
+    if isfile(hashfile):
+        os.unlink(hashfile)
+
+    t0 = time.time()
+    pattern = re.compile('mu_(new|old)=\s+(-?\d\.\d+)')
+    with open(result.log, 'w') as logfile:
+        try:
+            process = subprocess.Popen(program, shell=False, cwd=workdir,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+        except OSError as exc:
+            logfile.write('could not run %s: %s\n' % (program, exc))
+            result.status = 'failed'
+            return result
+        for line in iter(process.stdout.readline, b''):
+            line = line.decode('utf-8', 'replace')
+            logfile.write(line)
+            logfile.flush()
+            match = pattern.search(line)
+            if match is not None:
+                result.threshold.append(match.group(2))
+            if writer is not None:
+                with lock:
+                    writer.write(" %s: %s\n" % (result.label, line.rstrip()))
+        process.stdout.close()
+        result.returncode = process.wait()
+
+    result.runtime = time.time() - t0
+    if result.returncode == 0 and isfile(join(workdir, 'files.dat')):
+        result.status = 'ok'
+        with open(hashfile, 'w') as fh:
+            fh.write('%s\n' % inphash)
+    else:
+        result.status = 'failed'
+    return result
+
+def feff_batch(inputs, exe=None, nworkers=None, force=False,
+               verbose=False, _larch=None, **kws):
+    """
+    run many Feff calculations, each in its own working folder, with
+    a bounded number of calculations running at the same time.
+
+    Arguments:
+    ----------
+      inputs (list): feff.inp files or folders containing 'feff.inp'
+      exe (None or str): Feff executable to run [None: _xafs._feff_executable]
+      nworkers (int or None): maximum number of concurrent calculations
+                              [None: number of CPUs]
+      force (bool): whether to run calculations that are up to date [False]
+      verbose (bool): whether to write Feff output as it runs [False]
+
+    Returns:
+    --------
+      list of Groups, one per input, with attributes
+        label       name of job, from the working folder
+        feffinp     input file
+        folder      working folder, where outputs are written
+        log         log file, holding Feff output for this job
+        status      'ok', 'cached', or 'failed'
+        returncode  exit code of Feff, or None if not run
+        runtime     run time in seconds
+        threshold   list of threshold energies found in the Feff output
+
+    Notes:
+    ------
+      1. An input file named 'feff.inp' is run in its own folder.  Other
+         input files, say 'path/cu_site2.inp', are copied to 'feff.inp'
+         in a folder named for the file, 'path/cu_site2/'.
+      2. A hash of the input file and executable is saved in each working
+         folder after a successful run.  Jobs with matching hashes and
+         existing outputs are not run again, unless force=True.
+      3. Feff is run with the working folder as its current directory,
+         without changing directory in Larch.
+    """
+    program = _feff_program(exe, _larch=_larch)
+    if program is None:
+        raise Exception("'%s' executable cannot be found" % exe)
+
+    if isinstance(inputs, str) or not hasattr(inputs, '__iter__'):
+        inputs = [inputs]
+    results, folders = [], []
+    for inp in inputs:
+        if isdir(inp):
+            inp = join(inp, 'feff.inp')
+        if not isfile(inp):
+            raise Exception("feff.inp file '%s' could not be found" % inp)
+        inp = os.path.abspath(inp)
+        folder, fname = os.path.split(inp)
+        if fname != 'feff.inp':
+            folder = join(folder, os.path.splitext(fname)[0])
+        if folder in folders:
+            raise Exception("more than one Feff job would run in '%s'" % folder)
+        folders.append(folder)
+        results.append(Group(name='Feff job: %s' % folder,
+                             label=basename(folder), feffinp=inp,
+                             folder=folder, exe=program,
+                             log=join(folder, 'feffrun_%s.log' % basename(program)),
+                             status=None, returncode=None, runtime=0.0,
+                             threshold=[]))
+
+    writer = None
+    if verbose and _larch is not None:
+        writer = _larch.writer
+    lock = threading.Lock()
+    tasks = [(res, program, force, writer, lock) for res in results]
+    pool = make_pool(min(get_nworkers(nworkers), max(1, len(tasks))),
+                     processes=False)
+    try:
+        results = pool.map(_feff_batch_job, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
 def initializeLarchPlugin(_larch=None):
     """initialize _xafs._feff_executable"""
     feff6_exe = find_exe('feff6l')
@@ -294,5 +459,6 @@ def registerLarchGroups():
 
 def registerLarchPlugin(): # must have a function with this name!
     return ('_xafs', { 'feffrunner': feffrunner,
+                       'feff_batch': feff_batch,
                        'feff6l': _feff6l,
                        'feff8l': _feff8l})
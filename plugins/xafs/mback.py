@@ -1,15 +1,100 @@
+import hashlib
+from collections import OrderedDict
 from lmfit import Parameter, Parameters, minimize
 
-from larch import Group, isgroup, parse_group_args
+from larch import isgroup, parse_group_args
 
-from larch.utils import index_of
+from larch.utils import index_of, LRUCache
 from larch_plugins.xray import xray_edge, xray_line, f1_chantler, f2_chantler, f1f2
 from larch_plugins.xafs import set_xafsGroup, find_e0, preedge
+from larch_plugins.xafs.pre_edge import preedge_stack
 
 import numpy as np
 from scipy.special import erfc
 
 MAXORDER = 6
+MBACK_CACHE_SIZE = 64  # number of tabulated f1/f2 curves to cache
+
+_mback_cache = LRUCache(MBACK_CACHE_SIZE)
+
+def clear_mback_cache():
+    """clear cache of tabulated f1/f2 curves used by mback"""
+    _mback_cache.clear()
+
+def mback_tables(z, energy, edge='K', tables='chantler', _larch=None):
+    """
+    return tabulated f1(E), f2(E), edge energy, erfc centroid and (for
+    L edges) L2 edge energy for an absorber, as used by mback.
+
+    Results are cached for each (z, edge, tables, energy grid), so that
+    these need to be looked up only once for a series of spectra.  The
+    returned arrays should not be modified.
+    """
+    energy = np.ascontiguousarray(energy, dtype='float64')
+    key = (z, edge.upper(), tables.lower(), len(energy),
+           hashlib.sha1(energy.tobytes()).hexdigest())
+    out = _mback_cache.get(key)
+    if out is not None:
+        return out
+
+    if tables.lower() == 'chantler':
+        f1 = f1_chantler(z, energy, _larch=_larch)
+        f2 = f2_chantler(z, energy, _larch=_larch)
+    else:
+        (f1, f2) = f1f2(z, energy, edge=edge, _larch=_larch)
+    e0 = xray_edge(z, edge, _larch=_larch)[0]
+    em = xray_line(z, edge.upper(), _larch=_larch)[0] # erfc centroid
+    l2 = None
+    if edge.lower().startswith('l'):
+        l2 = xray_edge(z, 'L2', _larch=_larch)[0]
+    out = (np.asarray(f1), np.asarray(f2), e0, em, l2)
+    _mback_cache.put(key, out)
+    return out
+
+def mback_weights(energy, e0, emin=None, emax=None, whiteline=None,
+                  edge='K', l2=None):
+    """
+    return theta, the array used to exclude energy regions from the
+    MBACK fit, and weight, the array for weighting pre- and post-edge
+    regions, as defined in the MBACK paper.
+    """
+    ### theta is an array used to exclude the regions <emin, >emax, and
+    ### around white lines, theta=0.0 in excluded regions, theta=1.0 elsewhere
+    (i1, i2) = (0, len(energy)-1)
+    if emin is not None: i1 = index_of(energy, emin)
+    if emax is not None: i2 = index_of(energy, emax)
+    theta = np.ones(len(energy)) # default: 1 throughout
+    theta[0:i1]  = 0
+    theta[i2:-1] = 0
+    if whiteline:
+        pre     = 1.0*(energy<e0)
+        post    = 1.0*(energy>e0+float(whiteline))
+        theta   = theta * (pre + post)
+    if edge.lower().startswith('l'):
+        l2_pre  = 1.0*(energy<l2)
+        l2_post = 1.0*(energy>l2+float(whiteline))
+        theta   = theta * (l2_pre + l2_post)
+
+    ## this is used to weight the pre- and post-edge differently as
+    ## defined in the MBACK paper
+    weight1 = 1*(energy<e0)
+    weight2 = 1*(energy>e0)
+    weight  = np.sqrt(sum(weight1))*weight1 + np.sqrt(sum(weight2))*weight2
+    ## a point at exactly e0 has no weight: exclude it
+    theta[weight == 0] = 0
+    weight[weight == 0] = 1
+    return theta, weight
+
+def norm_function(energy, e0, em, opars, order):
+    """evaluate erfc and polynomial from MBACK parameter values"""
+    eoff = energy - e0
+    out = opars['a']*erfc((energy-em)/opars['xi']) + opars['c0']
+    for i in range(order):
+        j = i+1
+        attr = 'c%d' % j
+        if attr in opars:
+            out  += opars[attr]* eoff**j
+    return out
 
 def match_f2(p, en=0, mu=1, f2=1, e0=0, em=0, weight=1, theta=1, order=None,
              leexiang=False):
@@ -32,6 +117,52 @@ def match_f2(p, en=0, mu=1, f2=1, e0=0, em=0, weight=1, theta=1, order=None,
     return func
 
 
+def _mback_minimize(energy, mu, f2, e0, em, order, weight, theta,
+                    leexiang=False, fit_erfc=False):
+    """match one mu(E) spectrum to f2 with lmfit, returning parameter values"""
+    params = Parameters()
+    params.add(name='s',  value=1,  vary=True)  # scale of data
+    params.add(name='xi', value=50, vary=fit_erfc, min=0) # width of erfc
+    params.add(name='a',  value=0,   vary=False)  # amplitude of erfc
+    if fit_erfc:
+        params['a'].value = 1
+        params['a'].vary  = True
+
+    for i in range(order): # polynomial coefficients
+        params.add(name='c%d' % i, value=0, vary=True)
+
+    out = minimize(match_f2, params, method='leastsq',
+                   gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
+                   kws = dict(en=energy, mu=mu, f2=f2, e0=e0, em=em,
+                              order=order, weight=weight, theta=theta, leexiang=leexiang))
+    return out.params.valuesdict()
+
+def _mback_linear(energy, mus, f2, e0, order, weight, theta):
+    """
+    match a stack of mu(E) spectra (nspectra, npts) to f2 with a fixed erfc
+    amplitude of 0, for which the MBACK objective is linear in the scale
+    and polynomial coefficients.  The polynomial part of the design matrix
+    is shared by all spectra, and is factored only once.
+    """
+    wt = theta / weight
+    eoff = energy - e0
+    # polynomial terms c0 .. c(order-1), as in match_f2()
+    amat = np.array([eoff**i for i in range(order)]).T * wt[:, np.newaxis]
+    qmat, rmat = np.linalg.qr(amat)
+    b = -f2 * wt
+    umat = (mus * wt).T
+    rb = b - qmat.dot(qmat.T.dot(b))
+    ru = umat - qmat.dot(qmat.T.dot(umat))
+    scale = -(ru*rb[:, np.newaxis]).sum(axis=0) / (ru*ru).sum(axis=0)
+    coefs = np.linalg.solve(rmat, qmat.T.dot(b[:, np.newaxis] + scale*umat))
+    out = []
+    for i, s in enumerate(scale):
+        opars = OrderedDict(s=s, xi=50.0, a=0.0)
+        for j in range(order):
+            opars['c%d' % j] = coefs[j, i]
+        out.append(opars)
+    return out
+
 def mback(energy, mu=None, group=None, order=3, z=None, edge='K', e0=None, emin=None, emax=None,
           whiteline=None, leexiang=False, tables='chantler', fit_erfc=False, return_f1=False,
           _larch=None):
@@ -81,83 +212,33 @@ def mback(energy, mu=None, group=None, order=3, z=None, edge='K', e0=None, emin=
 
     group = set_xafsGroup(group, _larch=_larch)
 
+    ## get the f'' function from CL or Chantler
+    f1, f2, e0_tab, em, l2 = mback_tables(z, energy, edge=edge, tables=tables,
+                                          _larch=_larch)
     if e0 is None:              # need to run find_e0:
-        e0 = xray_edge(z, edge, _larch=_larch)[0]
+        e0 = e0_tab
     if e0 is None:
         e0 = group.e0
     if e0 is None:
         find_e0(energy, mu, group=group)
 
 
-    ### theta is an array used to exclude the regions <emin, >emax, and
-    ### around white lines, theta=0.0 in excluded regions, theta=1.0 elsewhere
-    (i1, i2) = (0, len(energy)-1)
-    if emin is not None: i1 = index_of(energy, emin)
-    if emax is not None: i2 = index_of(energy, emax)
-    theta = np.ones(len(energy)) # default: 1 throughout
-    theta[0:i1]  = 0
-    theta[i2:-1] = 0
-    if whiteline:
-        pre     = 1.0*(energy<e0)
-        post    = 1.0*(energy>e0+float(whiteline))
-        theta   = theta * (pre + post)
-    if edge.lower().startswith('l'):
-        l2      = xray_edge(z, 'L2', _larch=_larch)[0]
-        l2_pre  = 1.0*(energy<l2)
-        l2_post = 1.0*(energy>l2+float(whiteline))
-        theta   = theta * (l2_pre + l2_post)
-
-
-    ## this is used to weight the pre- and post-edge differently as
-    ## defined in the MBACK paper
-    weight1 = 1*(energy<e0)
-    weight2 = 1*(energy>e0)
-    weight  = np.sqrt(sum(weight1))*weight1 + np.sqrt(sum(weight2))*weight2
-    ## get the f'' function from CL or Chantler
-    if tables.lower() == 'chantler':
-        f1 = f1_chantler(z, energy, _larch=_larch)
-        f2 = f2_chantler(z, energy, _larch=_larch)
-    else:
-        (f1, f2) = f1f2(z, energy, edge=edge, _larch=_larch)
-    group.f2=f2
+    theta, weight = mback_weights(energy, e0, emin=emin, emax=emax,
+                                  whiteline=whiteline, edge=edge, l2=l2)
+    group.f2 = f2.copy()
     if return_f1:
-        group.f1=f1
-
-    em = xray_line(z, edge.upper(), _larch=_larch)[0] # erfc centroid
+        group.f1 = f1.copy()
 
-    params = Parameters()
-    params.add(name='s',  value=1,  vary=True)  # scale of data
-    params.add(name='xi', value=50, vary=fit_erfc, min=0) # width of erfc
-    params.add(name='a',  value=0,   vary=False)  # amplitude of erfc
-    if fit_erfc:
-        params['a'].value = 1
-        params['a'].vary  = True
-
-    for i in range(order): # polynomial coefficients
-        params.add(name='c%d' % i, value=0, vary=True)
-
-    out = minimize(match_f2, params, method='leastsq',
-                   gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
-                   kws = dict(en=energy, mu=mu, f2=f2, e0=e0, em=em,
-                              order=order, weight=weight, theta=theta, leexiang=leexiang))
-
-    opars = out.params.valuesdict()
-    eoff = energy - e0
-
-    norm_function = opars['a']*erfc((energy-em)/opars['xi']) + opars['c0']
-    for i in range(order):
-        j = i+1
-        attr = 'c%d' % j
-        if attr in opars:
-            norm_function  += opars[attr]* eoff**j
+    opars = _mback_minimize(energy, mu, f2, e0, em, order, weight, theta,
+                            leexiang=leexiang, fit_erfc=fit_erfc)
+    norm_func = norm_function(energy, e0, em, opars, order)
 
     group.e0 = e0
-    group.fpp = opars['s']*mu - norm_function
+    group.fpp = opars['s']*mu - norm_func
     group.mback_params = opars
-    tmp = Group(energy=energy, mu=group.f2-norm_function, e0=0)
 
     # calculate edge step from f2 + norm_function: should be very smooth
-    pre_f2 = preedge(energy, group.f2+norm_function, e0=e0, nnorm=2, nvict=0)
+    pre_f2 = preedge(energy, group.f2+norm_func, e0=e0, nnorm=2, nvict=0)
     group.edge_step = pre_f2['edge_step'] / opars['s']
 
     pre_fpp = preedge(energy, mu, e0=e0, nnorm=2, nvict=0)
@@ -165,5 +246,84 @@ def mback(energy, mu=None, group=None, order=3, z=None, edge='K', e0=None, emin=
     group.norm = (mu -  pre_fpp['pre_edge']) / group.edge_step
 
 
+def mback_batch(energy, mu=None, group=None, order=3, z=None, edge='K', e0=None,
+                emin=None, emax=None, whiteline=None, leexiang=False,
+                tables='chantler', fit_erfc=False, return_f1=False, _larch=None):
+    """
+    Match a series of mu(E) spectra of the same absorber, on a common
+    energy grid, to tabulated f''(E) using the MBACK algorithm.
+
+    Arguments:
+      energy:        1-d array of energy, or group with 'energy' and 'mu'
+      mu:            2-d array of mu(E), (nspectra, npts)
+      group:         output group
+
+      other arguments are as for mback().
+
+    Returns:
+      group.f2:      tabulated f2(E)
+      group.f1:      tabulated f1(E) (if return_f1 is True)
+      group.fpp:     2-d array of matched data
+      group.norm:    2-d array of normalized mu(E)
+      group.edge_step: 1-d array of edge steps
+      group.mback_params:  list of parameter values for each spectrum
+
+    Notes:
+      Without the Lee & Xiang extension or a fitted error function, the
+      match is a linear least-squares problem, and all spectra are solved
+      together using the same design matrix.  Otherwise, each spectrum
+      is fit in turn, sharing the tabulated f2(E) and weights.
+    """
+    order=int(order)
+    if order < 1: order = 1 # set order of polynomial
+    if order > MAXORDER: order = MAXORDER
+
+    energy, mu, group = parse_group_args(energy, members=('energy', 'mu'),
+                                         defaults=(mu,), group=group,
+                                         fcn_name='mback_batch')
+    energy = np.asarray(energy).squeeze()
+    mu = np.atleast_2d(mu)
+
+    group = set_xafsGroup(group, _larch=_larch)
+
+    f1, f2, e0_tab, em, l2 = mback_tables(z, energy, edge=edge, tables=tables,
+                                          _larch=_larch)
+    if e0 is None:
+        e0 = e0_tab
+    if e0 is None:
+        e0 = getattr(group, 'e0', None)
+    if e0 is None:
+        raise ValueError("mback_batch needs e0 or z")
+
+    theta, weight = mback_weights(energy, e0, emin=emin, emax=emax,
+                                  whiteline=whiteline, edge=edge, l2=l2)
+
+    if leexiang or fit_erfc:
+        params = [_mback_minimize(energy, m, f2, e0, em, order, weight, theta,
+                                  leexiang=leexiang, fit_erfc=fit_erfc)
+                  for m in mu]
+    else:
+        params = _mback_linear(energy, mu, f2, e0, order, weight, theta)
+
+    norm_funcs = np.array([norm_function(energy, e0, em, p, order)
+                           for p in params])
+    scale = np.array([p['s'] for p in params])
+
+    group.e0 = e0
+    group.f2 = f2.copy()
+    if return_f1:
+        group.f1 = f1.copy()
+    group.fpp = scale[:, np.newaxis]*mu - norm_funcs
+    group.mback_params = params
+
+    pre_f2 = preedge_stack(energy, f2 + norm_funcs, e0=e0, nnorm=2, nvict=0,
+                           make_flat=False)
+    group.edge_step = pre_f2['edge_step'] / scale
+    pre_fpp = preedge_stack(energy, mu, e0=e0, nnorm=2, nvict=0,
+                            make_flat=False)
+    group.norm = (mu - pre_fpp['pre_edge']) / group.edge_step[:, np.newaxis]
+
 def registerLarchPlugin(): # must have a function with this name!
-    return ('_xafs', { 'mback': mback })
+    return ('_xafs', { 'mback': mback,
+                       'mback_batch': mback_batch,
+                       'clear_mback_cache': clear_mback_cache})
@@ -52,22 +52,52 @@ def find_e0(energy, mu=None, group=None, _larch=None):
         mu = mu.squeeze()
 
     energy = remove_dups(energy)
-    dmu = np.gradient(mu)/np.gradient(energy)
-    # find points of high derivative
-    high_deriv_pts = np.where(dmu >  max(dmu)*0.05)[0]
-    idmu_max, dmu_max = 0, 0
-    for i in high_deriv_pts:
-        if (dmu[i] > dmu_max and
-            (i+1 in high_deriv_pts) and
-            (i-1 in high_deriv_pts)):
-            idmu_max, dmu_max = i, dmu[i]
-
-    e0 = energy[idmu_max]
+    e0 = energy[e0_index(energy, mu)]
     if group is not None:
         group = set_xafsGroup(group, _larch=_larch)
         group.e0 = e0
     return e0
 
+def e0_index(energy, mu):
+    """index of E0 in energy for mu(energy), a 1-d array or a 2-d
+    array with one spectrum per row (returning an array of indices).
+
+    E0 is the point of maximum derivative among points with derivative
+    above 5% of the maximum whose neighbors on both sides also are.
+    """
+    dmu = np.gradient(mu, axis=-1)/np.gradient(energy)
+    high = dmu > 0.05*dmu.max(axis=-1)[..., np.newaxis]
+    ok = np.zeros(high.shape, dtype=bool)
+    ok[..., 1:-1] = high[..., 1:-1] & high[..., :-2] & high[..., 2:]
+    dmu = np.where(ok & (dmu > 0), dmu, -np.inf)
+    index = dmu.argmax(axis=-1)
+    return np.where(np.isfinite(dmu.max(axis=-1)), index, 0)
+
+def preedge_ranges(energy, e0, pre1=None, pre2=-50, norm1=100, norm2=None):
+    """check pre-edge and post-edge fit ranges relative to e0,
+    returning (pre1, pre2, norm1, norm2) and the index ranges of
+    energy for the pre-edge and post-edge fits"""
+    if pre1 is None:  pre1  = min(energy) - e0
+    if norm2 is None: norm2 = max(energy) - e0
+    if norm2 < 0:     norm2 = max(energy) - e0 - norm2
+    pre1  = max(pre1,  (min(energy) - e0))
+    norm2 = min(norm2, (max(energy) - e0))
+
+    if pre1 > pre2:
+        pre1, pre2 = pre2, pre1
+    if norm1 > norm2:
+        norm1, norm2 = norm2, norm1
+
+    p1 = index_of(energy, pre1+e0)
+    p2 = index_nearest(energy, pre2+e0)
+    if p2-p1 < 2:
+        p2 = min(len(energy), p1 + 2)
+    n1 = index_of(energy, norm1+e0)
+    n2 = index_nearest(energy, norm2+e0)
+    if n2-n1 < 2:
+        n2 = min(len(energy), n1 + 2)
+    return (pre1, pre2, norm1, norm2), (p1, p2), (n1, n2)
+
 def flat_resid(pars, en, mu):
     return (pars['c0'] + en * (pars['c1'] + en * pars['c2']) - mu)
 
@@ -119,48 +149,22 @@ def preedge(energy, mu, e0=None, step=None,
 
     if e0 is None or e0 < energy[0] or e0 > energy[-1]:
         energy = remove_dups(energy)
-        dmu = np.gradient(mu)/np.gradient(energy)
-        # find points of high derivative
-        high_deriv_pts = np.where(dmu >  max(dmu)*0.05)[0]
-        idmu_max, dmu_max = 0, 0
-        for i in high_deriv_pts:
-            if (dmu[i] > dmu_max and
-                (i+1 in high_deriv_pts) and
-                (i-1 in high_deriv_pts)):
-                idmu_max, dmu_max = i, dmu[i]
-
-        e0 = energy[idmu_max]
+        e0 = energy[e0_index(energy, mu)]
     nnorm = max(min(nnorm, MAX_NNORM), 0)
     ie0 = index_nearest(energy, e0)
     e0 = energy[ie0]
 
-    if pre1 is None:  pre1  = min(energy) - e0
-    if norm2 is None: norm2 = max(energy) - e0
-    if norm2 < 0:     norm2 = max(energy) - e0 - norm2
-    pre1  = max(pre1,  (min(energy) - e0))
-    norm2 = min(norm2, (max(energy) - e0))
-
-    if pre1 > pre2:
-        pre1, pre2 = pre2, pre1
-    if norm1 > norm2:
-        norm1, norm2 = norm2, norm1
-
-    p1 = index_of(energy, pre1+e0)
-    p2 = index_nearest(energy, pre2+e0)
-    if p2-p1 < 2:
-        p2 = min(len(energy), p1 + 2)
+    ranges, (p1, p2), (n1, n2) = preedge_ranges(energy, e0, pre1=pre1,
+                                                pre2=pre2, norm1=norm1,
+                                                norm2=norm2)
+    pre1, pre2, norm1, norm2 = ranges
 
     omu  = mu*energy**nvict
     ex, mx = remove_nans2(energy[p1:p2], omu[p1:p2])
     precoefs = polyfit(ex, mx, 1)
     pre_edge = (precoefs[0] * energy + precoefs[1]) * energy**(-nvict)
     # normalization
-    p1 = index_of(energy, norm1+e0)
-    p2 = index_nearest(energy, norm2+e0)
-    if p2-p1 < 2:
-        p2 = min(len(energy), p1 + 2)
-
-    coefs = polyfit(energy[p1:p2], omu[p1:p2], nnorm)
+    coefs = polyfit(energy[n1:n2], omu[n1:n2], nnorm)
     post_edge = 0
     norm_coefs = []
     for n, c in enumerate(reversed(list(coefs))):
@@ -179,6 +183,154 @@ def preedge(energy, mu, e0=None, step=None,
 
     return out
 
+def preedge_stack(energy, mu, e0=None, step=None, nnorm=3, nvict=0,
+                  pre1=None, pre2=-50, norm1=100, norm2=None,
+                  make_flat=True):
+    """pre edge subtraction, normalization for a stack of XAFS spectra
+    on a common energy grid (straight python)
+
+    This gives the same results as preedge() for each spectrum, but the
+    pre-edge and post-edge polynomials for all spectra with the same E0
+    are found with a single least-squares solution.
+
+    Arguments
+    ----------
+    energy:  1-d array of x-ray energies, in eV
+    mu:      2-d array of mu(E), (nspectra, npts)
+    e0:      edge energy, in eV, or array of edge energies for each
+             spectrum.  If None, it will be determined for each spectrum.
+    step:    edge jump, or array of edge jumps for each spectrum.
+             If None, it will be determined here.
+    make_flat: whether to calculate flattened spectra [True]
+
+    other arguments are as for preedge().
+
+    Returns
+    -------
+      dictionary with elements
+          e0          1-d array of energy origin in eV
+          edge_step   1-d array of edge steps
+          norm        2-d array of normalized mu(E)
+          flat        2-d array of flattened, normalized mu(E)
+          pre_edge    2-d array of pre-edge curves
+          post_edge   2-d array of post-edge, normalization curves
+          pre_slope   1-d array of pre-edge slopes
+          pre_offset  1-d array of pre-edge offsets
+          norm_coefs  2-d array (nnorm+1, nspectra) of post-edge coefficients
+    """
+    energy = remove_dups(energy)
+    mu = np.atleast_2d(mu)
+    nspec = mu.shape[0]
+    nnorm = max(min(nnorm, MAX_NNORM), 0)
+
+    if e0 is None:
+        ie0 = e0_index(energy, mu)
+    else:
+        e0 = e0*np.ones(nspec)
+        ie0 = abs(energy - e0[:, np.newaxis]).argmin(axis=1)
+        bad = np.where((e0 < energy[0]) | (e0 > energy[-1]))[0]
+        if len(bad) > 0:
+            ie0[bad] = e0_index(energy, mu[bad])
+
+    omu = mu*energy**nvict
+    pre_edge = np.zeros(mu.shape)
+    post_edge = np.zeros(mu.shape)
+    precoefs = np.zeros((2, nspec))
+    norm_coefs = np.zeros((nnorm+1, nspec))
+    flat_rows = np.zeros(nspec, dtype=bool)
+    # spectra with the same e0 share fit ranges, and so can be fit together
+    for i0 in np.unique(ie0):
+        rows = np.where(ie0 == i0)[0]
+        _, (p1, p2), (n1, n2) = preedge_ranges(energy, energy[i0],
+                                               pre1=pre1, pre2=pre2,
+                                               norm1=norm1, norm2=norm2)
+        coefs = np.polyfit(energy[p1:p2], omu[rows, p1:p2].T, 1)
+        precoefs[:, rows] = coefs
+        pre_edge[rows] = np.outer(coefs[0], energy) + coefs[1][:, np.newaxis]
+
+        coefs = np.polyfit(energy[n1:n2], omu[rows, n1:n2].T, nnorm)[::-1]
+        norm_coefs[:, rows] = coefs
+        post_edge[rows] = np.dot(coefs.T, energy**np.arange(nnorm+1)[:, np.newaxis])
+
+        if make_flat and n2-n1 > 4:
+            flat_rows[rows] = True
+    pre_edge *= energy**(-nvict)
+    post_edge *= energy**(-nvict)
+
+    irows = np.arange(nspec)
+    edge_step = step
+    if edge_step is None:
+        edge_step = post_edge[irows, ie0] - pre_edge[irows, ie0]
+    edge_step = edge_step*np.ones(nspec)
+    norm = (mu - pre_edge)/edge_step[:, np.newaxis]
+
+    flat = norm.copy()
+    for i0 in np.unique(ie0[flat_rows]):
+        rows = np.where((ie0 == i0) & flat_rows)[0]
+        _, (p1, p2), (n1, n2) = preedge_ranges(energy, energy[i0],
+                                               pre1=pre1, pre2=pre2,
+                                               norm1=norm1, norm2=norm2)
+        coefs = np.polyfit(energy[n1:n2], norm[rows, n1:n2].T, 2)
+        fdiff = np.dot(coefs.T, energy**np.arange(2, -1, -1)[:, np.newaxis])
+        flat[rows] = norm[rows] - fdiff + fdiff[:, i0:i0+1]
+        flat[rows, :i0] = norm[rows, :i0]
+
+    return {'e0': energy[ie0], 'edge_step': edge_step, 'norm': norm,
+            'flat': flat, 'pre_edge': pre_edge, 'post_edge': post_edge,
+            'pre_slope': precoefs[0], 'pre_offset': precoefs[1],
+            'norm_coefs': norm_coefs, 'nnorm': nnorm, 'nvict': nvict}
+
+@ValidateLarchPlugin
+def pre_edge_stack(energy, mu=None, group=None, e0=None, step=None,
+                   nnorm=3, nvict=0, pre1=None, pre2=-50,
+                   norm1=100, norm2=None, make_flat=True, _larch=None):
+    """pre edge subtraction, normalization for a stack of XAFS spectra
+    on a common energy grid, such as from a XANES map.
+
+    Arguments
+    ----------
+    energy:  1-d array of x-ray energies, in eV, or group (see note)
+    mu:      2-d array of mu(E), (nspectra, npts)
+    group:   output group
+    e0:      edge energy, in eV, or array of values for each spectrum.
+             If None, it will be determined for each spectrum.
+    step:    edge jump, or array of values for each spectrum.
+             If None, it will be determined for each spectrum.
+
+    other arguments are as for pre_edge().
+
+    Returns
+    -------
+      None
+
+    The following attributes will be written to the output group:
+        e0          1-d array of energy origins
+        edge_step   1-d array of edge steps
+        norm        2-d array of normalized mu(E)
+        flat        2-d array of flattened, normalized mu(E)
+        pre_edge    2-d array of pre-edge curves
+        post_edge   2-d array of post-edge, normalization curves
+
+    (if the output group is None, _sys.xafsGroup will be written to)
+
+    Notes
+    -----
+     1 The results are those of pre_edge() for each spectrum, except that
+       the flattened spectra use a linear least-squares fit.  All spectra
+       with the same E0 are fit together.
+     2 If the first argument is a Group, it must contain 'energy' and 'mu'.
+    """
+    energy, mu, group = parse_group_args(energy, members=('energy', 'mu'),
+                                         defaults=(mu,), group=group,
+                                         fcn_name='pre_edge_stack')
+    pre_dat = preedge_stack(energy, mu, e0=e0, step=step, nnorm=nnorm,
+                            nvict=nvict, pre1=pre1, pre2=pre2, norm1=norm1,
+                            norm2=norm2, make_flat=make_flat)
+
+    group = set_xafsGroup(group, _larch=_larch)
+    for attr in ('e0', 'edge_step', 'norm', 'flat', 'pre_edge', 'post_edge'):
+        setattr(group, attr, pre_dat[attr])
+
 @ValidateLarchPlugin
 @Make_CallArgs(["energy","mu"])
 def pre_edge(energy, mu=None, group=None, e0=None, step=None,
@@ -312,4 +464,5 @@ def pre_edge(energy, mu=None, group=None, e0=None, step=None,
 
 def registerLarchPlugin():
     return (MODNAME, {'find_e0': find_e0,
-                      'pre_edge': pre_edge})
+                      'pre_edge': pre_edge,
+                      'pre_edge_stack': pre_edge_stack})
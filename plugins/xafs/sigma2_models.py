@@ -5,6 +5,7 @@ import ctypes
 import numpy as np
 from larch import ValidateLarchPlugin
 from larch.larchlib import get_dll
+from larch.utils import LRUCache
 
 from larch_plugins.xray import atomic_mass
 import scipy.constants as consts
@@ -16,6 +17,20 @@ EINS_FACTOR = 1.e20*consts.hbar**2/(2*consts.k*consts.atomic_mass)
 
 FEFF6LIB = None
 
+# constants for the correlated Debye model, as used by feff6: see corrfn()
+CORRDEBYE_CONH = 72.7630804732553
+CORRDEBYE_CONR = 4.5693349700844
+
+# number of Gauss-Legendre points for the vectorized Debye integral
+DEBYE_NQUAD = 64
+
+# cache of sigma2 for the correlated Debye model, for each path geometry
+# and Debye temperature, holding values for the most recent temperatures
+SIGMA2_CACHE_SIZE = 1024
+SIGMA2_CACHE_NTEMPS = 32
+_sigma2_cache = LRUCache(SIGMA2_CACHE_SIZE)
+_sigma2_temps = LRUCache(SIGMA2_CACHE_SIZE)
+
 @ValidateLarchPlugin
 def sigma2_eins(t, theta, path=None, _larch=None):
     """calculate sigma2 for a Feff Path wih the einstein model
@@ -84,20 +99,127 @@ def sigma2_debye(t, theta, path=None, _larch=None):
     if theta < 1.e-5: theta = 1.e-5
     if t < 1.e-5:     t = 1.e-5
 
-    tempk  = float(t)
-    thetad = float(theta)
+    return sigma2_debye_cached(feffpath, t, theta)
 
-    natoms = len(feffpath.geom)
-    rnorm  = feffpath.rnorman
-    atomx, atomy, atomz, atomm = [], [], [], []
-    for sym, iz, ipot, am, x, y, z in feffpath.geom:
-        atomx.append(x)
-        atomy.append(y)
-        atomz.append(z)
-        atomm.append(am)
+def _feffdat_list(paths):
+    """list of Feff.dat data (with geom and rnorman) for a list
+    of FeffPathGroups, a FeffPathStack, or a single path"""
+    paths = getattr(paths, 'pathlist', paths)
+    if not isinstance(paths, (list, tuple)):
+        paths = [paths]
+    return [getattr(p, '_feffdat', p) for p in paths]
 
-    return sigma2_correldebye(natoms, tempk, thetad, rnorm,
-                              atomx, atomy, atomz, atomm)
+def sigma2_eins_table(paths, temps, theta):
+    """calculate sigma2 with the Einstein model for many paths
+    and temperatures at once
+
+    Parameters:
+    -----------
+      paths    list of FeffPaths (or a FeffPathStack)
+      temps    sample temperatures (in K)
+      theta    Einstein temperature (in K), a scalar or an array
+               with one value per path
+
+    Returns:
+    --------
+      2-d array of sigma2 (npaths, ntemps)
+    """
+    feffdats = _feffdat_list(paths)
+    temps = np.maximum(np.atleast_1d(np.asarray(temps, dtype='float64')), 1.e-5)
+    theta = np.maximum(theta*np.ones(len(feffdats)), 1.e-5)[:, np.newaxis]
+    rmass = np.array([1.0/max(1.e-12, sum([1.0/max(0.1, g[3]) for g in fdat.geom]))
+                      for fdat in feffdats])[:, np.newaxis]
+    return EINS_FACTOR/(theta * rmass * np.tanh(theta/(2.0*temps)))
+
+def sigma2_correldebye_table(paths, temps, theta):
+    """calculate sigma2 with the correlated Debye model for many
+    paths and temperatures at once
+
+    Parameters:
+    -----------
+      paths    list of FeffPaths (or a FeffPathStack)
+      temps    sample temperatures (in K)
+      theta    Debye temperature (in K), a scalar or an array
+               with one value per path
+
+    Returns:
+    --------
+      2-d array of sigma2 (npaths, ntemps)
+
+    Notes:
+      This is a numpy version of sigma2_correldebye_py(), with the
+      Debye integrals for all atom pairs of all paths and all
+      temperatures evaluated together by Gauss-Legendre quadrature.
+    """
+    feffdats = _feffdat_list(paths)
+    npaths = len(feffdats)
+    temps = np.maximum(np.atleast_1d(np.asarray(temps, dtype='float64')), 1.e-5)
+    theta = np.maximum(theta*np.ones(npaths), 1.e-5)
+
+    # for each pair of legs (i0->i1, j0->j1) of each path, find the
+    # four atom pair distances, their reduced masses, and their weights
+    # (+/-ridotj/(ri0i1*rj0j1)) in the sum for sigma2
+    dists, masses, weights, ipaths = [], [], [], []
+    for ipath, fdat in enumerate(feffdats):
+        pos  = np.array([g[4:7] for g in fdat.geom], dtype='float64')
+        mass = np.array([g[3] for g in fdat.geom], dtype='float64')
+        natoms = len(pos)
+        i0, j0 = np.triu_indices(natoms)
+        i1, j1 = (i0 + 1) % natoms, (j0 + 1) % natoms
+        leg_i, leg_j = pos[i0] - pos[i1], pos[j0] - pos[j1]
+        weight = ((leg_i*leg_j).sum(axis=1) /
+                  np.sqrt((leg_i**2).sum(axis=1) * (leg_j**2).sum(axis=1)))
+        weight[np.where(i0 == j0)] /= 2.0
+        for a, b, sign in ((i0, j0, 1), (i1, j1, 1), (i0, j1, -1), (i1, j0, -1)):
+            dists.append(np.sqrt(((pos[a] - pos[b])**2).sum(axis=1)))
+            masses.append(np.sqrt(mass[a]*mass[b]))
+            weights.append(sign*weight)
+            ipaths.append(ipath*np.ones(len(a), dtype='int'))
+
+    dists, masses = np.concatenate(dists), np.concatenate(masses)
+    weights, ipaths = np.concatenate(weights), np.concatenate(ipaths)
+    rnorm = np.array([fdat.rnorman for fdat in feffdats])[ipaths]
+    thetas = theta[ipaths]
+
+    rx = (CORRDEBYE_CONR * dists / rnorm)[:, np.newaxis]
+    tx = thetas[:, np.newaxis] / temps
+    corr = CORRDEBYE_CONH * debint_array(rx, tx) / (thetas*masses)[:, np.newaxis]
+
+    sig2 = np.zeros((npaths, len(temps)))
+    np.add.at(sig2, ipaths, weights[:, np.newaxis]*corr)
+    return sig2/2.0
+
+def sigma2_debye_cached(feffpath, t, theta):
+    """sigma2 with the correlated Debye model for one Feff path,
+    using a cache of values for its geometry and Debye temperature.
+
+    On a cache miss, the values for the most recently used temperatures
+    for this geometry are calculated together, so that multi-temperature
+    fits need one call to sigma2_correldebye_table() for each path and
+    Debye temperature.
+    """
+    feffpath = getattr(feffpath, '_feffdat', feffpath)
+    t = max(float(t), 1.e-5)
+    theta = max(float(theta), 1.e-5)
+    gkey = (feffpath.rnorman, tuple([tuple(g[3:7]) for g in feffpath.geom]))
+    key = (gkey, theta)
+    row = _sigma2_cache.get(key)
+    if row is None or t not in row:
+        temps = _sigma2_temps.get(gkey)
+        if temps is None:
+            temps = LRUCache(SIGMA2_CACHE_NTEMPS)
+            _sigma2_temps.put(gkey, temps)
+        temps.put(t, True)
+        temps = temps.keys()
+        vals = sigma2_correldebye_table([feffpath], temps, theta)[0]
+        row = dict(zip(temps, vals))
+        _sigma2_cache.put(key, row)
+    return row[t]
+
+def clear_sigma2_cache():
+    """clear cache of correlated Debye sigma2 values"""
+    _sigma2_cache.clear()
+    _sigma2_temps.clear()
 
 def sigma2_correldebye(natoms, tk, theta, rnorm, x, y, z, atwt):
     """
@@ -252,8 +374,8 @@ def corrfn(rij, theta, tk, am1, am2, rs):
     NOTE: for backward compatibility, the constants used by feff6 are
     retained, even though some have been refined later.
     """
-    conh = 72.7630804732553
-    conr = 4.5693349700844
+    conh = CORRDEBYE_CONH
+    conr = CORRDEBYE_CONR
 
     # theta in degrees k, t temperature in degrees k
     rx     = conr  * rij / rs
@@ -321,6 +443,23 @@ def debint(rx, tx):
         bo = result
     return result
 
+def debint_array(rx, tx):
+    """vectorized version of debint(), integrating debfun() over
+    [0, 1] by Gauss-Legendre quadrature with DEBYE_NQUAD points,
+    for arrays rx and tx, which are broadcast together.
+    """
+    nodes, wts = np.polynomial.legendre.leggauss(DEBYE_NQUAD)
+    w  = (nodes + 1)/2.0
+    rx = np.asarray(rx, dtype='float64')[..., np.newaxis]
+    tx = np.asarray(tx, dtype='float64')[..., np.newaxis]
+    rxsafe = np.where(rx > 0, rx, 1.0)
+    fsin = np.where(rx > 0, np.sin(w*rx)/rxsafe, w)
+    emwt = np.exp(-np.minimum(w*tx, 50.0))
+    return (fsin * (1 + emwt)/(1 - emwt)).dot(wts/2.0)
+
 def registerLarchPlugin():
     return ('_xafs', {'sigma2_eins': sigma2_eins,
-                      'sigma2_debye': sigma2_debye})
+                      'sigma2_debye': sigma2_debye,
+                      'sigma2_eins_table': sigma2_eins_table,
+                      'sigma2_debye_table': sigma2_correldebye_table,
+                      'clear_sigma2_cache': clear_sigma2_cache})
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+  Batch processing of many XAFS spectra with process or thread pools
+"""
+import threading
+import numpy as np
+
+from larch import (Group, Interpreter, ValidateLarchPlugin, isgroup)
+from larch.utils import run_parallel
+
+from larch_plugins.xafs import set_xafsGroup, pre_edge, autobk
+
+MODNAME = '_xafs'
+
+_worker = threading.local()
+
+def worker_larch():
+    """return a Larch Interpreter (without plugins) for the current
+    worker thread or process, creating it on first use.
+
+    Plugin functions run by pool workers should use this instead of
+    sharing the caller's interpreter, as they write to _sys.xafsGroup.
+    """
+    _larch = getattr(_worker, 'larch', None)
+    if _larch is None:
+        _larch = _worker.larch = Interpreter(with_plugins=False)
+    return _larch
+
+def batch_spectra(energy, mu=None):
+    """return list of groups (or None) and list of (energy, mu) pairs
+    for a batch of spectra
+
+    Arguments
+    ---------
+    energy   1-d array of energies shared by all spectra, 2-d array
+             or list of energy arrays (one per spectrum), or list
+             of groups, each with 'energy' and 'mu'.
+    mu       2-d array (nspectra, npts) or list of mu arrays.
+             Ignored if energy is a list of groups.
+    """
+    if (isinstance(energy, (list, tuple)) and len(energy) > 0 and
+        all([isgroup(g, 'energy', 'mu') for g in energy])):
+        groups = list(energy)
+        return groups, [(g.energy, g.mu) for g in groups]
+
+    if mu is None:
+        raise Warning("batch processing needs energy and mu arrays or a list of groups")
+    if isinstance(mu, np.ndarray) and mu.ndim == 1:
+        mu = [mu]
+    if isinstance(energy, np.ndarray) and energy.ndim == 1:
+        spectra = [(energy, m) for m in mu]
+    else:
+        if len(energy) != len(mu):
+            raise Warning("batch processing needs one energy array per spectrum")
+        spectra = list(zip(energy, mu))
+    return None, spectra
+
+def stack_arrays(arrays, fill=0.0):
+    """stack a list of 1-d arrays into a 2-d array (narrays, npts),
+    padding shorter arrays with fill"""
+    npts = max([len(a) for a in arrays])
+    out = fill * np.ones((len(arrays), npts))
+    for i, arr in enumerate(arrays):
+        out[i, :len(arr)] = arr
+    return out
+
+def _task_error(exc):
+    "error message for a failed task"
+    return '%s: %s' % (exc.__class__.__name__, exc)
+
+def _pre_edge_task(args):
+    energy, mu, kws = args
+    grp = Group()
+    try:
+        pre_edge(energy, mu, group=grp, _larch=worker_larch(), **kws)
+    except Exception as exc:
+        nans = np.nan*np.ones(len(mu))
+        return (np.nan, np.nan, nans, nans, nans, nans, _task_error(exc))
+    return (grp.e0, grp.edge_step, grp.norm, grp.flat,
+            grp.pre_edge, grp.post_edge, None)
+
+def _autobk_task(args):
+    energy, mu, kws = args
+    grp = Group()
+    error = 'autobk() did not calculate chi(k)'
+    try:
+        autobk(energy, mu, group=grp, _larch=worker_larch(), **kws)
+    except Exception as exc:
+        error = _task_error(exc)
+    if not hasattr(grp, 'chi'):
+        return (np.nan, np.nan, np.zeros(0), np.zeros(0),
+                np.nan*np.ones(len(mu)), error)
+    return (grp.e0, grp.edge_step, grp.k, grp.chi, grp.bkg, None)
+
+@ValidateLarchPlugin
+def pre_edge_batch(energy, mu=None, group=None, nworkers=None,
+                   processes=True, chunksize=None, _larch=None, **kws):
+    """pre-edge subtraction and normalization for a batch of spectra,
+    run in a pool of worker processes or threads.
+
+    Arguments
+    ----------
+    energy:     1-d array of energies shared by all spectra, 2-d array or
+                list of energy arrays, or list of groups with 'energy' and 'mu'
+    mu:         2-d array of mu(E) (nspectra, npts) or list of mu arrays
+    group:      output group
+    nworkers:   number of workers [None: number of CPUs]
+    processes:  use a pool of processes (True) or threads (False) [True]
+    chunksize:  number of spectra sent to each worker at a time [None: automatic]
+    kws:        other keyword arguments are passed to pre_edge()
+
+    Returns
+    -------
+      None
+
+    The following attributes will be written to the output group:
+        e0          1-d array of edge energies
+        edge_step   1-d array of edge steps
+        norm        2-d array of normalized mu(E)
+        flat        2-d array of flattened, normalized mu(E)
+        pre_edge    2-d array of pre-edge curves
+        post_edge   2-d array of post-edge curves
+        errors      list of error messages, None for each spectrum processed
+
+    Notes
+    -----
+     1 2-d outputs have one row per spectrum, padded with zeros if the
+       spectra have different lengths.
+     2 Spectra for which pre_edge() fails have e0 and edge_step set to
+       nan and rows of nan, and do not stop the rest of the batch.
+     3 If a list of groups is given, the results for each spectrum are
+       also written to its group.
+    """
+    groups, spectra = batch_spectra(energy, mu)
+    tasks = [(e, m, kws) for e, m in spectra]
+    out = run_parallel(_pre_edge_task, tasks, nworkers=nworkers,
+                       processes=processes, chunksize=chunksize)
+
+    if groups is not None:
+        for grp, res in zip(groups, out):
+            (grp.e0, grp.edge_step, grp.norm, grp.flat,
+             grp.pre_edge, grp.post_edge) = res[:6]
+
+    group = set_xafsGroup(group, _larch=_larch)
+    group.e0 = np.array([res[0] for res in out])
+    group.edge_step = np.array([res[1] for res in out])
+    group.norm = stack_arrays([res[2] for res in out])
+    group.flat = stack_arrays([res[3] for res in out])
+    group.pre_edge = stack_arrays([res[4] for res in out])
+    group.post_edge = stack_arrays([res[5] for res in out])
+    group.errors = [res[6] for res in out]
+
+@ValidateLarchPlugin
+def autobk_batch(energy, mu=None, group=None, nworkers=None,
+                 processes=True, chunksize=None, _larch=None, **kws):
+    """Autobk background removal for a batch of spectra,
+    run in a pool of worker processes or threads.
+
+    Arguments
+    ----------
+    energy:     1-d array of energies shared by all spectra, 2-d array or
+                list of energy arrays, or list of groups with 'energy' and 'mu'
+    mu:         2-d array of mu(E) (nspectra, npts) or list of mu arrays
+    group:      output group
+    nworkers:   number of workers [None: number of CPUs]
+    processes:  use a pool of processes (True) or threads (False) [True]
+    chunksize:  number of spectra sent to each worker at a time [None: automatic]
+    kws:        other keyword arguments are passed to autobk()
+
+    Returns
+    -------
+      None
+
+    The following attributes will be written to the output group:
+        e0          1-d array of edge energies
+        edge_step   1-d array of edge steps
+        k           1-d array of k, the longest of all output k arrays
+        chi         2-d array of chi(k)
+        bkg         2-d array of background mu0(E)
+        errors      list of error messages, None for each spectrum processed
+
+    Notes
+    -----
+     1 2-d outputs have one row per spectrum, padded with zeros if the
+       spectra have different lengths.
+     2 Spectra for which autobk() fails have e0 and edge_step set to nan,
+       rows of chi and bkg filled with nan, and an error message in
+       errors.  They do not stop the rest of the batch.
+     3 If a list of groups is given, the results for each spectrum are
+       also written to its group.
+    """
+    groups, spectra = batch_spectra(energy, mu)
+    tasks = [(e, m, kws) for e, m in spectra]
+    out = run_parallel(_autobk_task, tasks, nworkers=nworkers,
+                       processes=processes, chunksize=chunksize)
+
+    if groups is not None:
+        for grp, res in zip(groups, out):
+            grp.e0, grp.edge_step, grp.k, grp.chi, grp.bkg = res[:5]
+
+    group = set_xafsGroup(group, _larch=_larch)
+    group.e0 = np.array([res[0] for res in out])
+    group.edge_step = np.array([res[1] for res in out])
+    group.k = out[np.argmax([len(res[2]) for res in out])][2]
+    group.chi = stack_arrays([res[3] for res in out])
+    group.bkg = stack_arrays([res[4] for res in out])
+    group.errors = [res[5] for res in out]
+    for i, err in enumerate(group.errors):
+        if err is not None:
+            group.chi[i, :] = np.nan
+
+def registerLarchPlugin():
+    return (MODNAME, {'pre_edge_batch': pre_edge_batch,
+                      'autobk_batch': autobk_batch})
@@ -2,6 +2,7 @@
 """
   XAFS Fourier transforms
 """
+import hashlib
 import numpy as np
 from numpy import (pi, arange, zeros, ones, sin, cos,
                    exp, log, sqrt, where, interp, linspace)
@@ -10,14 +11,17 @@ from scipy.fftpack import fft, ifft
 from scipy.special import i0 as bessel_i0
 
 from larch import (Group, ValidateLarchPlugin, Make_CallArgs,
-                   parse_group_args)
+                   parse_group_args, isgroup)
 
-from larch.utils import complex_phase
+from larch.utils import complex_phase, LRUCache
 from larch_plugins.xafs import set_xafsGroup
 
 
 MODNAME = '_xafs'
 VALID_WINDOWS = ['han', 'fha', 'gau', 'kai', 'par', 'wel', 'sin', 'bes']
+FTWINDOW_CACHE_SIZE = 128   # number of FT windows to cache
+
+_ftwindow_cache = LRUCache(FTWINDOW_CACHE_SIZE)
 
 def ftwindow(x, xmin=None, xmax=None, dx=1, dx2=None,
              window='hanning', _larch=None, **kws):
@@ -117,6 +121,34 @@ def ftwindow(x, xmin=None, xmax=None, dx=1, dx2=None,
         fwin =  exp(-(((x - cen)**2)/(2*dx1*dx1)))
     return fwin
 
+def ftwindow_cached(x, xmin=None, xmax=None, dx=1, dx2=None,
+                    window='hanning', **kws):
+    """
+    create a Fourier transform window array, as ftwindow(), caching
+    the most recently used windows by (x, window, xmin, xmax, dx, dx2).
+
+    Returns a copy of the cached window array.
+    """
+    x = np.ascontiguousarray(x, dtype='float64')
+    key = (len(x), hashlib.sha1(x.tobytes()).hexdigest(),
+           window, xmin, xmax, dx, dx2)
+    win = _ftwindow_cache.get(key)
+    if win is None:
+        win = ftwindow(x, xmin=xmin, xmax=xmax, dx=dx, dx2=dx2, window=window)
+        _ftwindow_cache.put(key, win)
+    return win.copy()
+
+def clear_ftwindow_cache():
+    """clear cache of Fourier transform windows"""
+    _ftwindow_cache.clear()
+
+def _interp_rows(xnew, x, y):
+    """linear interpolation of each row of a 2-d array y on x to xnew,
+    as numpy.interp, for increasing x"""
+    idx = np.clip(np.searchsorted(x, xnew, side='right'), 1, len(x)-1)
+    frac = np.clip((xnew - x[idx-1]) / (x[idx] - x[idx-1]), 0, 1)
+    return y[:, idx-1]*(1-frac) + y[:, idx]*frac
+
 @ValidateLarchPlugin
 @Make_CallArgs(["r", "chir"])
 def xftr(r, chir=None, group=None, rmin=0, rmax=20, with_phase=False,
@@ -180,7 +212,8 @@ def xftr(r, chir=None, group=None, rmin=0, rmax=20, with_phase=False,
     if chir.dtype == np.dtype('complex128'):
         scale = 0.5
 
-    win = ftwindow(r_, xmin=rmin, xmax=rmax, dx=dr, dx2=dr2, window=window)
+    win = ftwindow_cached(r_, xmin=rmin, xmax=rmax, dx=dr, dx2=dr2,
+                          window=window)
     out = scale * xftr_fast( cchir*win * r_**rw, kstep=kstep, nfft=nfft)
     if qmax_out is None: qmax_out = 30.0
     q = linspace(0, qmax_out, int(1.05 + qmax_out/kstep))
@@ -257,7 +290,7 @@ def xftf(k, chi=None, group=None, kmin=0, kmax=20, kweight=0,
     out = xftf_fast(cchi*win, kstep=kstep, nfft=nfft)
     rstep = pi/(kstep*nfft)
 
-    irmax = min(nfft/2, int(1.01 + rmax_out/rstep))
+    irmax = min(nfft//2, int(1.01 + rmax_out/rstep))
 
     group = set_xafsGroup(group, _larch=_larch)
     r   = rstep * arange(irmax)
@@ -271,7 +304,187 @@ def xftf(k, chi=None, group=None, kmin=0, kmax=20, kweight=0,
     if with_phase:
         group.chir_pha =  complex_phase(out[:irmax])
 
+def _batch_groups(x, xname, yname):
+    """return list of groups if x is a list of groups with members
+    xname and yname, or None"""
+    if (isinstance(x, (list, tuple)) and len(x) > 0 and
+        all([isgroup(g, xname, yname) for g in x])):
+        return list(x)
+    return None
+
+def _stack_rows(arrays, npts):
+    """stack list of 1-d arrays into 2-d array (narrays, npts),
+    padding with zeros"""
+    out = zeros((len(arrays), npts), dtype=arrays[0].dtype)
+    for i, arr in enumerate(arrays):
+        out[i, :len(arr)] = arr[:npts]
+    return out
+
+@ValidateLarchPlugin
+def xftf_batch(k, chi=None, group=None, kmin=0, kmax=20, kweight=0,
+               dk=1, dk2=None, with_phase=False, window='kaiser',
+               rmax_out=10, nfft=2048, kstep=0.05, _larch=None, **kws):
+    """
+    forward XAFS Fourier transform of many chi(k) spectra, using the
+    same FT window and a single multi-row FFT.
+
+    Parameters:
+    -----------
+      k:        1-d array of k shared by all spectra, or list of
+                groups, each with 'k' and 'chi'
+      chi:      2-d array of chi(k), (nspectra, len(k))
+      group:    output Group
+
+      other arguments are as for xftf().
+
+    Returns:
+    ---------
+      None   -- outputs are written to supplied group.
+
+    Notes:
+    -------
+    Arrays written to output group:
+        kwin               window function Omega(k)
+        r                  uniform array of R, out to rmax_out.
+        chir               2-d complex array of chi(R), (nspectra, len(r))
+        chir_mag           2-d array of magnitude of chi(R).
+        chir_re            2-d array of real part of chi(R).
+        chir_im            2-d array of imaginary part of chi(R).
+        chir_pha           2-d array of phase of chi(R) if with_phase=True
+
+    If a list of groups is given, the results for each spectrum are also
+    written to its group, as for xftf().
+    """
+    if 'kw' in kws:
+        kweight = kws['kw']
+    prep_kws = dict(kmin=kmin, kmax=kmax, kweight=kweight, dk=dk, dk2=dk2,
+                    nfft=nfft, kstep=kstep, window=window, _larch=_larch)
+    groups = _batch_groups(k, 'k', 'chi')
+    if groups is None:
+        chi = np.atleast_2d(chi)
+        cchi, win = xftf_prep(k, chi, **prep_kws)
+        nchi = [chi.shape[1]]*chi.shape[0]
+    else:
+        preps = [xftf_prep(g.k, g.chi, **prep_kws) for g in groups]
+        npts = max([len(p[1]) for p in preps])
+        cchi = _stack_rows([p[0] for p in preps], npts)
+        win = preps[np.argmax([len(p[1]) for p in preps])][1]
+        nchi = [len(g.chi) for g in groups]
+
+    out = xftf_fast(cchi*win, kstep=kstep, nfft=nfft)
+    rstep = pi/(kstep*nfft)
+    irmax = min(nfft//2, int(1.01 + rmax_out/rstep))
+    r   = rstep * arange(irmax)
+    out = out[:, :irmax]
+    mag = sqrt(out.real**2 + out.imag**2)
+    pha = None
+    if with_phase:
+        pha = np.array([complex_phase(row) for row in out])
+
+    if groups is not None:
+        for i, grp in enumerate(groups):
+            grp.kwin = win[:nchi[i]]
+            grp.r = r
+            grp.chir = out[i]
+            grp.chir_mag = mag[i]
+            grp.chir_re = out[i].real
+            grp.chir_im = out[i].imag
+            if with_phase:
+                grp.chir_pha = pha[i]
+
+    group = set_xafsGroup(group, _larch=_larch)
+    group.kwin =  win[:max(nchi)]
+    group.r    =  r
+    group.chir =  out
+    group.chir_mag =  mag
+    group.chir_re  =  out.real
+    group.chir_im  =  out.imag
+    if with_phase:
+        group.chir_pha =  pha
+
+@ValidateLarchPlugin
+def xftr_batch(r, chir=None, group=None, rmin=0, rmax=20, with_phase=False,
+               dr=1, dr2=None, rw=0, window='kaiser', qmax_out=None,
+               nfft=2048, kstep=0.05, _larch=None, **kws):
+    """
+    reverse XAFS Fourier transform of many chi(R) spectra, using the
+    same FT window and a single multi-row FFT.
+
+    Parameters:
+    ------------
+      r:        1-d array of R shared by all spectra, or list of
+                groups, each with 'r' and 'chir'
+      chir:     2-d array of chi(R), (nspectra, len(r))
+      group:    output Group
+
+      other arguments are as for xftr().
+
+    Returns:
+    ---------
+      None -- outputs are written to supplied group.
+
+    Notes:
+    -------
+    Arrays written to output group:
+        rwin               window Omega(R)
+        q                  uniform array of k, out to qmax_out.
+        chiq               2-d complex array of chi(k), (nspectra, len(q))
+        chiq_mag           2-d array of magnitude of chi(k).
+        chiq_re            2-d array of real part of chi(k).
+        chiq_im            2-d array of imaginary part of chi(k).
+        chiq_pha           2-d array of phase of chi(k) if with_phase=True
+
+    If a list of groups is given, the results for each spectrum are also
+    written to its group, as for xftr().
+    """
+    if 'rweight' in kws:
+        rw = kws['rweight']
+    groups = _batch_groups(r, 'r', 'chir')
+    if groups is not None:
+        r = groups[0].r
+        chir = _stack_rows([np.asarray(g.chir) for g in groups],
+                           max([len(g.chir) for g in groups]))
+    chir = np.atleast_2d(chir)
+    rstep = r[1] - r[0]
+    kstep = pi/(rstep*nfft)
+    scale = 1.0
+    if chir.dtype == np.dtype('complex128'):
+        scale = 0.5
+
+    r_  = rstep * arange(nfft, dtype='float64')
+    win = ftwindow_cached(r_, xmin=rmin, xmax=rmax, dx=dr, dx2=dr2,
+                          window=window)
+    nr = min(nfft, chir.shape[1])
+    out = scale * xftr_fast(chir[:, :nr]*(win * r_**rw)[:nr], kstep=kstep,
+                            nfft=nfft)
+    if qmax_out is None: qmax_out = 30.0
+    q = linspace(0, qmax_out, int(1.05 + qmax_out/kstep))
+    out = out[:, :len(q)]
+    mag = sqrt(out.real**2 + out.imag**2)
+    pha = None
+    if with_phase:
+        pha = np.array([complex_phase(row) for row in out])
+
+    if groups is not None:
+        for i, grp in enumerate(groups):
+            grp.q = q
+            grp.rwin = win[:len(grp.chir)]
+            grp.chiq = out[i]
+            grp.chiq_mag = mag[i]
+            grp.chiq_re = out[i].real
+            grp.chiq_im = out[i].imag
+            if with_phase:
+                grp.chiq_pha = pha[i]
 
+    group = set_xafsGroup(group, _larch=_larch)
+    group.q = q
+    group.rwin =  win[:chir.shape[1]]
+    group.chiq     =  out
+    group.chiq_mag =  mag
+    group.chiq_re  =  out.real
+    group.chiq_im  =  out.imag
+    if with_phase:
+        group.chiq_pha =  pha
 
 
 
@@ -284,14 +497,21 @@ def xftf_prep(k, chi, kmin=0, kmax=20, kweight=2, dk=1, dk2=None,
 
     Returns weighted chi, window function which can easily be multiplied
     and used in xftf_fast.
+
+    chi can also be a 2-d array (nspectra, len(k)) of spectra sharing k,
+    for which a 2-d array of weighted chi is returned.
     """
     if dk2 is None: dk2 = dk
     npts = int(1.01 + max(k)/kstep)
     k_max = max(max(k), kmax+dk2)
     k_   = kstep * np.arange(int(1.01+k_max/kstep), dtype='float64')
-    chi_ = interp(k_, k, chi)
-    win  = ftwindow(k_, xmin=kmin, xmax=kmax, dx=dk, dx2=dk2, window=window)
-    return ((chi_[:npts] *k_[:npts]**kweight), win[:npts])
+    if np.ndim(chi) > 1:
+        chi_ = _interp_rows(k_, np.asarray(k), np.asarray(chi))
+    else:
+        chi_ = interp(k_, k, chi)
+    win  = ftwindow_cached(k_, xmin=kmin, xmax=kmax, dx=dk, dx2=dk2,
+                           window=window)
+    return ((chi_[..., :npts] *k_[:npts]**kweight), win[:npts])
 
 def xftf_fast(chi, nfft=2048, kstep=0.05, _larch=None, **kws):
     """
@@ -305,18 +525,19 @@ def xftf_fast(chi, nfft=2048, kstep=0.05, _larch=None, **kws):
 
     Parameters:
     ------------
-      chi:      1-d array of chi to be transformed
+      chi:      1-d array of chi to be transformed, or 2-d array with
+                one spectrum per row
       nfft:     value to use for N_fft (2048).
       kstep:    value to use for delta_k (0.05).
 
     Returns:
     --------
-      complex 1-d array chi(R)
+      complex 1-d array chi(R), or 2-d array with one row per spectrum
 
     """
-    cchi = zeros(nfft, dtype='complex128')
-    cchi[0:len(chi)] = chi
-    return (kstep / sqrt(pi)) * fft(cchi)[:int(nfft/2)]
+    cchi = zeros(np.shape(chi)[:-1] + (nfft,), dtype='complex128')
+    cchi[..., 0:np.shape(chi)[-1]] = chi
+    return (kstep / sqrt(pi)) * fft(cchi)[..., :int(nfft/2)]
 
 def xftr_fast(chir, nfft=2048, kstep=0.05, _larch=None, **kws):
     """
@@ -329,24 +550,28 @@ def xftr_fast(chir, nfft=2048, kstep=0.05, _larch=None, **kws):
 
     Parameters:
     -------------
-      chir:     1-d array of chi(R) to be transformed
+      chir:     1-d array of chi(R) to be transformed, or 2-d array with
+                one spectrum per row
       nfft:     value to use for N_fft (2048).
       kstep:    value to use for delta_k (0.05).
 
     Returns:
     ----------
-      complex 1-d array for chi(q).
+      complex 1-d array for chi(q), or 2-d array with one row per spectrum
 
     This is useful for repeated FTs, as inside loops.
     """
-    cchi = zeros(nfft, dtype='complex128')
-    cchi[0:len(chir)] = chir
-    return  (4*sqrt(pi)/kstep) * ifft(cchi)[:int(nfft/2)]
+    cchi = zeros(np.shape(chir)[:-1] + (nfft,), dtype='complex128')
+    cchi[..., 0:np.shape(chir)[-1]] = chir
+    return  (4*sqrt(pi)/kstep) * ifft(cchi)[..., :int(nfft/2)]
 
 
 def registerLarchPlugin():
     return (MODNAME, {'xftf': xftf,
                       'xftr': xftr,
+                      'xftf_batch': xftf_batch,
+                      'xftr_batch': xftr_batch,
+                      'clear_ftwindow_cache': clear_ftwindow_cache,
                       'xftf_prep': xftf_prep,
                       'xftf_fast': xftf_fast,
                       'xftr_fast': xftr_fast,
@@ -5,14 +5,16 @@ from .chemparser import chemparse
 from .physical_constants import (R_ELECTRON_CM, AVOGADRO, BARN,
                                  PLANCK_HC, RAD2DEG)
 
-from .xraydb import xrayDB
+from .xraydb import xrayDB, XrayDBSnapshot
 
 from .xraydb_plugin import (atomic_mass, atomic_number,
                             atomic_symbol, atomic_density,
                             xray_line, xray_lines, xray_edge,
-                            xray_edges, f0, f0_ions, mu_elam,
+                            xray_edges, f0, f0_ions, f0_table, mu_elam,
                             mu_chantler, f1_chantler, f2_chantler,
-                            core_width, chantler_data)
+                            core_width, chantler_data,
+                            mu_elam_table, mu_chantler_table)
 
-from .materials import material_mu, material_get
+from .materials import (material_mu, material_mu_table, material_get,
+                        material_cache_stats, clear_material_cache)
 from .cromer_liberman import f1f2
@@ -18,6 +18,10 @@
 #
 
 from re import compile as re_compile
+from larch.utils import LRUCache
+
+CHEMPARSE_CACHE_SIZE = 1024
+
 class Element:
     def __init__(self, symbol):
         self.sym = symbol
@@ -150,9 +154,17 @@ proper capitalization must be used:
     ValueError: unrecognized element or number:
     co
     ^
+
+Parsed formulas are cached, so that repeated calls with the same
+formula do not need to parse it again.
     '''
-    p = ChemFormulaParser()
-    return p.parse(formula)
+    out = chemparse_cache.get(formula)
+    if out is None:
+        out = ChemFormulaParser().parse(formula)
+        chemparse_cache.put(formula, out)
+    return dict(out)
+
+chemparse_cache = LRUCache(CHEMPARSE_CACHE_SIZE)
 
 def registerLarchPlugin():
     return ('_xray', {'chemparse': chemparse})
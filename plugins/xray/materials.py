@@ -1,11 +1,18 @@
 import os
+import hashlib
 import numpy as np
 from larch import ValidateLarchPlugin, site_config
+from larch.utils import LRUCache
 
-from larch_plugins.xray import chemparse, mu_elam, atomic_mass
+from larch_plugins.xray import (chemparse, mu_elam, mu_elam_table,
+                                atomic_mass)
+from larch_plugins.xray.chemparser import chemparse_cache
 
 MODNAME = '_xray'
 
+MATERIAL_MU_CACHE_SIZE = 256
+material_mu_cache = LRUCache(MATERIAL_MU_CACHE_SIZE)
+
 def get_materials(_larch):
     """return _materials dictionary, creating it if needed"""
     symname = '%s._materials' % MODNAME
@@ -33,6 +40,18 @@ def get_materials(_larch):
     _larch.symtable.set_symbol(symname, mat)
     return mat
 
+def get_material_formulas(_larch, rebuild=False):
+    """return dictionary of lower-case formula to material name,
+    for the first material with each formula, creating it if needed"""
+    symname = '%s._material_formulas' % MODNAME
+    if not rebuild and _larch.symtable.has_symbol(symname):
+        return _larch.symtable.get_symbol(symname)
+    index = {}
+    for key, val in get_materials(_larch).items():
+        index.setdefault(val[0].lower(), key)
+    _larch.symtable.set_symbol(symname, index)
+    return index
+
 @ValidateLarchPlugin
 def material_mu(name, energy, density=None, kind='total', _larch=None):
     """
@@ -63,28 +82,121 @@ def material_mu(name, energy, density=None, kind='total', _larch=None):
       >>> print(material_mu('H2O', 10000.0))
       5.32986401658495
     """
+    formula, density = material_formula(name, density, _larch=_larch)
+    out = _formulas_mu([(formula, density)], energy, kind=kind,
+                       _larch=_larch)[0]
+    if len(out) == 1:
+        return out[0]
+    return out
+
+def material_formula(name, density=None, _larch=None):
+    """return (formula, density) for a material name or formula"""
     _materials = get_materials(_larch)
     formula = None
     mater = _materials.get(name.lower(), None)
+    if mater is None: # match formula
+        mater = _materials.get(get_material_formulas(_larch).get(name.lower()))
     if mater is not None:
         formula, density = mater
-    else:
-        for key, val in _materials.items():
-            if name.lower() == val[0].lower(): # match formula
-                formula, density = val
-                break
     # default to using passed in name as a formula
     if formula is None:
         formula = name
     if density is None:
         raise Warning('material_mu(): must give density for unknown materials')
+    return formula, density
+
+@ValidateLarchPlugin
+def material_mu_table(names, energy, density=None, kind='total', _larch=None):
+    """
+    material_mu_table(names, energy, density=None, kind='total')
+
+    return X-ray attenuation length (in 1/cm) for several materials by
+    name or formula, as a 2-d array (len(names), len(energy))
+
+    arguments
+    ---------
+     names:    list of chemical formulas or names of materials from
+               materials list.
+     energy:   energy or array of energies in eV
+     density:  material density (gr/cm^3), or list of densities, one
+               per material.  If None, and material is a known material,
+               that density will be used.
+     kind:     'photo' or 'total' (default) for whether to
+               return photo-absorption or total cross-section.
+    returns
+    -------
+     mu, absorption length in 1/cm, one row per material
+
+    notes
+    -----
+      1.  see material_mu() for naming of materials.
+      2.  mu_elam_table() is used for mu calculation, called once for
+          all elements in all materials.
+    """
+    if density is None or isinstance(density, (int, float)):
+        density = [density]*len(names)
+    if len(density) != len(names):
+        raise Warning('material_mu_table(): must give one density per material')
+
+    formulas = [material_formula(name, dens, _larch=_larch)
+                for name, dens in zip(names, density)]
+    return _formulas_mu(formulas, energy, kind=kind, _larch=_larch)
+
+def _formulas_mu(formulas, energy, kind='total', _larch=None):
+    """mu (in 1/cm) for a list of (formula, density), as 2-d array
+    (len(formulas), len(energy)), with mu_elam_table() called once
+    for all elements not found in material_mu_cache"""
+    energy = np.ascontiguousarray(np.atleast_1d(energy), dtype='float64')
+    ehash = (len(energy), hashlib.sha1(energy.tobytes()).hexdigest())
+    out = np.zeros((len(formulas), len(energy)))
+    keys, missing = [], []
+    for i, (formula, dens) in enumerate(formulas):
+        key = (formula, float(dens), kind) + ehash
+        mu = material_mu_cache.get(key)
+        if mu is None:
+            missing.append(i)
+        else:
+            out[i] = mu
+        keys.append(key)
+    if len(missing) == 0:
+        return out
+
+    comps, elems = [], []
+    for i in missing:
+        formula, dens = formulas[i]
+        comp = chemparse(formula)
+        comps.append((comp, dens))
+        for elem in comp:
+            if elem not in elems:
+                elems.append(elem)
+
+    # weights: density * mass fraction of each element in each material
+    weights = np.zeros((len(missing), len(elems)))
+    for j, (comp, dens) in enumerate(comps):
+        mass_tot = 0.0
+        for elem, frac in comp.items():
+            mass  = frac * atomic_mass(elem, _larch=_larch)
+            weights[j, elems.index(elem)] = mass
+            mass_tot += mass
+        weights[j] *= dens/mass_tot
+    mu = np.dot(weights, mu_elam_table(elems, energy, kind=kind, _larch=_larch))
+    for j, i in enumerate(missing):
+        out[i] = mu[j]
+        material_mu_cache.put(keys[i], mu[j].copy())
+    return out
+
+def material_cache_stats(_larch=None):
+    """return dictionary of statistics for the caches of parsed chemical
+    formulas ('chemparse') and of material_mu() results ('material_mu'),
+    each a dictionary of 'hits', 'misses', 'size' and 'maxsize'"""
+    return {'chemparse': chemparse_cache.stats(),
+            'material_mu': material_mu_cache.stats()}
 
-    mass_tot, mu = 0.0, 0.0
-    for elem, frac in chemparse(formula).items():
-        mass  = frac * atomic_mass(elem, _larch=_larch)
-        mu   += mass * mu_elam(elem, energy, kind=kind, _larch=_larch)
-        mass_tot += mass
-    return density*mu/mass_tot
+def clear_material_cache(_larch=None):
+    """clear caches of parsed chemical formulas and material_mu() results,
+    and reset their statistics"""
+    chemparse_cache.clear()
+    material_mu_cache.clear()
 
 @ValidateLarchPlugin
 def material_mu_components(name, energy, density=None, kind='total',
@@ -143,8 +255,9 @@ def material_add(name, formula, density, _larch=None):
 
     symname = '%s._materials' % MODNAME
     _larch.symtable.set_symbol(symname, materials)
+    get_material_formulas(_larch, rebuild=True)
 
-    fname = os.path.join(larch.site_config.larchdir, 'materials.dat')
+    fname = os.path.join(site_config.larchdir, 'materials.dat')
     if os.path.exists(fname):
         fh = open(fname, 'r')
         text = fh.readlines()
@@ -168,5 +281,8 @@ def registerLarchPlugin():
     return ('_xray', {'material_get': material_get,
                       'material_add': material_add,
                       'material_mu':  material_mu,
+                      'material_mu_table':  material_mu_table,
                       'material_mu_components': material_mu_components,
+                      'material_cache_stats': material_cache_stats,
+                      'clear_material_cache': clear_material_cache,
                       })
@@ -9,7 +9,9 @@ Main Class for full Database:  xrayDB
 import os
 import time
 import json
+import struct
 import six
+from collections import namedtuple, OrderedDict
 import numpy as np
 from scipy.interpolate import interp1d, splrep, splev, UnivariateSpline
 from sqlalchemy import MetaData, create_engine
@@ -19,7 +21,9 @@ from sqlalchemy.pool import SingletonThreadPool
 # needed for py2exe?
 import sqlalchemy.dialects.sqlite
 import larch
-from larch.utils import as_ndarray
+from larch.utils import as_ndarray, LRUCache
+
+CHANTLER_CACHE_SIZE = 256
 
 def OLDas_ndarray(obj):
     """make sure a float, int, list of floats or ints,
@@ -63,24 +67,61 @@ def elam_spline(xin, yin, yspl_in, x):
     """ interpolate values from Elam photoabsorption and scattering tables,
     according to Elam, Numerical Recipes.  Calc borrowed from D. Dale.
     """
-    x = as_ndarray(x)
-    x[np.where(x < min(xin))] =  min(xin)
-    x[np.where(x > max(xin))] =  max(xin)
+    return elam_spline_table([(xin, yin, yspl_in)], as_ndarray(x))[0]
+
+def elam_spline_table(tables, x):
+    """ interpolate values from several Elam tables at once, as for
+    elam_spline().
 
-    lo, hi = np.array([(np.flatnonzero(xin < e)[-1],
-                        np.flatnonzero(xin > e)[0])
-                       for e in x]).transpose()
+    arguments
+    ---------
+    tables:  list of (xin, yin, yspl_in) tuples, one per table.
+    x:       1-d array of values to interpolate for all tables, or
+             2-d array (ntables, npts) with one row per table.
+
+    returns 2-d array (ntables, npts) of interpolated values.
+    """
+    x = np.asarray(x, dtype='float64')
+    ntab = len(tables)
+    if x.ndim < 2:
+        x = np.tile(x, (ntab, 1))
+    lo = np.zeros(x.shape, dtype='int64')
+    hi = np.zeros(x.shape, dtype='int64')
+    xq = np.zeros(x.shape)
+    offset = 0
+    for i, (xin, yin, yspl_in) in enumerate(tables):
+        xin = np.asarray(xin)
+        xq[i] = np.clip(x[i], min(xin), max(xin))
+        # lo: last point below x, hi: first point above x
+        lo[i] = offset + np.clip(np.searchsorted(xin, xq[i], side='left')-1,
+                                 0, len(xin)-1)
+        hi[i] = offset + np.clip(np.searchsorted(xin, xq[i], side='right'),
+                                 0, len(xin)-1)
+        offset += len(xin)
+    xin = np.concatenate([t[0] for t in tables])
+    yin = np.concatenate([t[1] for t in tables])
+    yspl_in = np.concatenate([t[2] for t in tables])
 
     diff = xin[hi] - xin[lo]
-    if any(diff <= 0):
+    if any(diff.ravel() <= 0):
         raise ValueError('x must be strictly increasing')
-    a = (xin[hi] - x) / diff
-    b = (x - xin[lo]) / diff
+    a = (xin[hi] - xq) / diff
+    b = (xq - xin[lo]) / diff
     return (a * yin[lo] + b * yin[hi] +
             (diff*diff/6) * ((a*a - 1) * a * yspl_in[lo] +
                              (b*b - 1) * b * yspl_in[hi] ))
 
 
+class LogLogInterp(object):
+    """linear interpolation of log(y) against log(x), as used
+    for tabulated f2 and mu values from Chantler"""
+    def __init__(self, x, y):
+        self.logx = np.log(x)
+        self.logy = np.log(y)
+
+    def __call__(self, x):
+        return np.exp(np.interp(np.log(x), self.logx, self.logy))
+
 class DBException(Exception):
     """DB Access Exception: General Errors"""
     def __init__(self, msg):
@@ -145,9 +186,170 @@ class ChantlerTable(_BaseTable):
      corr_henke, corr_cl35, corr_nucl,
      energy, f1, f2, mu_photo, mu_incoh, mu_total) = [None]*14
 
+ElementRow = namedtuple('ElementRow', ('atomic_number', 'element',
+                                       'molar_mass', 'density'))
+CoreholeRow = namedtuple('CoreholeRow', ('atomic_number', 'element',
+                                         'edge', 'width'))
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MAGIC = b'XRDBSNAP'
+CHANTLER_COLUMNS = ('energy', 'f1', 'f2', 'mu_photo', 'mu_incoh', 'mu_total')
+PHOTO_COLUMNS = ('log_energy', 'log_photoabsorption',
+                 'log_photoabsorption_spline')
+SCATTER_COLUMNS = ('log_energy', 'log_coherent_scatter',
+                   'log_coherent_scatter_spline', 'log_incoherent_scatter',
+                   'log_incoherent_scatter_spline')
+
+class XrayDBSnapshot(object):
+    """in-memory copy of the tables of an X-ray Database, with the
+    tabulated arrays as numpy arrays and dictionaries indexed by element.
+
+    A snapshot can be saved to a single binary file, which holds a JSON
+    header followed by all arrays as float64 data.  Loading a snapshot
+    file memory-maps the array data, so that it is read only as needed.
+
+    Create with XrayDBSnapshot.from_xraydb(xdb) or XrayDBSnapshot.load(filename)
+    """
+    def __init__(self, header, data):
+        self.header = header
+        arrays = {}
+        for name, (offset, npts) in header['arrays'].items():
+            arrays[name] = data[offset:offset+npts]
+
+        self.elements = OrderedDict()
+        self.zsymbols = {}
+        for z, sym, mass, density in header['elements']:
+            self.elements[sym] = ElementRow(z, sym, mass, density)
+            self.zsymbols[z] = sym
+
+        def tables(name, columns):
+            out, ids = OrderedDict(), {}
+            for rowid, sym in header[name]:
+                ids[rowid] = sym
+                out[sym] = dict([(col, arrays['%s/%s/%s' % (name, sym, col)])
+                                 for col in columns])
+            return out, ids
+
+        self.chantler, self.chantler_ids = tables('chantler', CHANTLER_COLUMNS)
+        self.photo, _ = tables('photo', PHOTO_COLUMNS)
+        self.scatter, _ = tables('scatter', SCATTER_COLUMNS)
+
+        self.levels = OrderedDict()
+        for sym, edge, energy, fyield, jump in header['levels']:
+            if sym not in self.levels:
+                self.levels[sym] = OrderedDict()
+            self.levels[sym][edge] = (energy, fyield, jump)
+        self.level_rows = header['levels']
+
+        self.transitions = {}
+        for sym, siegbahn, energy, intensity, ilevel, flevel in header['transitions']:
+            if sym not in self.transitions:
+                self.transitions[sym] = []
+            self.transitions[sym].append((siegbahn, energy, intensity,
+                                          ilevel, flevel))
+
+        self.coster_kronig = {}
+        for sym, ilevel, flevel, prob, total in header['coster_kronig']:
+            self.coster_kronig[(sym, ilevel, flevel)] = (prob, total)
+
+        self.corehole = header['corehole']
+        self.waasmaier = header['waasmaier']
+
+    @classmethod
+    def from_xraydb(cls, xdb):
+        "create snapshot from all rows of an xrayDB"
+        header = {'version': SNAPSHOT_VERSION,
+                  'dbsize': os.path.getsize(xdb.dbname), 'arrays': {}}
+        chunks = []
+        npts = [0]
+        def add_array(name, value):
+            arr = np.array(json.loads(value), dtype='float64')
+            header['arrays'][name] = (npts[0], len(arr))
+            npts[0] += len(arr)
+            chunks.append(arr)
+
+        query = xdb.query
+        header['elements'] = [(r.atomic_number, str(r.element),
+                               r.molar_mass, r.density)
+                              for r in query(ElementsTable).all()]
+        for name, tab, columns in (('chantler', ChantlerTable, CHANTLER_COLUMNS),
+                                   ('photo', PhotoAbsorptionTable, PHOTO_COLUMNS),
+                                   ('scatter', ScatteringTable, SCATTER_COLUMNS)):
+            header[name] = []
+            for row in query(tab).all():
+                header[name].append((row.id, str(row.element)))
+                for col in columns:
+                    add_array('%s/%s/%s' % (name, row.element, col),
+                              getattr(row, col))
+
+        header['levels'] = [(str(r.element), str(r.iupac_symbol),
+                             r.absorption_edge, r.fluorescence_yield,
+                             r.jump_ratio)
+                            for r in query(XrayLevelsTable).all()]
+        header['transitions'] = [(str(r.element), str(r.siegbahn_symbol),
+                                  r.emission_energy, r.intensity,
+                                  str(r.initial_level), str(r.final_level))
+                                 for r in query(XrayTransitionsTable).all()]
+        header['coster_kronig'] = [(str(r.element), str(r.initial_level),
+                                    str(r.final_level),
+                                    r.transition_probability,
+                                    r.total_transition_probability)
+                                   for r in query(CosterKronigTable).all()]
+        header['corehole'] = [(r.atomic_number, str(r.element), str(r.edge),
+                               r.width)
+                              for r in query(KeskiRahkonenKrauseTable).all()]
+        header['waasmaier'] = [(r.atomic_number, str(r.element), str(r.ion),
+                                r.offset, json.loads(r.scale),
+                                json.loads(r.exponents))
+                               for r in query(WaasmaierTable).all()]
+        return cls(header, np.concatenate(chunks))
+
+    def save(self, filename):
+        "save snapshot to a single binary file"
+        data = np.zeros(sum([n for o, n in self.header['arrays'].values()]),
+                        dtype='<f8')
+        for name, (offset, npts) in self.header['arrays'].items():
+            sym, col = name.split('/')[1:]
+            tabs = {'chantler': self.chantler, 'photo': self.photo,
+                    'scatter': self.scatter}[name.split('/')[0]]
+            data[offset:offset+npts] = tabs[sym][col]
+        header = json.dumps(self.header).encode('utf-8')
+        header = header + b' '*((-len(header)) % 8)
+        with open(filename, 'wb') as fh:
+            fh.write(SNAPSHOT_MAGIC)
+            fh.write(struct.pack('<Q', len(header)))
+            fh.write(header)
+            fh.write(data.tobytes())
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """load snapshot from file, memory-mapping the array data if mmap
+        is True.  Raises ValueError if the file is not a valid snapshot"""
+        with open(filename, 'rb') as fh:
+            magic = fh.read(len(SNAPSHOT_MAGIC))
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError("'%s' is not an X-ray Database snapshot" % filename)
+            hlen = struct.unpack('<Q', fh.read(8))[0]
+            header = json.loads(fh.read(hlen).decode('utf-8'))
+            if header.get('version', None) != SNAPSHOT_VERSION:
+                raise ValueError("'%s' has wrong snapshot version" % filename)
+            offset = len(SNAPSHOT_MAGIC) + 8 + hlen
+            if mmap:
+                data = np.memmap(filename, dtype='<f8', mode='r', offset=offset)
+            else:
+                data = np.fromfile(fh, dtype='<f8')
+        return cls(header, data)
+
 class xrayDB(object):
-    "interface to Xray Data"
-    def __init__(self, dbname='xrayref.db', read_only=True):
+    """interface to Xray Data
+
+    With preload=True, all tables are read into memory on first use,
+    and data is then looked up without database queries.  If snapshot
+    is given, the in-memory tables are loaded from (or saved to) this
+    snapshot file.  See preload().
+    """
+    def __init__(self, dbname='xrayref.db', read_only=True, preload=False,
+                 snapshot=None):
         "connect to an existing database"
         if not os.path.exists(dbname):
             parent, child = os.path.split(__file__)
@@ -186,6 +388,47 @@ class xrayDB(object):
         mapper(PhotoAbsorptionTable,     tables['photoabsorption'])
         mapper(ScatteringTable,          tables['scattering'])
 
+        self.snapshot = None
+        self._f0_matrix = None
+        self.chantler_cache = LRUCache(CHANTLER_CACHE_SIZE)
+        self._element_rows = {}
+        self._preload = preload
+        self._snapshot_file = snapshot
+
+    def preload(self, snapshot=None, mmap=True):
+        """read all tables into memory, so that data is looked up without
+        database queries.
+
+        arguments
+        ---------
+        snapshot:  name of snapshot file.  If this exists and matches the
+                   database, tables are loaded from it.  Otherwise, tables
+                   are read from the database and saved to this file.
+        mmap:      whether to memory-map the arrays in the snapshot file [True]
+
+        returns the XrayDBSnapshot
+        """
+        snap = None
+        if snapshot is not None and os.path.exists(snapshot):
+            try:
+                snap = XrayDBSnapshot.load(snapshot, mmap=mmap)
+            except (ValueError, IOError, struct.error):
+                snap = None
+            if (snap is not None and
+                snap.header.get('dbsize', -1) != os.path.getsize(self.dbname)):
+                snap = None
+        if snap is None:
+            snap = XrayDBSnapshot.from_xraydb(self)
+            if snapshot is not None:
+                snap.save(snapshot)
+        self.snapshot = snap
+        return snap
+
+    def _snap(self):
+        "return snapshot, loading it on first use if preload was requested"
+        if self.snapshot is None and self._preload:
+            self.preload(snapshot=self._snapshot_file)
+        return self.snapshot
 
     def close(self):
         "close session"
@@ -208,6 +451,15 @@ class xrayDB(object):
         if element is None, all 211 ions are returned.  If element is
         not None, the ions for that element (atomic symbol) are returned
         """
+        snap = self._snap()
+        if snap is not None:
+            rows = snap.waasmaier
+            if isinstance(element, int):
+                rows = [r for r in rows if r[0] == element]
+            elif element is not None:
+                rows = [r for r in rows if r[1] == element.title()]
+            return [str(r[2]) for r in rows]
+
         rows = self.query(WaasmaierTable)
         if element is not None:
             if isinstance(element, int):
@@ -216,6 +468,37 @@ class xrayDB(object):
                 rows = rows.filter(WaasmaierTable.element==element.title())
         return [str(r.ion) for r in rows.all()]
 
+    def f0_matrix(self):
+        """return dense Waasmaier and Kirfel coefficients for all ions,
+        as a tuple (index, offset, scale, exponents), where
+        index maps ion symbols and atomic numbers to rows of the arrays
+        offset (nions,), scale (nions, ncoefs), and exponents (nions, ncoefs).
+
+        The coefficients are read once, and held for later calls.
+        """
+        if self._f0_matrix is not None:
+            return self._f0_matrix
+        snap = self._snap()
+        if snap is not None:
+            rows = snap.waasmaier
+        else:
+            rows = [(r.atomic_number, r.element, r.ion, r.offset,
+                     json.loads(r.scale), json.loads(r.exponents))
+                    for r in self.query(WaasmaierTable).all()]
+        ncoefs = max([len(r[4]) for r in rows])
+        offset = np.zeros(len(rows))
+        scale = np.zeros((len(rows), ncoefs))
+        exponents = np.zeros((len(rows), ncoefs))
+        index = {}
+        for i, (znum, elem, ion, off, scl, exps) in enumerate(rows):
+            index.setdefault(znum, i)
+            index.setdefault(str(ion), i)
+            offset[i] = off
+            scale[i, :len(scl)] = scl
+            exponents[i, :len(exps)] = exps
+        self._f0_matrix = (index, offset, scale, exponents)
+        return self._f0_matrix
+
     def f0(self, ion, q):
         """Calculate f0(q) -- elastic x-ray scattering factor
         from Waasmaier and Kirfel
@@ -232,25 +515,54 @@ class xrayDB(object):
         Z values from 1 to 98 (and symbols 'H' to 'Cf') are supported.
         The list of ionic symbols can be read with the function .f0_ions()
         """
-        tab = WaasmaierTable
-        row = self.query(tab)
-        if isinstance(ion, int):
-            row = row.filter(tab.atomic_number==ion).all()
-        else:
-            row = row.filter(tab.ion==ion.title()).all()
-        if len(row) > 0:
-            row = row[0]
-        if isinstance(row, tab):
-            q = as_ndarray(q)
-            f0 = row.offset
-            for s, e in zip(json.loads(row.scale), json.loads(row.exponents)):
-                f0 += s * np.exp(-e*q*q)
-            return f0
+        try:
+            return self.f0_table([ion], q)[0]
+        except ValueError:
+            return None
 
-    def _getChantler(self, element, energy, column='f1', smoothing=0):
-        """return energy-dependent data from Chantler table
-        columns: f1, f2, mu_photo, mu_incoh, mu_total
+    def f0_table(self, ions, q):
+        """Calculate f0(q) -- elastic x-ray scattering factor
+        from Waasmaier and Kirfel -- for several ions and q values
+
+        arguments
+        ---------
+        ions: list of atomic numbers, atomic symbols or ionic symbols
+              (case insensitive) of scatterers
+
+        q: single q value, list, tuple, or numpy array of q value
+             q = sin(theta) / lambda
+             theta = incident angle, lambda = x-ray wavelength
+
+        returns 2-d array (len(ions), len(q)), evaluated for all ions
+        together from the coefficients of .f0_matrix()
         """
+        index, offset, scale, exponents = self.f0_matrix()
+        rows = []
+        for ion in ions:
+            key = ion if isinstance(ion, int) else ion.title()
+            if key not in index:
+                raise ValueError("no f0 data for ion '%s'" % ion)
+            rows.append(index[key])
+        q = as_ndarray(q)
+        scale, exponents = scale[rows], -exponents[rows]
+        f0 = np.outer(offset[rows], np.ones(len(q)))
+        for i in range(scale.shape[1]):
+            f0 += scale[:, i:i+1] * np.exp(np.outer(exponents[:, i], q)*q)
+        return f0
+
+    def _chantler_arrays(self, element, column):
+        "return arrays of energy and column from Chantler table, or None"
+        snap = self._snap()
+        if snap is not None:
+            if isinstance(element, int):
+                element = snap.chantler_ids.get(element, None)
+            else:
+                element = element.title()
+            if element not in snap.chantler:
+                return None
+            row = snap.chantler[element]
+            return row['energy'], row[column]
+
         tab = ChantlerTable
         row = self.query(tab)
         if isinstance(element, int):
@@ -260,23 +572,49 @@ class xrayDB(object):
         if len(row) > 0:
             row = row[0]
         if isinstance(row, tab):
-            energy = as_ndarray(energy)
-            emin, emax = min(energy), max(energy)
-            # te = self.chantler_energies(element, emin=emin, emax=emax)
-            te = np.array(json.loads(row.energy))
-            nemin = max(0, -5 + max(np.where(te<=emin)[0]))
-            nemax = min(len(te), 6 + max(np.where(te<=emax)[0]))
-            region = np.arange(nemin, nemax)
-            te = te[region]
-            if column == 'mu':
-                column = 'mu_total'
-            ty = np.array(json.loads(getattr(row, column)))[region]
+            return (np.array(json.loads(row.energy)),
+                    np.array(json.loads(getattr(row, column))))
+
+    def chantler_interp(self, element, column='f1', smoothing=0):
+        """return interpolating function of energy for a column of
+        the Chantler table, over the full tabulated energy range:
+        a cubic spline for f1, and log-log linear interpolation for
+        f2, mu_photo, mu_incoh, and mu_total.  Returns None if there
+        is no data for the element.
+
+        Interpolants are held in a bounded cache for each element,
+        column and smoothing, see .chantler_cache.
+        """
+        if column == 'mu':
+            column = 'mu_total'
+        if not isinstance(element, int):
+            element = element.title()
+        key = (element, column, smoothing)
+        interp = self.chantler_cache.get(key)
+        if interp is None:
+            tabdat = self._chantler_arrays(element, column)
+            if tabdat is None:
+                return None
+            te, ty = tabdat
             if column == 'f1':
-                out = UnivariateSpline(te, ty, s=smoothing)(energy)
+                # some tables repeat an energy at an absorption edge:
+                # keep only points with strictly increasing energy
+                te, ty = np.asarray(te), np.asarray(ty)
+                keep = np.ones(len(te), dtype=bool)
+                keep[1:] = te[1:] > np.maximum.accumulate(te)[:-1]
+                interp = UnivariateSpline(te[keep], ty[keep], s=smoothing)
             else:
-                out = np.exp(np.interp(np.log(energy),
-                                       np.log(te),
-                                       np.log(ty)))
+                interp = LogLogInterp(te, ty)
+            self.chantler_cache.put(key, interp)
+        return interp
+
+    def _getChantler(self, element, energy, column='f1', smoothing=0):
+        """return energy-dependent data from Chantler table
+        columns: f1, f2, mu_photo, mu_incoh, mu_total
+        """
+        interp = self.chantler_interp(element, column, smoothing=smoothing)
+        if interp is not None:
+            out = interp(as_ndarray(energy))
             if isinstance(out, np.ndarray) and len(out) == 1:
                 return out[0]
             return out
@@ -292,19 +630,10 @@ class xrayDB(object):
         emin:  lower bound of energies in eV returned (default=0)
         emax:  upper bound of energies in eV returned (default=1.e9)
         """
-        tab = ChantlerTable
-        row = self.query(tab)
-        if isinstance(element, int):
-            row = row.filter(tab.id==element).all()
-        else:
-            row = row.filter(tab.element==element.title()).all()
-        if len(row) > 0:
-            row = row[0]
-        if not isinstance(row, tab):
+        tabdat = self._chantler_arrays(element, 'f1')
+        if tabdat is None:
             return None
-        te = np.array(json.loads(row.energy))
-        tf1 = np.array(json.loads(row.f1))
-        tf2 = np.array(json.loads(row.f2))
+        te = np.array(tabdat[0])
 
         if emin <= min(te):
             nemin = 0
@@ -316,7 +645,6 @@ class xrayDB(object):
             nemax = min(len(te), 2 + max(np.where(te<=emax)[0]))
         region = np.arange(nemin, nemax)
         return te[region] # , tf1[region], tf2[region]
-
     def f1_chantler(self, element, energy, **kws):
         """returns f1 -- real part of anomalous x-ray scattering factor
         for selected input energy (or energies) in eV.
@@ -344,15 +672,47 @@ class xrayDB(object):
             col = 'mu_incoh'
         return self._getChantler(element, energy, column=col)
 
+    def mu_chantler_table(self, elements, energy, incoh=False, photo=False):
+        """returns mu/rho in cm^2/gr for several elements and energies,
+        as a 2-d array (len(elements), len(energy)).  See mu_chantler().
+        """
+        col = 'mu_total'
+        if photo:
+            col = 'mu_photo'
+        elif incoh:
+            col = 'mu_incoh'
+        energy = as_ndarray(energy)
+        out = np.zeros((len(elements), len(energy)))
+        for i, element in enumerate(elements):
+            interp = self.chantler_interp(element, col)
+            if interp is None:
+                raise ValueError("no Chantler data for element '%s'" % element)
+            out[i] = interp(energy)
+        return out
+
     def _getElementData(self, element):
         "get data from elements table"
+        snap = self._snap()
+        if snap is not None:
+            if isinstance(element, int):
+                element = snap.zsymbols.get(element, '')
+            return snap.elements.get(element.title(), [])
+
+        key = element if isinstance(element, int) else element.title()
+        if key in self._element_rows:
+            return self._element_rows[key]
         tab = ElementsTable
         row = self.query(tab)
         if isinstance(element, int):
             row = row.filter(tab.atomic_number==element).all()
         else:
             row = row.filter(tab.element==element.title()).all()
-        if len(row) > 0: row = row[0]
+        if len(row) > 0:
+            row = row[0]
+            row = self._element_rows[key] = ElementRow(row.atomic_number,
+                                                       str(row.element),
+                                                       row.molar_mass,
+                                                       row.density)
         return row
 
     def zofsym(self, element):
@@ -378,9 +738,13 @@ class xrayDB(object):
         result will have 99 elements, with leading zeros so that
         the ith entry will be for element Z=i.
         """
-        tab = XrayLevelsTable
-        ret = self.query(tab).filter(tab.iupac_symbol==edge).all()
-        ret = [(i.element, i.absorption_edge) for i in ret]
+        snap = self._snap()
+        if snap is not None:
+            ret = [(r[0], r[2]) for r in snap.level_rows if r[1] == edge]
+        else:
+            tab = XrayLevelsTable
+            ret = self.query(tab).filter(tab.iupac_symbol==edge).all()
+            ret = [(i.element, i.absorption_edge) for i in ret]
         out = [0 for ent in range(self.zofsym(ret[0][0]))]
         out.extend([ent[1] for ent in ret])
         return out
@@ -396,6 +760,9 @@ class xrayDB(object):
         """
         if isinstance(element, int):
             element = self.symbol(element)
+        snap = self._snap()
+        if snap is not None:
+            return dict(snap.levels.get(element.title(), {}))
         tab = XrayLevelsTable
         out = {}
         for r in self.query(tab).filter(tab.element==element.title()).all():
@@ -426,14 +793,29 @@ class xrayDB(object):
         """
         if isinstance(element, int):
             element = self.symbol(element)
-        tab = XrayTransitionsTable
-        row = self.query(tab).filter(tab.element==element.title())
         if excitation_energy is not None:
             initial_level = []
             for ilevel, dat in self.xray_edges(element).items():
                 if dat[0] < excitation_energy:
                     initial_level.append(ilevel.title())
 
+        snap = self._snap()
+        if snap is not None:
+            out = {}
+            for siegbahn, energy, intensity, ilevel, flevel in \
+                    snap.transitions.get(element.title(), []):
+                if initial_level is not None:
+                    if isinstance(initial_level, (list, tuple)):
+                        if ilevel not in initial_level:
+                            continue
+                    elif ilevel != initial_level.title():
+                        continue
+                out[siegbahn] = (energy, intensity, ilevel, flevel)
+            return out
+
+        tab = XrayTransitionsTable
+        row = self.query(tab).filter(tab.element==element.title())
+
         if initial_level is not None:
             if isinstance(initial_level, (list, tuple)):
                 row = row.filter(tab.initial_level.in_(initial_level))
@@ -450,6 +832,13 @@ class xrayDB(object):
         """
         if isinstance(element, int):
             element = self.symbol(element)
+        snap = self._snap()
+        if snap is not None:
+            key = (element.title(), initial.title(), final.title())
+            if key in snap.coster_kronig:
+                prob, total_prob = snap.coster_kronig[key]
+                return total_prob if total else prob
+            return None
         tab = CosterKronigTable
         row = self.query(tab).filter(
             tab.element==element.title()
@@ -469,18 +858,29 @@ class xrayDB(object):
         """returns core hole width for an element and edge
         if element is None, values are returned for all elements
         if edge is None, values are return for all edges"""
-        tab = KeskiRahkonenKrauseTable
-        rows = self.query(tab)
         has_elem = element is not None
         has_edge = edge is not None
-        if has_elem:
-            if isinstance(element, int):
-                rows = rows.filter(tab.atomic_number==element)
-            else:
-                rows = rows.filter(tab.element==element.title())
-        if has_edge:
-            rows = rows.filter(tab.edge==edge.title())
-        out = rows.all()
+        snap = self._snap()
+        if snap is not None:
+            out = [CoreholeRow(*r) for r in snap.corehole]
+            if has_elem:
+                if isinstance(element, int):
+                    out = [r for r in out if r.atomic_number == element]
+                else:
+                    out = [r for r in out if r.element == element.title()]
+            if has_edge:
+                out = [r for r in out if r.edge == edge.title()]
+        else:
+            tab = KeskiRahkonenKrauseTable
+            rows = self.query(tab)
+            if has_elem:
+                if isinstance(element, int):
+                    rows = rows.filter(tab.atomic_number==element)
+                else:
+                    rows = rows.filter(tab.element==element.title())
+            if has_edge:
+                rows = rows.filter(tab.edge==edge.title())
+            out = rows.all()
         if len(out) == 1:
             return(out[0].width)
         elif has_elem:
@@ -508,25 +908,10 @@ class xrayDB(object):
             element = self.symbol(element)
         energies = 1.0 * as_ndarray(energies)
 
-        tab = ScatteringTable
-        if kind == 'photo':
-            tab = PhotoAbsorptionTable
-        row = self.query(tab).filter(tab.element==element.title()).all()
-        if len(row) > 0:
-            row = row[0]
-        if not isinstance(row, tab):
+        tabdat = self._elam_arrays(element, kind)
+        if tabdat is None:
             return None
-
-        tab_lne = np.array(json.loads(row.log_energy))
-        if kind.lower().startswith('coh'):
-            tab_val = np.array(json.loads(row.log_coherent_scatter))
-            tab_spl = np.array(json.loads(row.log_coherent_scatter_spline))
-        elif kind.lower().startswith('incoh'):
-            tab_val = np.array(json.loads(row.log_incoherent_scatter))
-            tab_spl = np.array(json.loads(row.log_incoherent_scatter_spline))
-        else:
-            tab_val = np.array(json.loads(row.log_photoabsorption))
-            tab_spl = np.array(json.loads(row.log_photoabsorption_spline))
+        tab_lne, tab_val, tab_spl = tabdat
 
         emin_tab = 10*int(0.102*np.exp(tab_lne[0]))
         energies[np.where(energies < emin_tab)] = emin_tab
@@ -535,6 +920,67 @@ class xrayDB(object):
             return out[0]
         return out
 
+    def Elam_CrossSection_table(self, elements, energies, kind='photo'):
+        """returns Elam Cross Section values for several elements and energies
+
+        arguments
+        ---------
+        elements: list of atomic numbers or atomic symbols for elements
+        energies: energies in eV to calculate cross-sections
+        kind:     one of 'photo', 'coh', and 'incoh' for photo-absorption,
+                  coherent scattering, and incoherent scattering
+                  cross sections, respectively.
+
+        returns 2-d array (len(elements), len(energies)), evaluating
+        the splines for all elements together.
+
+        Data from Elam, Ravel, and Sieber.
+        """
+        energies = 1.0 * as_ndarray(energies)
+        tables, loge = [], []
+        for element in elements:
+            if isinstance(element, int):
+                element = self.symbol(element)
+            tabdat = self._elam_arrays(element, kind)
+            if tabdat is None:
+                raise ValueError("no Elam data for element '%s'" % element)
+            tables.append(tabdat)
+            emin_tab = 10*int(0.102*np.exp(tabdat[0][0]))
+            loge.append(np.log(np.maximum(energies, emin_tab)))
+        if len(tables) == 0:
+            return np.zeros((0, len(energies)))
+        return np.exp(elam_spline_table(tables, np.array(loge)))
+
+    def _elam_arrays(self, element, kind='photo'):
+        """return arrays of log(energy), log(cross-section) and spline
+        coefficients from Elam tables, or None"""
+        if kind.lower().startswith('coh'):
+            cols = ('log_energy', 'log_coherent_scatter',
+                    'log_coherent_scatter_spline')
+        elif kind.lower().startswith('incoh'):
+            cols = ('log_energy', 'log_incoherent_scatter',
+                    'log_incoherent_scatter_spline')
+        else:
+            cols = PHOTO_COLUMNS
+
+        snap = self._snap()
+        if snap is not None:
+            tabs = snap.photo if kind == 'photo' else snap.scatter
+            row = tabs.get(element.title(), None)
+            if row is None:
+                return None
+            return tuple([row[c] for c in cols])
+
+        tab = ScatteringTable
+        if kind == 'photo':
+            tab = PhotoAbsorptionTable
+        row = self.query(tab).filter(tab.element==element.title()).all()
+        if len(row) > 0:
+            row = row[0]
+        if not isinstance(row, tab):
+            return None
+        return tuple([np.array(json.loads(getattr(row, c))) for c in cols])
+
     def mu_elam(self, element, energies, kind='total'):
         """returns X-ray attenuation cross section for an element
         at energies (in eV)
@@ -563,6 +1009,34 @@ class xrayDB(object):
             xsec = calc(element, energies, kind='photo')
         return xsec
 
+    def mu_elam_table(self, elements, energies, kind='total'):
+        """returns X-ray attenuation cross sections for several elements
+        at energies (in eV), as a 2-d array (len(elements), len(energies))
+
+        returns values in units of cm^2 / gr
+
+        arguments
+        ---------
+        elements: list of atomic numbers or atomic symbols for elements
+        energies: energies in eV to calculate cross-sections
+        kind:     'photo', 'coh', 'incoh' or 'total' (default), as
+                  for mu_elam()
+
+        Data from Elam, Ravel, and Sieber.
+        """
+        calc = self.Elam_CrossSection_table
+        if kind.lower().startswith('tot'):
+            xsec = calc(elements, energies, kind='photo')
+            xsec += calc(elements, energies, kind='coh')
+            xsec += calc(elements, energies, kind='incoh')
+        elif kind.lower().startswith('coh'):
+            xsec = calc(elements, energies, kind='coh')
+        elif kind.lower().startswith('incoh'):
+            xsec = calc(elements, energies, kind='incoh')
+        else:
+            xsec = calc(elements, energies, kind='photo')
+        return xsec
+
     def coherent_cross_section_elam(self, element, energies):
         """returns coherenet scattering cross section for an element
         at energies (in eV)
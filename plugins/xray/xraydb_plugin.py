@@ -38,6 +38,21 @@ def get_xraydb(_larch):
     _larch.symtable.set_symbol(symname, xraydb)
     return xraydb
 
+@ValidateLarchPlugin
+def xraydb_preload(snapshot=None, mmap=True, _larch=None):
+    """read all tables of the X-ray database into memory, so that later
+    lookups do not need database queries.
+
+    arguments
+    ---------
+    snapshot:  name of snapshot file.  If this exists, the tables are
+               loaded from it, otherwise they are read from the database
+               and saved to this file for faster loading next time.
+    mmap:      whether to memory-map the arrays in the snapshot file [True]
+    """
+    xdb = get_xraydb(_larch)
+    xdb.preload(snapshot=snapshot, mmap=mmap)
+
 @ValidateLarchPlugin
 def f0(ion, q, _larch=None):
     """returns elastic x-ray scattering factor, f0(q), for an ion.
@@ -60,6 +75,26 @@ def f0(ion, q, _larch=None):
     xdb = get_xraydb(_larch)
     return xdb.f0(ion, q)
 
+@ValidateLarchPlugin
+def f0_table(ions, q, _larch=None):
+    """returns elastic x-ray scattering factor, f0(q), for a list of
+    ions, as a 2-d array (len(ions), len(q)).  See f0().
+
+    arguments
+    ---------
+    ions: list of atomic numbers, atomic symbols or ionic symbols
+           (case insensitive) of scatterers
+
+    q:    single q value, list, tuple, or numpy array of q value
+              q = sin(theta) / lambda
+          theta = incident angle, lambda = x-ray wavelength
+
+    f0 is evaluated for all ions together, which is much faster than
+    calling f0() for each ion.
+    """
+    xdb = get_xraydb(_larch)
+    return xdb.f0_table(ions, q)
+
 @ValidateLarchPlugin
 def f0_ions(element=None, _larch=None):
     """return list of ion names supported in the f0() calculation from
@@ -180,6 +215,52 @@ def mu_elam(element, energy, kind='total', _larch=None):
     xdb = get_xraydb(_larch)
     return xdb.mu_elam(element, energy, kind=kind)
 
+@ValidateLarchPlugin
+def mu_elam_table(elements, energy, kind='total', _larch=None):
+    """returns x-ray mass attenuation coefficient, mu/rho, for a
+    list of elements and input energy (or array of energies) in eV,
+    as a 2-d array (len(elements), len(energy)).
+    Data is from the Elam tables.
+
+    Values returned are in units of cm^2/gr.
+
+    arguments
+    ---------
+    elements: list of atomic numbers or atomic symbols for elements
+    energy:   energy or array of energies in eV
+    kind:     one of 'total' (default) 'photo', 'coh', and 'incoh' for
+              total, photo-absorption, coherent scattering, and
+              incoherent scattering cross sections, respectively.
+
+    The splines for all elements are evaluated together, which is
+    much faster than calling mu_elam() for each element.
+
+    Data from Elam, Ravel, and Sieber.
+    """
+    xdb = get_xraydb(_larch)
+    return xdb.mu_elam_table(elements, energy, kind=kind)
+
+@ValidateLarchPlugin
+def mu_chantler_table(elements, energy, incoh=False, photo=False, _larch=None):
+    """returns x-ray mass attenuation coefficient, mu/rho, for a
+    list of elements and input energy (or array of energies) in eV,
+    as a 2-d array (len(elements), len(energy)).
+    Data is from the Chantler tables.
+
+    Values returned are in units of cm^2/gr.
+
+    arguments
+    ---------
+    elements: list of atomic numbers or atomic symbols for elements
+    energy:   energy or array of energies in eV
+    photo=True: flag to return only the photo-electric contribution
+    incoh=True: flag to return only the incoherent contribution
+
+    The default is to return total attenuation coefficient.
+    """
+    xdb = get_xraydb(_larch)
+    return xdb.mu_chantler_table(elements, energy, incoh=incoh, photo=photo)
+
 @ValidateLarchPlugin
 def coherent_cross_section_elam(element, energy, _larch=None):
     """returns coherent scattering cross section
@@ -459,14 +540,16 @@ class Scatterer:
     """
     def __init__(self, symbol, energy=10000, _larch=None):
         # atomic symbol and incident x-ray energy (eV)
+        xdb = get_xraydb(_larch)
         self.symbol = symbol
-        self.number = atomic_number(symbol, _larch=_larch)
-        self.mass   = atomic_mass(symbol, _larch=_larch)
-        self.f1     = chantler_data(symbol, energy, 'f1', _larch=_larch)
+        edata = xdb._getElementData(symbol)
+        self.number = int(edata.atomic_number)
+        self.mass   = edata.molar_mass
+        self.f1     = xdb._getChantler(symbol, energy, column='f1')
         self.f1     = self.f1 + self.number
-        self.f2     = chantler_data(symbol, energy, 'f2', _larch=_larch)
-        self.mu_photo = chantler_data(symbol, energy, 'mu_photo', _larch=_larch)
-        self.mu_total = chantler_data(symbol, energy, 'mu_total', _larch=_larch)
+        self.f2     = xdb._getChantler(symbol, energy, column='f2')
+        self.mu_photo = xdb._getChantler(symbol, energy, column='mu_photo')
+        self.mu_total = xdb._getChantler(symbol, energy, column='mu_total')
 
 def xray_delta_beta(material, density, energy, photo_only=False, _larch=None):
     """
@@ -524,13 +607,16 @@ def initializeLarchPlugin(_larch=None):
 
 
 def registerLarchPlugin():
-    return (MODNAME, {'f0': f0, 'f0_ions': f0_ions,
+    return (MODNAME, {'f0': f0, 'f0_ions': f0_ions, 'f0_table': f0_table,
+                      'xraydb_preload': xraydb_preload,
                       'chantler_energies': chantler_energies,
                       'chantler_data': chantler_data,
                       'f1_chantler': f1_chantler,
                       'f2_chantler': f2_chantler,
                       'mu_chantler': mu_chantler,
                       'mu_elam': mu_elam,
+                      'mu_elam_table': mu_elam_table,
+                      'mu_chantler_table': mu_chantler_table,
                       'coherent_xsec': coherent_cross_section_elam,
                       'incoherent_xsec': incoherent_cross_section_elam,
                       'atomic_number': atomic_number,
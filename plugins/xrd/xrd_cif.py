@@ -32,6 +32,8 @@ except ImportError:
 
 imag = complex(0,1)
 
+_xraydb = None
+
 elem_symbol = ['H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Na', 'Mg', 'Al',
                'Si', 'P', 'S', 'Cl', 'Ar', 'K', 'Ca', 'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe',
                'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr',
@@ -2670,7 +2672,7 @@ class CIFcls(object):
     def structure_factors(self, wvlgth=1.54056, q_min=0.2, q_max=10.0):
 
         hkl_list = generate_hkl()
-        xraydb = xrayDB()
+        xraydb = get_xraydb()
         
         dhkl = d_from_hkl(hkl_list,*self.unitcell)
         qhkl = q_from_d(dhkl)
@@ -2681,15 +2683,14 @@ class CIFcls(object):
         ii,jj = qhkl < q_max,qhkl > q_min
         ii = jj*ii        
         
-        for i,hkl in enumerate(hkl_list):
-            Fhkl = 0
-            if ii[i]:
-                for el in self.atom.label:  ## loops through each element
-                    f0 = xraydb.f0(el, qhkl[i]/(4*math.pi)) # xraydb.f0(el, 1/(2*dhkl[i]))
-                    for uvw in self.elem_uvw[el]: ## loops through each position in unit cell
-                        hukvlw = hkl[0]*uvw[0]+hkl[1]*uvw[1]+hkl[2]*uvw[2]## (hu+kv+lw)
-                        Fhkl = Fhkl + f0*(cmath.exp(2*cmath.pi*imag*hukvlw)).real
-            if abs(Fhkl) > 1e-5: F2hkl[i] = np.float(Fhkl**2)
+        ## f0 for all elements and all reflections in range, in one call
+        f0 = xraydb.f0_table(self.atom.label, qhkl[ii]/(4*math.pi)) # xraydb.f0(el, 1/(2*dhkl[i]))
+        Fhkl = np.zeros(np.count_nonzero(ii))
+        for i,el in enumerate(self.atom.label):  ## loops through each element
+            uvw = np.array(self.elem_uvw[el], dtype=np.float64) ## positions in unit cell
+            hukvlw = np.dot(hkl_list[ii], uvw.T) ## (hu+kv+lw)
+            Fhkl = Fhkl + f0[i]*np.cos(2*np.pi*hukvlw).sum(axis=1)
+        F2hkl[ii] = np.where(abs(Fhkl) > 1e-5, Fhkl**2, 0)
         
         ## removes zero value structure factors
         jj = F2hkl > 0.001
@@ -2702,7 +2703,7 @@ class CIFcls(object):
         self.hkl      = np.zeros(kk,dtype=np.ndarray)
         self.qhkl     = np.zeros(kk,dtype=np.float32)
         self.F2hkl    = np.zeros(kk,dtype=np.float32)
-        self.phkl     = np.zeros(kk,dtype=np.int)
+        self.phkl     = np.zeros(kk,dtype=int)
         
         for i,row in enumerate(zip(list(hkl_list[ii]),qhkl[ii],F2hkl[ii])):
             hkl,q,F2 = row
@@ -2724,6 +2725,16 @@ class CIFcls(object):
         twth = np.radians(twth)
         return (1+np.cos(twth)**2)/(np.sin(twth/2)**2*np.cos(twth/2))
 
+def get_xraydb():
+    '''
+    returns xrayDB shared by all CIFcls, which holds the f0 coefficients
+    after first use
+    '''
+    global _xraydb
+    if _xraydb is None:
+        _xraydb = xrayDB()
+    return _xraydb
+
 def check_elemsym(atom):
 
     match_list = []
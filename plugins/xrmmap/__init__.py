@@ -8,3 +8,4 @@ from .asciifiles import (readASCII, readMasterFile, readROIFile,
 from .xrm_mapfile import (read_xrfmap, h5str, ensure_subgroup,
                           GSEXRM_MapFile, GSEXRM_FileStatus,
                           GSEXRM_Exception, GSEXRM_NotOwner)
+from .xanes_map import normalize_xanes_map
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Pre-edge subtraction and normalization of XANES maps, collected as
+a series of XRF maps at different incident energies, for every pixel.
+"""
+import numpy as np
+
+from larch import Group, ValidateLarchPlugin
+from larch.utils import get_nworkers, make_pool
+from larch_plugins.xafs.pre_edge import preedge_stack
+from larch_plugins.xrmmap import ensure_subgroup
+
+MAP_CHUNKSIZE = 16384   # approximate number of pixels in a chunk
+
+def _read_chunk(maps, rows, roi, i0=None, dtcorrect=True):
+    """return the energy stack (nenergy, nrows, ncols) for a slice
+    of rows, from a list of map files or a 3-d array"""
+    if isinstance(maps, np.ndarray) or not hasattr(maps[0], 'return_roimap'):
+        return np.asarray(maps[:, rows, :], dtype='float64')
+    stack = []
+    for mapfile in maps:
+        dat = mapfile.return_roimap(roi[0], roi[1], dtcorrect=dtcorrect,
+                                    rows=rows).astype('float64')
+        if i0 is not None:
+            dat = dat / mapfile.return_roimap(i0[0], i0[1], dtcorrect=dtcorrect,
+                                              rows=rows)
+        stack.append(dat)
+    return np.array(stack)
+
+def _normalize_chunk(args):
+    """normalize one chunk of pixels, returning maps of e0 and edge
+    step (nrows, ncols) and normalized stack (nenergy, nrows, ncols)"""
+    energy, stack, kws = args
+    nen, nrows, ncols = stack.shape
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = preedge_stack(energy, stack.reshape(nen, -1).T,
+                            make_flat=False, **kws)
+    return (out['e0'].reshape(nrows, ncols),
+            out['edge_step'].reshape(nrows, ncols),
+            out['norm'].T.reshape(nen, nrows, ncols))
+
+@ValidateLarchPlugin
+def normalize_xanes_map(energy, maps, roi=None, i0=None, dtcorrect=True,
+                        outfile=None, prefix='xanes', overwrite=False,
+                        chunksize=MAP_CHUNKSIZE, nworkers=None,
+                        processes=False, _larch=None, **kws):
+    """pre-edge subtraction and normalization of every pixel of a
+    XANES map, read and processed in chunks of map rows.
+
+    Parameters:
+    -----------
+      energy:     1-d array of incident energies, in eV
+      maps:       list of GSEXRM_MapFiles, one per energy, or 3-d array
+                  (nenergy, nrows, ncols) of XRF intensities.
+      roi:        (detname, roiname) of ROI map to use, as for
+                  GSEXRM_MapFile.return_roimap() [needed for map files]
+      i0:         (detname, roiname) of map to divide by, such as
+                  ('scalars', 'I0') [None: no division]
+      dtcorrect:  whether to use dead-time corrected maps [True]
+      outfile:    GSEXRM_MapFile to write results to its 'work' group
+                  [None: the first map file, or none for a 3-d array]
+      prefix:     prefix for names of work arrays ['xanes']
+      overwrite:  whether to replace existing work arrays [False]
+      chunksize:  approximate number of pixels in each chunk [16384]
+      nworkers:   number of workers for processing chunks [None: number of CPUs]
+      processes:  use a pool of processes (True) or threads (False) [False]
+      kws:        other keyword arguments (e0, step, nnorm, nvict, pre1,
+                  pre2, norm1, norm2) are passed to preedge_stack()
+
+    Returns:
+    --------
+      group with attributes
+        e0          2-d array of edge energy for each pixel
+        edge_step   2-d array of edge step for each pixel
+        norm        3-d array of normalized XANES, or None if written to
+                    outfile, as work array '<prefix>_norm'
+        names       names of work arrays written to outfile
+
+    Notes:
+    ------
+     1 At most nworkers chunks are held in memory at a time, so memory
+       use does not depend on the map size when writing to outfile.
+     2 Pixels with no edge step give nan or inf for normalized values.
+    """
+    energy = np.asarray(energy, dtype='float64')
+    if isinstance(maps, (list, tuple)) and hasattr(maps[0], 'return_roimap'):
+        if roi is None:
+            raise ValueError("normalize_xanes_map needs roi=(detname, roiname)")
+        if len(maps) != len(energy):
+            raise ValueError("normalize_xanes_map needs one map file per energy")
+        nrows = maps[0].xrmmap['positions/pos'].shape[0]
+        ncols = maps[0].return_roimap(roi[0], roi[1], dtcorrect=dtcorrect,
+                                      rows=slice(0, 1)).shape[1]
+        if outfile is None:
+            outfile = maps[0]
+    else:
+        maps = np.asarray(maps)
+        nen, nrows, ncols = maps.shape
+        if nen != len(energy):
+            raise ValueError("normalize_xanes_map needs one map per energy")
+
+    out = Group(name='normalized XANES map', names=[], norm=None,
+                e0=np.zeros((nrows, ncols)), edge_step=np.zeros((nrows, ncols)))
+    if outfile is not None:
+        workgroup = ensure_subgroup('work', outfile.xrmmap)
+        shapes = {'e0': (nrows, ncols), 'edge_step': (nrows, ncols),
+                  'norm': (len(energy), nrows, ncols)}
+        for attr in ('e0', 'edge_step', 'norm'):
+            name = '%s_%s' % (prefix, attr)
+            if name in workgroup:
+                if not overwrite:
+                    raise ValueError("array name '%s' exists in work arrays" % name)
+                outfile.del_work_array(name)
+            workgroup.create_dataset(name, shapes[attr], dtype='float64')
+            out.names.append(name)
+        norm = workgroup[out.names[2]]
+        norm.attrs['energy'] = energy
+    else:
+        norm = out.norm = np.zeros((len(energy), nrows, ncols))
+
+    nchunk = max(1, int(chunksize/max(1, ncols)))
+    chunks = [slice(r, min(nrows, r+nchunk)) for r in range(0, nrows, nchunk)]
+    nworkers = min(get_nworkers(nworkers), len(chunks))
+    pool = None
+    if nworkers > 1:
+        pool = make_pool(nworkers, processes=processes)
+    try:
+        for iwave in range(0, len(chunks), nworkers):
+            wave = chunks[iwave:iwave+nworkers]
+            tasks = [(energy, _read_chunk(maps, rows, roi, i0=i0,
+                                          dtcorrect=dtcorrect), kws)
+                     for rows in wave]
+            if pool is None:
+                results = [_normalize_chunk(task) for task in tasks]
+            else:
+                results = pool.map(_normalize_chunk, tasks)
+            for rows, (e0, step, chunknorm) in zip(wave, results):
+                out.e0[rows] = e0
+                out.edge_step[rows] = step
+                norm[:, rows, :] = chunknorm
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if outfile is not None:
+        workgroup[out.names[0]][...] = out.e0
+        workgroup[out.names[1]][...] = out.edge_step
+        outfile.h5root.flush()
+    return out
+
+def registerLarchPlugin():
+    return ('_xrf', {'normalize_xanes_map': normalize_xanes_map})
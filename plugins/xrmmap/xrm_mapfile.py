@@ -2904,7 +2904,8 @@ class GSEXRM_MapFile(object):
             return self.xrmmap[dat][:, :, imap]
 
 
-    def return_roimap(self, detname, roiname, dtcorrect=True, no_hotcols=False):
+    def return_roimap(self, detname, roiname, dtcorrect=True, no_hotcols=False,
+                      rows=None):
         '''extract roi map for a pre-defined roi by name
 
         Parameters
@@ -2913,6 +2914,7 @@ class GSEXRM_MapFile(object):
         roiname :    str    ROI name
         dtcorrect :  optional, bool [True]         dead-time correct data
         no_hotcols   optional, bool [False]        suprress hot columns
+        rows         optional, slice [None]        rows of map to return (all if None)
 
         Returns
         -------
@@ -2921,10 +2923,12 @@ class GSEXRM_MapFile(object):
 
         scan_version = getattr(self, 'scan_version', 1.00)
         no_hotcols = no_hotcols and scan_version < 1.36
+        if rows is None:
+            rows = slice(None)
 
         
         if roiname == '1':
-            map = np.ones(self.xrmmap['positions']['pos'][:].shape[:-1])
+            map = np.ones(self.xrmmap['positions']['pos'][:].shape[:-1])[rows]
             if no_hotcols:
                 return map[:, 1:-1]
             else:
@@ -2939,9 +2943,9 @@ class GSEXRM_MapFile(object):
                 dat = '%s/cor' % dat if dtcorrect else '%s/raw' % dat
             
             if no_hotcols:
-                return self.xrmmap[dat][:, 1:-1]
+                return self.xrmmap[dat][rows, 1:-1]
             else:
-                return self.xrmmap[dat][:, :]
+                return self.xrmmap[dat][rows, :]
 
         else:
             roi_list = [h5str(r).lower() for r in self.xrmmap['roimap/sum_name']]
@@ -2956,18 +2960,18 @@ class GSEXRM_MapFile(object):
                     dat = 'roimap/sum_cor' if dtcorrect else 'roimap/sum_raw'
 
                 if no_hotcols:
-                    return self.xrmmap[dat][:, 1:-1, imap]
+                    return self.xrmmap[dat][rows, 1:-1, imap]
                 else:
-                    return self.xrmmap[dat][:, :, imap]
+                    return self.xrmmap[dat][rows, :, imap]
 
             else:
                 dat = 'roimap/%s/%s' % (detname,roiname)
                 dat = '%s/cor' % dat if dtcorrect else '%s/raw' % dat
 
                 if no_hotcols:
-                    return self.xrmmap[dat][:, 1:-1]
+                    return self.xrmmap[dat][rows, 1:-1]
                 else:
-                    return self.xrmmap[dat][:, :]
+                    return self.xrmmap[dat][rows, :]
 
     def get_mca_erange(self, det=None, dtcorrect=True,
                        emin=None, emax=None, by_energy=True):
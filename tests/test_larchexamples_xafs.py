@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 """ Tests of Larch Scripts  """
+import os
+import sys
 import unittest
 import time
 import ast
+import shutil
+import tempfile
 import numpy as np
 from sys import version_info
 
@@ -10,6 +14,7 @@ from utils import TestCase
 from larch import Interpreter
 class TestScripts(TestCase):
     '''testing of asteval'''
+
     def test01_basic(self):
         self.runscript('a.lar', dirname='larch_scripts')
         assert(len(self.session.get_errors()) == 0)
@@ -117,7 +122,7 @@ class TestScripts(TestCase):
         self.runscript('doc_feffit1.lar', dirname='../examples/feffit/')
         assert(len(self.session.get_errors()) == 0)
 
-        self.isTrue('out.nfev > 20')
+        self.isTrue('out.nfev > 5')
         self.isTrue('out.nfev < 100')
         self.isTrue('out.chi_square > 0.2')
         self.isTrue('out.chi_square < 2000')
@@ -149,6 +154,427 @@ class TestScripts(TestCase):
         self.isTrue('path1.geom[0][1] == 26')
         self.isTrue('path1.geom[1][1] == 8')
 
+    def test15_autobk_batch(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("autobk(cu, rbkg=1.0)")
+        self.session.run("mus = array([cu.mu, 2*cu.mu, 3*cu.mu])")
+        self.session.run("out = group()")
+        self.session.run("autobk_batch(cu.energy, mus, group=out, rbkg=1.0, nworkers=2)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("out.chi.shape == (3, len(cu.k))")
+        self.isTrue("out.bkg.shape == (3, len(cu.energy))")
+        self.isTrue("len(out.e0) == 3")
+        self.isNear("out.edge_step[1]/out.edge_step[0]", 2.0, places=3)
+        self.isTrue("max(abs(out.chi[0] - cu.chi)) < 1.e-6")
+
+    def test16_feffit_jacobian(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("vals = [getattr(pars, n).value for n in out.var_names]")
+        self.session.run("out2 = feffit(pars, dset, analytic_jacobian=False)")
+        self.session.run("vals2 = [getattr(pars, n).value for n in out.var_names]")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("out.nfev < 60")
+        self.isTrue("abs(out.chi_square - out2.chi_square) < 1.e-3")
+        self.isTrue("max(abs(array(vals) - array(vals2))) < 1.e-4")
+
+    def test17_feffit_parallel(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("dset2 = feffit_dataset(data=cu_data, pathlist=[path1, path2, path3], transform=trans)")
+        self.session.run("out1 = feffit(pars, [dset, dset2])")
+        self.session.run("vals = [getattr(pars, n).value for n in out1.var_names]")
+        self.session.run("out2 = feffit(pars, [dset, dset2], nworkers=2)")
+        self.session.run("vals2 = [getattr(pars, n).value for n in out1.var_names]")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("abs(out1.chi_square - out2.chi_square) < 1.e-3")
+        self.isTrue("max(abs(array(vals) - array(vals2))) < 1.e-4")
+
+    def test18_sigma2_debye_table(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("paths = [path1, path2, path3]")
+        self.session.run("s2tab = sigma2_debye_table(paths, [10, 150, 300], 315.0)")
+        self.session.run("s2one = sigma2_debye(300, 315.0, path=path2)")
+        self.session.run("e2tab = sigma2_eins_table(paths, [10, 300], 250.0)")
+        self.session.run("e2one = sigma2_eins(300, 250.0, path=path3)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("s2tab.shape == (3, 3)")
+        self.isNear("s2tab[0, 2]", 0.009038, places=5)
+        self.isTrue("abs(s2tab[1, 2] - s2one) < 1.e-10")
+        self.isTrue("abs(e2tab[2, 1] - e2one) < 1.e-10")
+        self.session.run("clear_sigma2_cache()")
+        self.session.run("s2tab2 = sigma2_debye_table(paths, [10, 150, 300], 315.0)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("allclose(s2tab, s2tab2, rtol=1.e-12, atol=0)")
+
+    def test19_feffdat_cache(self):
+        cachedir = tempfile.mkdtemp()
+        self.session.run("olddir = set_feffdat_cache(cachedir='%s')" % cachedir)
+        try:
+            self.session.run("clear_feffdat_cache()")
+            self.session.run("p1 = feffpath('../examples/feffit/feff0001.dat')")
+            self.session.run("p2 = feffpath('../examples/feffit/feff0001.dat')")
+            self.session.run("clear_feffdat_cache('../examples/feffit/feff0001.dat', disk=False)")
+            self.session.run("p3 = feffpath('../examples/feffit/feff0001.dat')")
+            p3 = self.session.symtable.get_symbol('p3')
+            p3.geom[0] = ('X', 0, 0, 1.0, 0, 0, 0)
+            self.session.run("p4 = feffpath('../examples/feffit/feff0001.dat')")
+            assert(len(self.session.get_errors()) == 0)
+            assert(len(os.listdir(cachedir)) == 1)
+            for p in ('p2', 'p3', 'p4'):
+                self.isTrue("%s.reff == p1.reff" % p)
+                self.isTrue("%s.degen == p1.degen" % p)
+                self.isTrue("%s._feffdat.rnorman == p1._feffdat.rnorman" % p)
+                self.isTrue("max(abs(%s._feffdat.amp - p1._feffdat.amp)) < 1.e-12" % p)
+                self.isTrue("max(abs(%s._feffdat.pha - p1._feffdat.pha)) < 1.e-12" % p)
+            self.isTrue("p2.geom == p1.geom")
+            self.isTrue("p4.geom == p1.geom")
+            self.isTrue("p3.geom[0][0] == 'X'")
+            self.isTrue("p1.geom[0][0] != 'X'")
+        finally:
+            self.session.run("set_feffdat_cache(cachedir=olddir)")
+            shutil.rmtree(cachedir)
+
+    def test20_feffit_batch(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("d2 = group(k=cu_data.k, chi=cu_data.chi*0.9)")
+        self.session.run("d3 = group(k=cu_data.k)")
+        self.session.run("amp0 = pars.amp.value")
+        self.session.run("res = feffit_batch(pars, [path1, path2, path3], trans, [cu_data, d2, d3], nworkers=2)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("len(res) == 3")
+        self.isTrue("res[0].success and res[1].success")
+        self.isTrue("not res[2].success and res[2].error is not None")
+        self.isTrue("abs(res[0].chi_square - out.chi_square) < 1.e-3")
+        self.isNear("res[1].params['amp'].value/res[0].params['amp'].value", 0.9, places=3)
+        self.isTrue("pars.amp.value == amp0")
+
+    def test21_feffit_bootstrap(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("bs = feffit_bootstrap(pars, dset, nsamples=6, seed=1, nworkers=2)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("bs.samples.shape == (6, len(bs.names))")
+        self.isTrue("bs.nfailed == 0")
+        self.isTrue("bs.errors == []")
+        self.isTrue("bs.correl.shape == (len(bs.names), len(bs.names))")
+        self.isTrue("all(bs.stderr > 0)")
+        self.isTrue("all(bs.percentiles[:, 0] <= bs.percentiles[:, 4])")
+        self.isTrue("abs(bs.mean[1] - pars.amp.value) < 0.05")
+        self.isTrue("abs(pars.amp.value - out.params['amp'].value) < 1.e-4")
+
+    def test22_feffit_path_stderr(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        for path in ('path1', 'path2', 'path3'):
+            self.session.run("dr = %s.params['deltar__%%s' %% %s.label]" % (path, path))
+            self.session.run("s2 = %s.params['s02__%%s' %% %s.label]" % (path, path))
+            self.isNear("dr.stderr/(pars.alpha.stderr*%s.reff)" % path, 1.0, places=5)
+            self.isNear("s2.stderr/pars.amp.stderr", 1.0, places=5)
+
+    def test23_pre_edge_stack(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("pre_edge(cu)")
+        self.session.run("mus = array([cu.mu, 2*cu.mu, 3*cu.mu + 0.1])")
+        self.session.run("out = group()")
+        self.session.run("pre_edge_stack(cu.energy, mus, group=out)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("out.norm.shape == (3, len(cu.energy))")
+        self.isTrue("all(out.e0 == cu.e0)")
+        self.isNear("out.edge_step[1]/cu.edge_step", 2.0, places=6)
+        self.isTrue("max(abs(out.norm[2] - cu.norm)) < 1.e-8")
+        self.isTrue("max(abs(out.flat[0] - cu.flat)) < 1.e-5")
+
+    def test24_normalize_xanes_map(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("pre_edge(cu)")
+        self.session.run("scale = 1 + arange(35).reshape(5, 7)/10.0")
+        self.session.run("stack = cu.mu[:, newaxis, newaxis] * scale")
+        self.session.run("xmap = normalize_xanes_map(cu.energy, stack, chunksize=10, nworkers=2)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("xmap.norm.shape == (len(cu.energy), 5, 7)")
+        self.isTrue("xmap.e0 == cu.e0")
+        self.isTrue("abs(xmap.edge_step/scale - cu.edge_step) < 1.e-8")
+        self.isTrue("max(abs(xmap.norm[:, 4, 6] - cu.norm)) < 1.e-8")
+
+    def test25_glinbroad(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("pre_edge(cu)")
+        self.session.run("en = linspace(8900, 9200, 1201)")
+        self.session.run("norm = interp(cu.energy, cu.norm, en)")
+        self.session.run("c1 = glinbroad(en, norm, fwhm_e=2.0*ones(len(en)))")
+        self.session.run("c2 = glinbroad(en, norm, fwhm_e=2.0 + (en-en[0])/1.e12)")
+        self.session.run("c3 = glinbroad(en, array([norm, 2*norm]), fwhm_e=2.0)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("c3.shape == (2, len(en))")
+        self.isTrue("max(abs(c1 - c2)) < 1.e-5")
+        self.isTrue("max(abs(c3[1] - 2*c1)) < 1.e-10")
+        self.isTrue("max(abs(c1 - norm)) > 0.01")
+
+    def test26_mback_batch(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("mback(cu, z=29, edge='K', order=3)")
+        self.session.run("mus = array([cu.mu, 2*cu.mu + 0.3])")
+        self.session.run("out = group()")
+        self.session.run("mback_batch(cu.energy, mus, group=out, z=29, edge='K', order=3)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("out.norm.shape == (2, len(cu.energy))")
+        self.isNear("out.edge_step[0]/cu.edge_step", 1.0, places=4)
+        self.isNear("out.edge_step[1]/out.edge_step[0]", 2.0, places=6)
+        self.isTrue("max(abs(out.norm[0] - cu.norm)) < 1.e-4")
+        self.isTrue("max(abs(out.norm[1] - out.norm[0])) < 1.e-6")
+
+    def test27_xftf_batch(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("autobk(cu, rbkg=1.0)")
+        self.session.run("xftf(cu, kmin=2, kmax=15, dk=3, kweight=2)")
+        self.session.run("xftr(cu.r, cu.chir, group=cu, rmin=1, rmax=3)")
+        self.session.run("chis = array([cu.chi, 2*cu.chi, cu.chi*cu.k])")
+        self.session.run("out = group()")
+        self.session.run("xftf_batch(cu.k, chis, group=out, kmin=2, kmax=15, dk=3, kweight=2)")
+        self.session.run("xftr_batch(out.r, out.chir, group=out, rmin=1, rmax=3)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("out.chir.shape == (3, len(cu.r))")
+        self.isTrue("max(abs(out.chir[0] - cu.chir)) < 1.e-12")
+        self.isTrue("max(abs(out.chir_mag[1] - 2*cu.chir_mag)) < 1.e-12")
+        self.isTrue("max(abs(out.chiq[0] - cu.chiq)) < 1.e-12")
+
+    def test28_batch_bad_spectrum(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("autobk(cu, rbkg=1.0)")
+        self.session.run("bad = 1.0*cu.mu")
+        self.session.run("bad[100] = nan")
+        self.session.run("mus = array([cu.mu, bad, 0*cu.mu, 2*cu.mu])")
+        self.session.run("out = group()")
+        self.session.run("autobk_batch(cu.energy, mus, group=out, rbkg=1.0, nworkers=2)")
+        self.session.run("pre = group()")
+        self.session.run("pre_edge_batch(cu.energy, mus, group=pre, nworkers=2)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("out.chi.shape == (4, len(cu.k))")
+        self.isTrue("isnan(out.e0[2])")
+        self.isTrue("isnan(out.chi[2])")
+        self.isTrue("isnan(out.bkg[2])")
+        self.isTrue("out.errors[0] is None")
+        self.isTrue("out.errors[2] is not None")
+        self.isTrue("out.errors[3] is None")
+        self.isTrue("max(abs(out.chi[0] - cu.chi)) < 1.e-6")
+        self.isNear("out.edge_step[3]/out.edge_step[0]", 2.0, places=3)
+        self.isTrue("isnan(pre.e0[2])")
+        self.isTrue("pre.errors[2] is not None")
+        self.isTrue("pre.errors[3] is None")
+        self.isNear("pre.edge_step[3]/pre.edge_step[0]", 2.0, places=4)
+
+    def test29_autobk_engine(self):
+        # chi(k) values and nfev from autobk() before the spline basis
+        # and analytic Jacobian were used
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("pre_edge(cu)")
+        self.session.run("autobk(cu, rbkg=1.0, kweight=2)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("len(cu.k) == 350")
+        self.isNear("cu.chi[60]", -0.07339029, places=4)
+        self.isNear("cu.chi[100]", 0.06669441, places=4)
+        self.isNear("cu.chi[160]", 0.02276195, places=4)
+        self.isNear("cu.chi[240]", 0.00174084, places=4)
+        self.isNear("cu.chi[300]", 0.00041364, places=4)
+        self.isTrue("cu.autobk_details.nfev < 157")
+        self.isTrue("cu.autobk_details.params['coef_00'].stderr > 0")
+
+    def test30_diffkk_fft(self):
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("mkws = {'e0': 8979, 'order': 4}")
+        self.session.run("dk = diffkk(cu.energy, cu.mu, z=29, edge='K', mback_kws=mkws)")
+        self.session.run("dk.kk(how='fft')")
+        self.session.run("fp_fft = 1.0*dk.fp")
+        self.session.run("dk.kk(how='vector')")
+        self.session.run("mus = array([cu.mu, 2*cu.mu])")
+        self.session.run("dk2 = diffkk(cu.energy, mus, z=29, edge='K', mback_kws=mkws)")
+        self.session.run("dk2.kk(how='fft')")
+        self.session.run("fp2_fft = 1.0*dk2.fp")
+        self.session.run("dk2.kk(how='vector')")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("allclose(fp_fft, dk.fp, rtol=1.e-8, atol=1.e-8)")
+        self.isTrue("fp2_fft.shape == (2, len(cu.energy))")
+        self.isTrue("allclose(fp2_fft, dk2.fp, rtol=1.e-8, atol=1.e-8)")
+        self.isTrue("allclose(fp2_fft[0], fp_fft, rtol=1.e-8, atol=1.e-8)")
+
+        # the transforms themselves, forward and reverse, 1-d and 2-d
+        diffkk = self.session.symtable.get_symbol('_xafs.diffkk')
+        mod = sys.modules[diffkk.func.__module__]
+        e = np.linspace(8800.0, 9800.0, 200)
+        f = np.exp(-((e - 9000.0)/40.0)**2) + 0.1*np.sin(e/25.0)
+        f2 = np.array([f, 0.5*f + np.cos(e/30.0)])
+        for fft, vec, sca in ((mod.kkmclf_fft, mod.kkmclf, mod.kkmclf_sca),
+                              (mod.kkmclr_fft, mod.kkmclr, mod.kkmclr_sca)):
+            out = vec(e, f)
+            self.assertTrue(np.allclose(out, sca(e, f), rtol=1.e-8, atol=1.e-10))
+            self.assertTrue(np.allclose(fft(e, f), out, rtol=1.e-8, atol=1.e-10))
+            out2 = fft(e, f2)
+            self.assertEqual(out2.shape, f2.shape)
+            for i in range(len(f2)):
+                self.assertTrue(np.allclose(out2[i], vec(e, f2[i]),
+                                            rtol=1.e-8, atol=1.e-10))
+
+    def test31_transform_rebuild(self):
+        self.session.run("k = 0.05*arange(401)")
+        self.session.run("chi = sin(4.4*k)*exp(-k/10.0)")
+        self.session.run("trans = feffit_transform(kmin=2, kmax=12, kweight=2, dk=1, window='kaiser')")
+        self.session.run("chir1 = trans.fftf(chi)")
+        self.session.run("trans.kmin = 3")
+        self.session.run("trans.kweight = 3")
+        self.session.run("trans.window = 'hanning'")
+        self.session.run("chir2 = trans.fftf(chi)")
+        self.session.run("chiq2 = trans.fftr(chir2)")
+        self.session.run("fresh = feffit_transform(kmin=3, kmax=12, kweight=3, dk=1, window='hanning')")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("not allclose(chir1, chir2)")
+        self.isTrue("allclose(trans.kwin, fresh.kwin)")
+        self.isTrue("trans._qslice == fresh._qslice")
+        self.isTrue("allclose(chir2, fresh.fftf(chi))")
+        self.isTrue("allclose(chiq2, fresh.fftr(fresh.fftf(chi)))")
+
+    def test32_feff_batch(self):
+        # a stand-in for Feff: each job waits for the other to start,
+        # so that both finish only if they run at the same time
+        tmpdir = tempfile.mkdtemp(prefix='larch_feffbatch_')
+        try:
+            started = os.path.join(tmpdir, 'started')
+            os.mkdir(started)
+            exe = os.path.join(tmpdir, 'fakefeff')
+            with open(exe, 'w') as fh:
+                fh.write("""#!/bin/sh
+touch %s/`basename $PWD`
+n=0
+while [ `ls %s | wc -l` -lt 2 ] && [ $n -lt 100 ]; do
+    sleep 0.05
+    n=`expr $n + 1`
+done
+ls %s | wc -l > nstarted
+pwd > workdir
+echo 'mu_new=   -3.50000'
+echo 'path 1' > feff0001.dat
+echo 'feff0001.dat' > files.dat
+""" % (started, started, started))
+            os.chmod(exe, 0o755)
+            os.mkdir(os.path.join(tmpdir, 'site1'))
+            for fname in ('site1/feff.inp', 'site2.inp'):
+                with open(os.path.join(tmpdir, fname), 'w') as fh:
+                    fh.write('TITLE %s\n' % fname)
+
+            self.session.symtable.set_symbol('_tmp_feffdir', tmpdir)
+            self.session.symtable.set_symbol('_tmp_feffexe', exe)
+            self.session.run("inps = [_tmp_feffdir + '/site1', _tmp_feffdir + '/site2.inp']")
+            self.session.run("runs = feff_batch(inps, exe=_tmp_feffexe, nworkers=2)")
+            assert(len(self.session.get_errors()) == 0)
+            self.isTrue("[r.status for r in runs] == ['ok', 'ok']")
+            self.isTrue("runs[0].threshold == ['-3.50000']")
+            for folder in ('site1', 'site2'):
+                workdir = os.path.join(tmpdir, folder)
+                self.assertTrue(os.path.isfile(os.path.join(workdir, 'feff.inp')))
+                self.assertTrue(os.path.isfile(os.path.join(workdir, 'feff0001.dat')))
+                with open(os.path.join(workdir, 'workdir')) as fh:
+                    self.assertEqual(os.path.realpath(fh.read().strip()),
+                                     os.path.realpath(workdir))
+                with open(os.path.join(workdir, 'nstarted')) as fh:
+                    self.assertEqual(int(fh.read().strip()), 2)
+
+            # a second run finds both jobs up to date
+            os.unlink(os.path.join(tmpdir, 'site1', 'feff0001.dat'))
+            self.session.run("runs2 = feff_batch(inps, exe=_tmp_feffexe, nworkers=2)")
+            assert(len(self.session.get_errors()) == 0)
+            self.isTrue("[r.status for r in runs2] == ['cached', 'cached']")
+            self.assertFalse(os.path.isfile(os.path.join(tmpdir, 'site1',
+                                                         'feff0001.dat')))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test33_conv_reference(self):
+        # values from the element-by-element conv() before conv_matrix()
+        self.session.run("cu = read_ascii('../examples/xafsdata/cu_rt01.xmu')")
+        self.session.run("en = linspace(8900, 9200, 401)")
+        self.session.run("mu = interp(cu.energy, cu.mu, en)")
+        self.session.run("fw = 1.0 + 3.0*clip((en-8950)/150.0, 0, 1)")
+        self.session.run("g1 = glinbroad(en, mu, fwhm_e=2.0)")
+        self.session.run("g2 = glinbroad(en, mu, fwhm_e=fw)")
+        assert(len(self.session.get_errors()) == 0)
+        conv_matrix = self.session.symtable.get_symbol('_math.conv_matrix')
+        mod = sys.modules[conv_matrix.func.__module__]
+        en = self.session.symtable.get_symbol('en')
+        mu = self.session.symtable.get_symbol('mu')
+        g1 = self.session.symtable.get_symbol('g1')
+        g2 = self.session.symtable.get_symbol('g2')
+        l1 = mod.conv(en, mu, kernel='lorentzian', fwhm_e=2.0)
+        l2 = mod.conv(en, mu, kernel='lorentzian', fwhm_e=2.0*np.ones(len(en)),
+                      matrix=mod.conv_matrix(en, 2.0, kernel='lorentzian'))
+        self.assertTrue(np.allclose(l1, l2, rtol=0, atol=1.e-12))
+        idx = [50, 100, 150, 250, 350]
+        for out, ref in ((g1, [-1.34167590, -1.28995805, 1.06699265,
+                               1.21340267, 0.97206708]),
+                         (g2, [-1.34169511, -1.29105830, 1.06920973,
+                               1.21653196, 0.97884945]),
+                         (l1, [-1.34159760, -1.28625853, 1.07509965,
+                               1.21486792, 0.97469463])):
+            for i, val in zip(idx, ref):
+                self.assertAlmostEqual(out[i], val, places=7)
+
+    def test34_ff2chi_stack(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("tot = ff2chi([path1, path2, path3], paramgroup=pars)")
+        self.session.run("stacked = [1.0*path1.chi, 1.0*path2.chi, 1.0*path3.chi]")
+        self.session.run("path2chi(path1, paramgroup=pars, k=tot.k)")
+        self.session.run("path2chi(path2, paramgroup=pars, k=tot.k)")
+        self.session.run("path2chi(path3, paramgroup=pars, k=tot.k)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("allclose(stacked[0], path1.chi, rtol=1.e-10, atol=1.e-12)")
+        self.isTrue("allclose(stacked[1], path2.chi, rtol=1.e-10, atol=1.e-12)")
+        self.isTrue("allclose(stacked[2], path3.chi, rtol=1.e-10, atol=1.e-12)")
+        self.isTrue("allclose(tot.chi, path1.chi + path2.chi + path3.chi, rtol=1.e-10, atol=1.e-12)")
+        self.isTrue("max(abs(path3.chi)) > 1.e-3")
+
+    def test35_feff_table_cache(self):
+        self.runscript('doc_feffit2.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.session.run("kgrid = 0.05*arange(341)")
+        self.session.run("path2chi(path1, paramgroup=pars, k=kgrid)")
+        self.session.run("chi1 = 1.0*path1.chi")
+        self.session.run("hits, misses = path1.table_cache.hits, path1.table_cache.misses")
+        self.session.run("path2chi(path1, paramgroup=pars, k=kgrid)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("path1.table_cache.hits == hits + 1")
+        self.isTrue("path1.table_cache.misses == misses")
+        self.isTrue("allclose(path1.chi, chi1, rtol=0, atol=0)")
+
+        # a new e0 misses the cache, and the cached tables match fresh ones
+        self.session.run("pars.del_e0.value = pars.del_e0.value + 0.5")
+        self.session.run("path2chi(path1, paramgroup=pars, k=kgrid)")
+        self.session.run("chi2 = 1.0*path1.chi")
+        self.session.run("path1.table_cache.clear()")
+        self.session.run("path2chi(path1, paramgroup=pars, k=kgrid)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("path1.table_cache.misses == 1")
+        self.isTrue("not allclose(chi2, chi1)")
+        self.isTrue("allclose(path1.chi, chi2, rtol=0, atol=0)")
+
+    def test36_cauchy_wavelet_reference(self):
+        # values from cauchy_wavelet() before the batched transform
+        self.session.run("d = read_ascii('../examples/xafsdata/cu10k.chi', labels='k chi')")
+        self.session.run("cauchy_wavelet(d, kweight=2)")
+        self.session.run("d2 = group()")
+        self.session.run("cauchy_wavelet(d.k, d.chi, group=d2, kweight=2, chunksize=50)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("d.wcauchy.shape == (326, 500)")
+        self.isNear("d.wcauchy_mag.sum()", 2536.50287318, places=6)
+        self.isNear("d.wcauchy_re[50, 100]", -0.00719421774, places=9)
+        self.isNear("d.wcauchy_im[50, 100]",  0.00543178875, places=9)
+        self.isNear("d.wcauchy_re[80, 200]",  0.01560133701, places=9)
+        self.isNear("d.wcauchy_im[80, 200]", -0.09209949273, places=9)
+        self.isNear("d.wcauchy_mag[120, 300]", 0.00299836393, places=9)
+        self.isNear("d.wcauchy_mag[200, 150]", 0.01627321041, places=9)
+        self.isTrue("allclose(d2.wcauchy, d.wcauchy, rtol=0, atol=1.e-14)")
+
 if __name__ == '__main__':  # pragma: no cover
     for suite in (TestScripts,):
         suite = unittest.TestLoader().loadTestsFromTestCase(suite)
@@ -23,6 +23,78 @@ class TestScripts(TestCase):
         self.isTrue("zn_iz == 30")
         self.isTrue("zn_mass > 60.")
 
+    def test3_xraydb_preload(self):
+        self.session.run("mu1 = mu_elam('Fe', linspace(5000, 10000, 51))")
+        self.session.run("f1 = f1_chantler('Cu', linspace(8000, 9500, 31))")
+        self.session.run("lines = xray_lines('Pb', initial_level='L3')")
+        self.session.run("xraydb_preload()")
+        self.session.run("mu2 = mu_elam('Fe', linspace(5000, 10000, 51))")
+        self.session.run("f2 = f1_chantler('Cu', linspace(8000, 9500, 31))")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("_xray._xraydb.snapshot is not None")
+        self.isTrue("all(mu1 == mu2)")
+        self.isTrue("all(f1 == f2)")
+        self.isTrue("xray_lines('Pb', initial_level='L3') == lines")
+        self.isTrue("xray_edge('Fe', 'K')[0] == 7112.0")
+
+    def test4_mu_tables(self):
+        self.session.run("en = linspace(2000, 30000, 201)")
+        self.session.run("mus = mu_elam_table(['O', 'Si', 26, 'Pb'], en)")
+        self.session.run("mats = material_mu_table(['H2O', 'quartz', 'Fe2O3'], en, density=[None, None, 5.24])")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("mus.shape == (4, 201)")
+        self.isTrue("mats.shape == (3, 201)")
+        self.isTrue("abs(mus[2] - mu_elam('Fe', en)) < 1.e-8")
+        self.isTrue("abs(mus[3] - mu_elam('Pb', en)) < 1.e-8")
+        self.isTrue("abs(mats[1] - material_mu('quartz', en)) < 1.e-8")
+        self.isTrue("abs(mats[2] - material_mu('Fe2O3', en, density=5.24)) < 1.e-8")
+
+    def test5_material_cache(self):
+        self.session.run("clear_material_cache()")
+        self.session.run("en = linspace(5000, 12000, 101)")
+        self.session.run("mu1 = material_mu('kapton', en)")
+        self.session.run("mu2 = material_mu('kapton', en)")
+        self.session.run("mu3 = material_mu('kapton', en + 1)")
+        self.session.run("stats = material_cache_stats()")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("mu1 == mu2")
+        self.isTrue("stats['material_mu']['hits'] == 1")
+        self.isTrue("stats['material_mu']['misses'] == 2")
+        self.isNear("material_mu('SiO2', 10000.0)", 41.81484, places=4)
+        self.isTrue("chemparse('Mn(SO4)2(H2O)7') == {'H': 14.0, 'S': 2.0, 'Mn': 1, 'O': 15.0}")
+        self.session.run("clear_material_cache()")
+        self.isTrue("material_cache_stats()['material_mu']['size'] == 0")
+
+    def test6_f0_table(self):
+        self.session.run("q = linspace(0, 1.5, 76)")
+        self.session.run("ftab = f0_table(['O', 'Fe', 'fe3+', 29, 'Cl1-'], q)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("ftab.shape == (5, 76)")
+        self.isTrue("ftab[0] == f0('O', q)")
+        self.isTrue("ftab[2] == f0('Fe3+', q)")
+        self.isTrue("ftab[3] == f0('Cu', q)")
+        self.isNear("ftab[1, 0]", 25.99, places=2)
+
+    def test7_chantler_cache(self):
+        self.session.run("en = linspace(8000, 9500, 31)")
+        self.session.run("f1a = f1_chantler('Cu', en)")
+        self.session.run("f1b = chantler_data('Cu', en, 'f1')")
+        self.session.run("mu = mu_chantler('Cu', en)")
+        self.session.run("db_arr = xray_delta_beta('Cu', 8.96, en)")
+        self.session.run("db_one = xray_delta_beta('Cu', 8.96, en[10])")
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("f1a == f1b")
+        self.isTrue("_xray._xraydb.chantler_cache.hits > 2")
+        self.isTrue("abs(mu_chantler_table(['Cu'], en)[0] - mu) < 1.e-8")
+        self.isTrue("abs(db_arr[0][10] - db_one[0]) < 1.e-12")
+        self.isTrue("abs(db_arr[1][10] - db_one[1]) < 1.e-12")
+        self.isNear("f1_chantler('Cu', 8979.0)", -8.893, places=2)
+        # the Cs table repeats energies at its N edges
+        self.session.run("db_csi = xray_delta_beta('CsI', 4.51, 10000.0)")
+        assert(len(self.session.get_errors()) == 0)
+        self.isNear("f1_chantler('Cs', 10000.0)", -0.12578, places=4)
+        self.isTrue("db_csi[0] > 0")
+
 
 if __name__ == '__main__':  # pragma: no cover
     for suite in (TestScripts,):